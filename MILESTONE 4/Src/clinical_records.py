@@ -0,0 +1,200 @@
+import json
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import orjson  # optional: several times faster than json for the export paths
+except ImportError:
+    orjson = None
+
+# ========================================
+# STEP 3c: COMPACT RESULT RECORDS (SLOTS + LAZY DICT / JSON)
+# ========================================
+#
+# process_patient's result used to live on as the nested dict the API returns:
+# patient_data, clinical_documentation, icd_coding, keyword evidence, metadata, two
+# result timestamps, repeated key strings in every level. Batches kept thousands of
+# them in AutomatedWorkflowPipeline.results.
+#
+# ClinicalRecord keeps the same information in __slots__ objects: codes, descriptions,
+# keywords, genders and scan results are interned (one string per distinct value in
+# the process), the keyword evidence is a slotted object, stage timings are a tuple of
+# pairs, and the processing time is one float from which both result timestamps are
+# formatted. to_dict() rebuilds exactly the dict process_patient has always returned.
+# to_json_bytes() encodes that dict too: one orjson call on a fresh dict was measured
+# about 3x faster than splicing JSON together from the slots in Python.
+
+intern = sys.intern
+
+_PATIENT_FIELDS = (
+    ("PatientName", "name"),
+    ("Age", "age"),
+    ("Gender", "gender"),
+    ("Symptoms", "symptoms"),
+    ("ScanResult", "scan_result"),
+    ("MedicalHistory", "medical_history"),
+    ("VitalSigns", "vital_signs"),
+    ("Timestamp", "timestamp"),
+    ("FileId", "file_id"),
+    ("ImagingFeatures", "imaging_features"),
+)
+_OPTIONAL_PATIENT_FIELDS = ("FileId", "ImagingFeatures")  # only present when the input had a file_id
+
+
+def _iso(timestamp: float) -> str:
+    """Same format as datetime.now().isoformat()"""
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class PatientRecord:
+    """prepare_patient_json output; gender and scan result repeat across patients and are interned"""
+
+    __slots__ = tuple(attribute for _, attribute in _PATIENT_FIELDS)
+
+    def __init__(self, patient_json: Dict):
+        self.name = patient_json.get("PatientName")
+        self.age = patient_json.get("Age")
+        self.gender = intern(patient_json.get("Gender", ""))
+        self.symptoms = patient_json.get("Symptoms")
+        self.scan_result = intern(patient_json.get("ScanResult", ""))
+        self.medical_history = intern(patient_json.get("MedicalHistory", ""))
+        self.vital_signs = patient_json.get("VitalSigns")
+        self.timestamp = patient_json.get("Timestamp")
+        self.file_id = patient_json.get("FileId")
+        self.imaging_features = patient_json.get("ImagingFeatures")
+
+    def to_dict(self) -> Dict:
+        patient = {}
+        for key, attribute in _PATIENT_FIELDS:
+            value = getattr(self, attribute)
+            if value is None and key in _OPTIONAL_PATIENT_FIELDS:
+                continue
+            patient[key] = value
+        return patient
+
+
+_EVIDENCE_FIELDS = ('matched_keywords', 'matches_count', 'exact_phrase_matches', 'total_keywords', 'confidence_score')
+
+
+class KeywordEvidence:
+    """icd_coding.evidence: the keyword matches behind the assigned code"""
+
+    __slots__ = _EVIDENCE_FIELDS
+
+    def __init__(self, detail: Dict):
+        self.matched_keywords = tuple(intern(k) for k in detail['matched_keywords'])
+        self.matches_count = detail['matches_count']
+        self.exact_phrase_matches = detail['exact_phrase_matches']
+        self.total_keywords = detail['total_keywords']
+        self.confidence_score = detail['confidence_score']
+
+    @classmethod
+    def from_reasoning(cls, detail: Dict) -> Union['KeywordEvidence', Dict]:
+        """Compact form of assign_codes_with_accuracy's reasoning; anything of another shape is kept as given"""
+        return cls(detail) if tuple(detail) == _EVIDENCE_FIELDS else detail
+
+    def to_dict(self) -> Dict:
+        return {
+            'matched_keywords': list(self.matched_keywords),
+            'matches_count': self.matches_count,
+            'exact_phrase_matches': self.exact_phrase_matches,
+            'total_keywords': self.total_keywords,
+            'confidence_score': self.confidence_score
+        }
+
+
+class ClinicalRecord:
+    """One processed patient; to_dict() is the process_patient result, to_json_bytes() its JSON"""
+
+    __slots__ = ('patient', 'note', 'icd_code', 'icd_description', 'confidence', 'evidence', 'model_version',
+                 'processed_at', 'stage_timings', 'note_source', 'route', 'generation', 'processing_time_ms')
+
+    def __init__(self, patient: PatientRecord, note: str, icd_code: str, icd_description: str, confidence: float,
+                 evidence: Union[KeywordEvidence, Dict], processed_at: float,
+                 stage_timings: Tuple[Tuple[str, float], ...] = (), note_source: str = 'model',
+                 route: Optional[Dict] = None, generation: Optional[Dict] = None,
+                 processing_time_ms: Optional[float] = None, model_version: str = "1.0"):
+        self.patient = patient
+        self.note = note
+        self.icd_code = intern(icd_code)
+        self.icd_description = intern(icd_description)
+        self.confidence = confidence
+        self.evidence = evidence
+        self.model_version = intern(model_version)
+        self.processed_at = processed_at  # epoch seconds; formatted for both timestamp and processed_at
+        self.stage_timings = stage_timings
+        self.note_source = intern(note_source)
+        self.route = route
+        self.generation = generation
+        self.processing_time_ms = processing_time_ms
+
+    @classmethod
+    def build(cls, patient_json: Dict, model_output: Dict, icd_description: str, processed_at: float,
+              stage_timings: Optional[Dict[str, float]] = None, **metadata) -> 'ClinicalRecord':
+        """From prepare_patient_json and parse_model_response outputs (what create_final_output combines)"""
+        evidence = KeywordEvidence.from_reasoning(model_output.get('reasoning', {}))
+        timings = tuple((intern(stage), ms) for stage, ms in (stage_timings or {}).items())
+        return cls(PatientRecord(patient_json), model_output.get('clinical_note', ''),
+                   model_output.get('icd10_code', ''), icd_description, model_output.get('confidence_score', 0.0),
+                   evidence, processed_at, timings, **metadata)
+
+    @property
+    def patient_id(self) -> str:
+        return self.patient.name if self.patient.name is not None else "Unknown"
+
+    def to_dict(self) -> Dict:
+        """The nested result dict process_patient returns (built fresh on every call)"""
+        processed_at = _iso(self.processed_at)
+        metadata = {
+            "model_version": self.model_version,
+            "processed_at": processed_at,
+            "stage_timings_ms": dict(self.stage_timings),
+            "note_source": self.note_source
+        }
+        if self.route is not None:
+            metadata["route"] = self.route
+        if self.generation is not None:
+            metadata["generation"] = self.generation
+        if self.processing_time_ms is not None:
+            metadata["processing_time_ms"] = self.processing_time_ms
+        return {
+            "patient_id": self.patient_id,
+            "timestamp": processed_at,
+            "patient_data": self.patient.to_dict(),
+            "clinical_documentation": {
+                "generated_note": self.note,
+                "icd_coding": {
+                    "code": self.icd_code,
+                    "description": self.icd_description,
+                    "confidence": self.confidence,
+                    "evidence": self.evidence.to_dict() if isinstance(self.evidence, KeywordEvidence) else self.evidence
+                }
+            },
+            "metadata": metadata
+        }
+
+    def to_json_bytes(self, indent: bool = False) -> bytes:
+        """JSON of to_dict(), via orjson when it is installed"""
+        return dumps(self.to_dict(), indent)
+
+
+def dumps(value, indent: bool = False) -> bytes:
+    """JSON bytes via orjson when installed, else json (default=str for anything unusual either way)"""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(value, default=str, option=option | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=str, indent=2 if indent else None).encode('utf-8')
+
+
+def as_dict(result: Union[ClinicalRecord, Dict]) -> Dict:
+    return result.to_dict() if isinstance(result, ClinicalRecord) else result
+
+
+def dumps_many(results: Iterable[Union[ClinicalRecord, Dict]], indent: bool = False) -> bytes:
+    """A JSON array of results (records or already-built dicts)"""
+    return dumps([as_dict(result) for result in results], indent)
+
+
+def to_dicts(results: Iterable[Union[ClinicalRecord, Dict]]) -> List[Dict]:
+    return [as_dict(result) for result in results]
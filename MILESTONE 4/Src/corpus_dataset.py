@@ -0,0 +1,341 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 1a: JOINED CORPUS DATASET (PARQUET, HIVE-PARTITIONED)
+# ========================================
+#
+# mapping.csv + note text + icd_lookup.csv, joined once into typed Parquet:
+#
+#   corpus_dataset/
+#     _corpus_manifest.json            <- per-row input signatures for incremental rebuilds
+#     icd10=UNKNOWN/part-0000.parquet  <- file_ids 0-4999 with that code
+#     icd10=UNKNOWN/part-0001.parquet  <- file_ids 5000-9999 ...
+#     icd10=J18.9/part-0000.parquet
+#
+# Filters on icd10 prune whole directories; other filters are pushed down to Parquet
+# row-group statistics. Codes and descriptions are dictionary-encoded. A rebuild
+# rewrites only the part files whose rows changed, taking the unchanged rows' note
+# text from the old part instead of reading those notes again.
+
+MILESTONE3_DATA = Path(__file__).resolve().parents[2] / "MILESTONE 3" / "Data"
+DEFAULT_MAPPING = MILESTONE3_DATA / "mapping.csv"
+DEFAULT_ICD_LOOKUP = MILESTONE3_DATA / "icd_lookup.csv"
+DEFAULT_NOTES_DIR = MILESTONE3_DATA / "EHR_Processed_Notes"
+
+UNKNOWN_CODE = "UNKNOWN"
+BUCKET_SIZE = 5000  # file_ids per part file; small enough to rewrite, large enough to keep sparse codes in few files
+MANIFEST_NAME = "_corpus_manifest.json"  # leading underscore: ignored by dataset discovery
+MANIFEST_VERSION = 1
+
+_AGE = re.compile(r"\b(\d{1,3})[- ]year[- ]old\b", re.IGNORECASE)
+_GENDER = re.compile(r"\b(female|woman|girl|male|man|boy)\b", re.IGNORECASE)
+_COMPLAINT = re.compile(r"(?:presents? with|complaints? of|chief complaint:?)\s*(?:(?:a |an )?complaints? of\s*)?"
+                        r"([^.\n]{3,160})", re.IGNORECASE)
+
+
+def corpus_schema():
+    import pyarrow as pa
+
+    codes = pa.dictionary(pa.int16(), pa.string())
+    return pa.schema([
+        ("file_id", pa.int32()),
+        ("image_path", pa.string()),
+        ("note_path", pa.string()),
+        ("note_text", pa.large_string()),
+        ("note_chars", pa.int32()),
+        ("has_note", pa.bool_()),
+        ("has_image", pa.bool_()),
+        ("diagnosis", codes),
+        ("icd10_description", codes),
+        ("condition_keyword", codes),
+    ])
+
+
+def coded_filter():
+    """Rows with a known ICD-10 label (icd10 != UNKNOWN); prunes the UNKNOWN partition entirely"""
+    import pyarrow.dataset as ds
+    return ds.field("icd10") != UNKNOWN_CODE
+
+
+def _locate(relative: str, root: str, fallback_dir: Optional[str],
+            seen: Dict[str, Optional[List[int]]]) -> Tuple[Optional[str], Optional[List[int]]]:
+    """
+    (path, [mtime_ns, size]) of a mapping.csv path, relative to root or by file name in fallback_dir.
+
+    One os.stat per distinct path (many rows share a note); pathlib is avoided because
+    this runs for every row of every rebuild.
+    """
+    if not relative:
+        return None, None
+    candidates = [os.path.join(root, relative)]
+    if fallback_dir:
+        candidates.append(os.path.join(fallback_dir, os.path.basename(relative)))
+    for candidate in candidates:
+        if candidate not in seen:
+            try:
+                stat = os.stat(candidate)
+                seen[candidate] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                seen[candidate] = None
+        if seen[candidate] is not None:
+            return candidate, seen[candidate]
+    return None, None
+
+
+def read_icd_lookup(path=DEFAULT_ICD_LOOKUP) -> Dict[str, Tuple[str, str]]:
+    """icd10_code -> (condition_keyword, icd10_description)"""
+    with open(path, newline="") as f:
+        return {row["icd10_code"].strip(): (row["condition_keyword"].strip(), row["icd10_description"].strip())
+                for row in csv.DictReader(f)}
+
+
+def build_dataset(output_dir="corpus_dataset", mapping_csv=DEFAULT_MAPPING, icd_lookup_csv=DEFAULT_ICD_LOOKUP,
+                  data_root=None, notes_dir=DEFAULT_NOTES_DIR, bucket_size: int = BUCKET_SIZE) -> Dict:
+    """
+    Join mapping.csv, the note files and icd_lookup.csv into output_dir, rewriting only changed parts.
+
+    Args:
+        data_root: Directory mapping.csv paths are relative to (default: the mapping file's parent's parent)
+        notes_dir: Second place to look for a note, by file name (the repo keeps notes flat in Data/)
+
+    Returns:
+        Row counts and how many part files were written or deleted
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_dir = Path(output_dir)
+    mapping_csv = Path(mapping_csv)
+    root = str(data_root) if data_root else str(mapping_csv.parent.parent)
+    notes_dir = str(notes_dir) if notes_dir else None
+    lookup = read_icd_lookup(icd_lookup_csv)
+    lookup_signature = hashlib.sha1(Path(icd_lookup_csv).read_bytes()).hexdigest()
+
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    settings = {"version": MANIFEST_VERSION, "bucket_size": bucket_size}
+    if not manifest and output_dir.is_dir() and any(output_dir.iterdir()):
+        # Only a directory this function built (it has a manifest) is ever wiped
+        raise FileExistsError(f"{output_dir} is not empty and is not a corpus dataset; choose another --output")
+    if manifest and manifest.get("settings") != settings:
+        logger.info("Corpus layout changed; rebuilding every part file")
+        shutil.rmtree(output_dir)
+        manifest = {}
+    previous: Dict[str, List] = manifest.get("rows", {})
+
+    # ---------------- signatures: what changed since the last build ----------------
+    rows: Dict[str, Dict] = {}
+    seen: Dict[str, Optional[List[int]]] = {}
+    with open(mapping_csv, newline="") as f:
+        for raw in csv.DictReader(f):
+            file_id = int(raw["file_id"])
+            note, note_stat = _locate(raw.get("note_path", ""), root, notes_dir, seen)
+            image, _ = _locate(raw.get("image_path", ""), root, None, seen)
+            code = (raw.get("icd10") or "").strip() or UNKNOWN_CODE
+            signature = hashlib.sha1(repr(
+                (sorted(raw.items()), note_stat, image is not None, lookup_signature)
+            ).encode("utf-8")).hexdigest()
+            rows[str(file_id)] = {"file_id": file_id, "raw": raw, "note": note, "has_image": image is not None,
+                                  "code": code, "unit": f"{code}/{file_id // bucket_size}", "signature": signature}
+
+    dirty = set()
+    changed = 0
+    for key, row in rows.items():
+        old = previous.get(key)
+        if old is None or old[1] != row["signature"]:
+            changed += 1
+            dirty.add(row["unit"])
+            if old is not None:
+                dirty.add(old[0])
+        elif old[0] != row["unit"]:
+            dirty.update((old[0], row["unit"]))
+    removed = [key for key in previous if key not in rows]
+    dirty.update(previous[key][0] for key in removed)
+
+    # ---------------- rewrite dirty part files ----------------
+    members: Dict[str, List[Dict]] = {}
+    for row in rows.values():
+        if row["unit"] in dirty:
+            members.setdefault(row["unit"], []).append(row)
+
+    note_texts: Dict[str, str] = {}
+
+    def read_note(path: Optional[str]) -> Optional[str]:
+        if path is None:
+            return None
+        if path not in note_texts:  # rows may share a note file
+            with open(path, encoding="utf-8", errors="ignore") as note:
+                note_texts[path] = note.read()
+        return note_texts[path]
+
+    schema = corpus_schema()
+    written = deleted = 0
+    for unit in sorted(dirty):
+        code, bucket = unit.rsplit("/", 1)
+        part = output_dir / f"icd10={quote(code, safe='')}" / f"part-{int(bucket):04d}.parquet"
+        unit_rows = sorted(members.get(unit, []), key=lambda r: r["file_id"])
+        if not unit_rows:
+            if part.exists():
+                part.unlink()
+                deleted += 1
+            if part.parent.exists() and not any(part.parent.iterdir()):
+                part.parent.rmdir()
+            continue
+
+        kept: Dict[int, Optional[str]] = {}
+        if part.exists():
+            unchanged = {r["file_id"] for r in unit_rows
+                         if previous.get(str(r["file_id"]), (None, None))[1] == r["signature"]}
+            if unchanged:
+                old = pq.read_table(part, columns=["file_id", "note_text"])
+                kept = {file_id: text for file_id, text in zip(old.column("file_id").to_pylist(),
+                                                               old.column("note_text").to_pylist())
+                        if file_id in unchanged}
+        texts = [kept[r["file_id"]] if r["file_id"] in kept else read_note(r["note"]) for r in unit_rows]
+        keyword, description = lookup.get(code, (None, None))
+        table = pa.table({
+            "file_id": pa.array([r["file_id"] for r in unit_rows], pa.int32()),
+            "image_path": pa.array([r["raw"].get("image_path") or None for r in unit_rows], pa.string()),
+            "note_path": pa.array([r["raw"].get("note_path") or None for r in unit_rows], pa.string()),
+            "note_text": pa.array(texts, pa.large_string()),
+            "note_chars": pa.array([len(t) if t is not None else None for t in texts], pa.int32()),
+            "has_note": pa.array([t is not None for t in texts], pa.bool_()),
+            "has_image": pa.array([r["has_image"] for r in unit_rows], pa.bool_()),
+            "diagnosis": pa.array([(r["raw"].get("diagnosis") or "").strip() or None for r in unit_rows],
+                                  pa.string()).dictionary_encode().cast(schema.field("diagnosis").type),
+            "icd10_description": pa.array([description] * len(unit_rows), pa.string())
+                                   .dictionary_encode().cast(schema.field("icd10_description").type),
+            "condition_keyword": pa.array([keyword] * len(unit_rows), pa.string())
+                                   .dictionary_encode().cast(schema.field("condition_keyword").type),
+        }, schema=schema)
+
+        part.parent.mkdir(parents=True, exist_ok=True)
+        tmp = part.with_name("." + part.name + ".tmp")  # dot prefix: invisible to readers until renamed
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, part)
+        written += 1
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {"settings": settings, "rows": {key: [r["unit"], r["signature"]] for key, r in rows.items()}}
+    tmp = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, manifest_path)
+
+    stats = {"rows": len(rows), "changed": changed, "removed": len(removed),
+             "parts_written": written, "parts_deleted": deleted}
+    logger.info(f"📚 Corpus dataset {output_dir}: {stats}")
+    return stats
+
+
+def note_to_patient(row: Dict) -> Dict:
+    """Patient payload for the pipeline from one corpus row; age, gender and complaint are read from the note"""
+    text = row.get("note_text") or ""
+    age = _AGE.search(text)
+    gender = _GENDER.search(text)
+    complaint = _COMPLAINT.search(text)
+    symptoms = complaint.group(1).strip(" ,:;") if complaint else (row.get("diagnosis") or "General checkup")
+    image_path = row.get("image_path")
+    return {
+        "name": f"Patient_{row['file_id']}",
+        "age": int(age.group(1)) if age else 0,
+        "gender": ("Female" if gender.group(1).lower() in ("female", "woman", "girl") else "Male") if gender
+                  else "Not specified",
+        "symptoms": symptoms,
+        "scan_result": f"Scan on file: {Path(image_path).name}" if image_path else "No imaging performed",
+        "medical_history": "See referenced note",
+        "file_id": str(row["file_id"]),
+        "note_text": row.get("note_text")  # the full note goes through long_note_summarizer.py
+    }
+
+
+class CorpusDataset:
+    """Read side of the corpus: filtered scans, zero-copy DataFrames and pipeline input"""
+
+    def __init__(self, path="corpus_dataset", filter=None):
+        import pyarrow.dataset as ds
+
+        self.path = Path(path)
+        self.dataset = ds.dataset(self.path, format="parquet",
+                                  partitioning=ds.HivePartitioning.discover(infer_dictionary=True))
+        self.filter_expression = filter
+
+    def filter(self, expression) -> 'CorpusDataset':
+        """A view that also applies expression (a pyarrow.dataset expression, e.g. coded_filter())"""
+        view = CorpusDataset.__new__(CorpusDataset)
+        view.path, view.dataset = self.path, self.dataset
+        view.filter_expression = expression if self.filter_expression is None else self.filter_expression & expression
+        return view
+
+    def count(self) -> int:
+        return self.dataset.count_rows(filter=self.filter_expression)
+
+    def table(self, columns: Optional[List[str]] = None):
+        return self.dataset.to_table(columns=columns, filter=self.filter_expression)
+
+    def to_pandas(self, columns: Optional[List[str]] = None):
+        """DataFrame backed by the Arrow buffers (pd.ArrowDtype columns), so nothing is copied"""
+        import pandas as pd
+        return self.table(columns).to_pandas(types_mapper=pd.ArrowDtype)
+
+    def iter_rows(self, columns: Optional[List[str]] = None, batch_size: int = 256) -> Iterator[Dict]:
+        for batch in self.dataset.to_batches(columns=columns, filter=self.filter_expression, batch_size=batch_size):
+            yield from batch.to_pylist()
+
+    def iter_patients(self, batch_size: int = 256) -> Iterator[Dict]:
+        columns = ["file_id", "note_text", "diagnosis", "image_path"]
+        for row in self.iter_rows(columns, batch_size):
+            yield note_to_patient(row)
+
+    def reference_notes(self) -> Tuple[List[int], List[str]]:
+        """(file_ids, note texts) of rows that have a note, ordered by file_id"""
+        import pyarrow.dataset as ds
+
+        expression = ds.field("has_note")
+        if self.filter_expression is not None:
+            expression = self.filter_expression & expression
+        table = self.dataset.to_table(columns=["file_id", "note_text"], filter=expression).sort_by("file_id")
+        return table.column("file_id").to_pylist(), table.column("note_text").to_pylist()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Joined corpus dataset from mapping.csv, notes and icd_lookup.csv")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Create or incrementally update the dataset")
+    build.add_argument("--output", default="corpus_dataset", help="Dataset directory")
+    build.add_argument("--mapping", default=str(DEFAULT_MAPPING))
+    build.add_argument("--icd-lookup", default=str(DEFAULT_ICD_LOOKUP))
+    build.add_argument("--data-root", default=None, help="Directory mapping.csv paths are relative to")
+    build.add_argument("--notes-dir", default=str(DEFAULT_NOTES_DIR), help="Flat folder of note_*.txt files")
+    info = subparsers.add_parser("info", help="Row counts per ICD-10 code")
+    info.add_argument("--path", default="corpus_dataset", help="Dataset directory")
+    info.add_argument("--coded-only", action="store_true", help="Skip rows labelled UNKNOWN")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = build_dataset(args.output, args.mapping, args.icd_lookup, args.data_root, args.notes_dir)
+        print(json.dumps({**stats, "seconds": round(time.perf_counter() - start, 2)}, indent=2))
+    elif args.command == "info":
+        corpus = CorpusDataset(args.path)
+        if args.coded_only:
+            corpus = corpus.filter(coded_filter())
+        counts = corpus.table(["icd10", "has_note", "has_image"]).group_by("icd10").aggregate(
+            [("icd10", "count"), ("has_note", "sum"), ("has_image", "sum")])
+        for row in sorted(counts.to_pylist(), key=lambda r: -r["icd10_count"]):
+            print(f"{str(row['icd10']):<12}{row['icd10_count']:>8} rows{row['has_note_sum']:>8} notes"
+                  f"{row['has_image_sum']:>8} images")
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 from datetime import datetime
 
 # ========================================
@@ -8,12 +8,13 @@ from datetime import datetime
 class DataPreparationPipeline:
     """Prepare and format patient data for model input"""
 
-    def __init__(self):
+    def __init__(self, image_features: Optional['ImageFeatureCache'] = None):
         self.prepared_data = []
+        self.image_features = image_features
 
     def prepare_patient_json(self, patient_data: Dict) -> Dict:
         """Convert raw patient data to structured JSON format"""
-        return {
+        patient_json = {
             "PatientName": str(patient_data.get('name', 'Unknown')),
             "Age": int(patient_data.get('age', 0)),
             "Gender": str(patient_data.get('gender', 'Not specified')),
@@ -24,12 +25,26 @@ class DataPreparationPipeline:
             "Timestamp": datetime.now().isoformat()
         }
 
+        # Patients linked to a mapping.csv file_id (corpus_dataset.py rows, or a file_id sent to the API)
+        file_id = patient_data.get('file_id')
+        if file_id is not None:
+            patient_json["FileId"] = str(file_id)
+            # Precomputed scan features (image_feature_cache.py)
+            signals = self.image_features.signals(file_id) if self.image_features is not None else None
+            if signals is not None:
+                patient_json["ImagingFeatures"] = signals
+        return patient_json
+
     def format_for_model(self, patient_json: Dict) -> str:
         """Format patient data as prompt for LLM"""
         symptoms = patient_json.get('Symptoms', 'General checkup')
         age = patient_json.get('Age', 'Unknown')
         gender = patient_json.get('Gender', 'Unknown')
         scan = patient_json.get('ScanResult', 'No imaging')
+        imaging_features = patient_json.get('ImagingFeatures')
+        if imaging_features:
+            from image_feature_cache import describe_signals
+            scan += f"\nImage features: {describe_signals(imaging_features)}"
 
         prompt = f"""Generate a brief clinical note. Do NOT repeat information.
 
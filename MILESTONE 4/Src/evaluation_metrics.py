@@ -1,10 +1,28 @@
+import sys
+from typing import TYPE_CHECKING, Dict, Optional
+from datetime import datetime
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class EvaluationMetrics:
     """Calculate evaluation metrics and validation"""
 
     @staticmethod
-    def calculate_metrics(results_df: pd.DataFrame, icd_assigner: 'ICD10CodeAssigner') -> Dict:
+    def calculate_metrics(results_df: 'pd.DataFrame', icd_assigner: 'ICD10CodeAssigner',
+                          text_scorer: Optional['TextQualityScorer'] = None) -> Dict:
         """Calculate comprehensive metrics including quality scores"""
+        import pandas as pd
+
+        # Score generated notes against the reference notes when no scores were supplied;
+        # each row is paired with its own file_id's note, and rows without one stay unscored
+        corpus_bleu = unmatched = None
+        if text_scorer is not None and 'BLEUScore' not in results_df:
+            by_file_id = bool(text_scorer.reference_file_ids)
+            results_df = text_scorer.score_dataframe(results_df, file_id_column='FileId' if by_file_id else None)
+            corpus_bleu = results_df.attrs.get('corpus_bleu')
+            unmatched = results_df.attrs.get('unmatched')
 
         # ICD-10 code distribution
         code_dist = {}
@@ -36,7 +54,8 @@ class EvaluationMetrics:
             'processing_timestamp': datetime.now().isoformat(),
             'model_used': 'Google FLAN-T5 Base (Hugging Face)',
             'framework': 'PyTorch',
-            'device': 'GPU' if torch.cuda.is_available() else 'CPU',
+            # Only a loaded model can be on the GPU; don't import torch just to ask
+            'device': 'GPU' if 'torch' in sys.modules and sys.modules['torch'].cuda.is_available() else 'CPU',
             'accuracy_metrics': {
                 'average_accuracy': float(round(accuracies.mean(), 2)),
                 'min_accuracy': float(round(accuracies.min(), 2)),
@@ -63,4 +82,14 @@ class EvaluationMetrics:
             }
         }
 
+        if 'RougeL' in results_df:
+            rouge_l = pd.to_numeric(results_df['RougeL'], errors='coerce')
+            metrics['text_quality_metrics']['average_rouge_l'] = float(round(rouge_l.mean(), 4))
+            metrics['text_quality_metrics']['median_rouge_l'] = float(round(rouge_l.median(), 4))
+        if corpus_bleu is not None:
+            metrics['text_quality_metrics']['corpus_bleu_score'] = float(corpus_bleu)
+        if unmatched is not None:
+            metrics['text_quality_metrics']['scored_notes'] = int(len(results_df) - unmatched)
+            metrics['text_quality_metrics']['unmatched_notes'] = int(unmatched)
+
         return metrics
\ No newline at end of file
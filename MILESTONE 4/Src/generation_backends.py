@@ -0,0 +1,243 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from hf_model_connector import HuggingFaceModelConnector, TemplateModelConnector
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 2e: GENERATION BACKENDS (REGISTRY + RECORD / REPLAY)
+# ========================================
+#
+# A backend is any HuggingFaceModelConnector: generate_clinical_output(prompt) for one
+# note, generate_batch(prompts) for several, summarize_batch(prompts) for short outputs
+# in one batched call (long-note chunks), get_model_info(), and a `generator` that is
+# None when every note comes from the template. AutomatedWorkflowPipeline builds its
+# backend from EHR_MODEL_BACKEND through this registry:
+#
+#   hf        FLAN-T5 on PyTorch (or an offline snapshot, EHR_MODEL_SNAPSHOT)
+#   template  no model; every note is written by the pipeline's template
+#   stub      deterministic offline generator (EHR_STUB_LATENCY_MS)
+#   record    wraps EHR_RECORD_BACKEND (default hf) and appends each output and its
+#             generation time to EHR_RECORDING
+#   replay    serves the outputs in EHR_RECORDING and sleeps for their recorded latency
+#             (times EHR_REPLAY_SPEED), so benchmarks and load tests see production timing
+#             without a model
+#
+# Recordings are JSON lines keyed by the SHA-1 of the prompt; the prompt itself is not
+# stored. Prompts that were never recorded (new synthetic patients in a load test) get
+# a recorded generation chosen by their hash with EHR_REPLAY_MISS=cycle (the default).
+# With EHR_REPLAY_MISS=template they get no output, so the pipeline falls back.
+
+DEFAULT_RECORDING = "generation_recording.jsonl"
+
+BACKENDS: Dict[str, Callable[[], HuggingFaceModelConnector]] = {}
+
+
+def register_backend(name: str, factory: Callable[[], HuggingFaceModelConnector]) -> None:
+    """Make a backend selectable by name (EHR_MODEL_BACKEND); factories read their options from the environment"""
+    BACKENDS[name.lower()] = factory
+
+
+def available_backends() -> List[str]:
+    return sorted(BACKENDS)
+
+
+def create_backend(name: Optional[str] = None) -> HuggingFaceModelConnector:
+    """Build the named backend, or the one selected by EHR_MODEL_BACKEND (default hf)"""
+    name = (name or os.environ.get("EHR_MODEL_BACKEND") or "hf").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown generation backend '{name}' (available: {', '.join(available_backends())})")
+    return BACKENDS[name]()
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+
+
+def load_recording(path: str) -> List[Dict]:
+    """Records of a recording file, oldest first"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------- record ----------------
+class RecordingModelConnector(HuggingFaceModelConnector):
+    """Passes generations through to another backend and appends each output and its latency to a recording"""
+
+    def __init__(self, inner: HuggingFaceModelConnector, path: str = DEFAULT_RECORDING):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        super().__init__()
+
+    @classmethod
+    def from_env(cls) -> 'RecordingModelConnector':
+        inner_name = os.environ.get("EHR_RECORD_BACKEND", "hf").lower()
+        if inner_name in ("record", "replay"):
+            raise ValueError(f"EHR_RECORD_BACKEND cannot be '{inner_name}'")
+        return cls(create_backend(inner_name), os.environ.get("EHR_RECORDING", DEFAULT_RECORDING))
+
+    def initialize_models(self):
+        self.generator = self.inner.generator
+        self.model_type = self.inner.model_type
+        logger.info(f"⏺️ Recording {self.model_type} generations to {self.path}")
+
+    def last_generation(self) -> Optional[Dict]:
+        return self.inner.last_generation()
+
+    def _append(self, prompts: List[str], outputs: List[Optional[str]], latency_ms: float,
+                generation: Optional[Dict]) -> None:
+        recorded_at = datetime.now().isoformat()
+        lines = [json.dumps({
+            'key': prompt_key(prompt),
+            'output': output,
+            'latency_ms': round(latency_ms, 3),
+            'model': self.model_type,
+            'generation': generation,
+            'recorded_at': recorded_at
+        }) + "\n" for prompt, output in zip(prompts, outputs)]
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    def generate_clinical_output(self, prompt: str) -> Optional[str]:
+        start = time.perf_counter()
+        output = self.inner.generate_clinical_output(prompt)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self._append([prompt], [output], latency_ms, self.inner.last_generation())
+        return output
+
+    def summarize_batch(self, prompts: List[str], max_length: int = 80) -> List[Optional[str]]:
+        start = time.perf_counter()
+        outputs = self.inner.summarize_batch(prompts, max_length)
+        # One call for the whole batch: each prompt is recorded with an equal share of its latency
+        latency_ms = (time.perf_counter() - start) * 1000.0 / max(len(prompts), 1)
+        self._append(prompts, outputs, latency_ms, None)
+        return outputs
+
+    def get_model_info(self) -> Dict:
+        return {**self.inner.get_model_info(), "recording": self.path}
+
+
+# ---------------- replay ----------------
+class ReplayModelConnector(HuggingFaceModelConnector):
+    """Serves recorded generations with their recorded latency; no model is loaded"""
+
+    def __init__(self, path: str = DEFAULT_RECORDING, speed: float = 1.0, on_miss: str = "cycle"):
+        if on_miss not in ("cycle", "template"):
+            raise ValueError(f"on_miss must be 'cycle' or 'template', not '{on_miss}'")
+        self.path = path
+        self.speed = speed  # latency multiplier; 0 replays without sleeping
+        self.on_miss = on_miss
+        self.hits = self.misses = 0
+        super().__init__()
+
+    @classmethod
+    def from_env(cls) -> 'ReplayModelConnector':
+        return cls(os.environ.get("EHR_RECORDING", DEFAULT_RECORDING),
+                   speed=float(os.environ.get("EHR_REPLAY_SPEED", "1.0")),
+                   on_miss=os.environ.get("EHR_REPLAY_MISS", "cycle").lower())
+
+    def initialize_models(self):
+        self.records = load_recording(self.path)
+        if not self.records:
+            raise ValueError(f"Recording {self.path} is empty")
+        self.by_key = {record['key']: record for record in self.records}  # the latest recording of a prompt wins
+        self.generator = self.records  # non-None: the pipeline treats this backend as a model
+        models = sorted({record.get('model') or 'unknown' for record in self.records})
+        self.model_type = f"Replay of {', '.join(models)}"
+        logger.info(f"⏯️ {self.model_type}: {len(self.records)} recorded generations from {self.path}")
+
+    def lookup(self, prompt: str) -> Optional[Dict]:
+        key = prompt_key(prompt)
+        record = self.by_key.get(key)
+        if record is not None:
+            self.hits += 1
+            return record
+        self.misses += 1
+        if self.on_miss == "template":
+            return None
+        return self.records[int(key[:12], 16) % len(self.records)]
+
+    def generate_clinical_output(self, prompt: str) -> Optional[str]:
+        record = self.lookup(prompt)
+        self._generation.summary = record.get('generation') if record else None
+        if record is None:
+            return None
+        if self.speed:
+            time.sleep(record['latency_ms'] * self.speed / 1000.0)
+        return record['output']
+
+    def summarize_batch(self, prompts: List[str], max_length: int = 80) -> List[Optional[str]]:
+        records = [self.lookup(prompt) for prompt in prompts]
+        if self.speed:
+            time.sleep(sum(record['latency_ms'] for record in records if record) * self.speed / 1000.0)
+        return [record['output'] if record else None for record in records]
+
+    def get_model_info(self) -> Dict:
+        return {
+            "model_name": self.model_type,
+            "device": "CPU",
+            "framework": "None",
+            "source": f"Recording {self.path}",
+            "replay": {"records": len(self.records), "hits": self.hits, "misses": self.misses, "speed": self.speed}
+        }
+
+
+def _stub_backend() -> HuggingFaceModelConnector:
+    from stub_model_connector import StubModelConnector
+    return StubModelConnector(latency_ms=float(os.environ.get("EHR_STUB_LATENCY_MS", "0")))
+
+
+register_backend("hf", HuggingFaceModelConnector)
+register_backend("template", TemplateModelConnector)
+register_backend("stub", _stub_backend)
+register_backend("record", RecordingModelConnector.from_env)
+register_backend("replay", ReplayModelConnector.from_env)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Record generations from a backend, or summarize a recording")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record = subparsers.add_parser("record", help="Run patients through a backend and record every generation")
+    record.add_argument("--input", required=True, help="Patients as a JSON list or JSON lines")
+    record.add_argument("--backend", default="hf", choices=[b for b in available_backends() if b not in ("record", "replay")])
+    record.add_argument("--output", default=DEFAULT_RECORDING, help="Recording file (appended to)")
+    info = subparsers.add_parser("info", help="Generations, latency percentiles and aborts in a recording")
+    info.add_argument("recording", nargs="?", default=DEFAULT_RECORDING)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from data_preparation import DataPreparationPipeline
+        from shard_queue import load_patients
+
+        preparer = DataPreparationPipeline()
+        prompts = [preparer.format_for_model(preparer.prepare_patient_json(p)) for p in load_patients(args.input)]
+        connector = RecordingModelConnector(create_backend(args.backend), args.output)
+        outputs = connector.generate_batch(prompts)
+        print(f"⏺️ Recorded {len(outputs)} generations ({sum(o is None for o in outputs)} without output) to {args.output}")
+    else:
+        records = load_recording(args.recording)
+        latencies = sorted(r['latency_ms'] for r in records)
+        aborted = sum(1 for r in records if (r.get('generation') or {}).get('aborted'))
+        print(json.dumps({
+            'generations': len(records),
+            'distinct_prompts': len({r['key'] for r in records}),
+            'models': sorted({r.get('model') or 'unknown' for r in records}),
+            'without_output': sum(r['output'] is None for r in records),
+            'aborted': aborted,
+            'latency_ms': {
+                'p50': latencies[len(latencies) // 2] if latencies else None,
+                'p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+                'max': latencies[-1] if latencies else None
+            }
+        }, indent=2))
@@ -1,10 +1,26 @@
 import logging
-import torch
-from typing import Dict
-from transformers import pipeline
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from telemetry import GENERATION_ABORTS
+from text_analysis import analyze, jaccard
+
+if TYPE_CHECKING:
+    from repetition_guard import RepetitionGuard
 
 logger = logging.getLogger(__name__)
 
+MODEL_LABELS = {
+    "google/flan-t5-large": "Google FLAN-T5 Large",
+    "google/flan-t5-base": "Google FLAN-T5 Base"
+}
+
+
+def _device_name() -> str:
+    import torch
+    return "GPU" if torch.cuda.is_available() else "CPU"
+
 # ========================================
 # STEP 2: CONNECT TO HUGGING FACE MODEL
 # ========================================
@@ -15,10 +31,20 @@ class HuggingFaceModelConnector:
     def __init__(self):
         self.model_type = None
         self.generator = None
+        self._generation = threading.local()  # per-thread summary of the last generate call
         self.initialize_models()
 
     def initialize_models(self):
         """Initialize Hugging Face models for clinical text generation"""
+        # torch/transformers cost seconds and hundreds of MB; only pay for them when a model is wanted
+        import torch
+        from transformers import pipeline
+
+        # An offline snapshot (model_snapshot.py) skips the hub entirely and maps the weights lazily
+        snapshot = os.environ.get("EHR_MODEL_SNAPSHOT")
+        if snapshot and self._load_snapshot(snapshot):
+            return
+
         try:
             logger.info("🤖 Loading Hugging Face medical models...")
             logger.info("⏳ This may take 2-3 minutes on first run (models are cached)")
@@ -34,7 +60,7 @@ class HuggingFaceModelConnector:
 
             self.model_type = "Google FLAN-T5 Large"
             logger.info(f"✅ {self.model_type} loaded successfully!")
-            logger.info(f"   Running on: {'GPU' if torch.cuda.is_available() else 'CPU'}")
+            logger.info(f"   Running on: {_device_name()}")
 
         except Exception as e:
             logger.warning(f"Could not load FLAN-T5 Large: {e}. Trying base model...")
@@ -52,10 +78,51 @@ class HuggingFaceModelConnector:
                 self.model_type = "Rule-Based Template"
                 self.generator = None
 
+    def _load_snapshot(self, location: str) -> bool:
+        """Load google/flan-t5-large from a local snapshot; False (and a warning) if that fails"""
+        from model_snapshot import SnapshotGenerator, load_snapshot
+
+        try:
+            model, tokenizer, manifest = load_snapshot(location, "google/flan-t5-large",
+                                                       check_hashes=os.environ.get("EHR_MODEL_SNAPSHOT_VERIFY") == "1")
+        except Exception as e:
+            logger.warning(f"Could not load model snapshot from {location}: {e}. Trying the hub...")
+            return False
+
+        if _device_name() == "GPU":
+            model = model.to("cuda")
+        self.generator = SnapshotGenerator(model, tokenizer)
+        self.model_type = f"{MODEL_LABELS.get(manifest['model'], manifest['model'])} (snapshot {manifest['version']})"
+        logger.info(f"✅ {self.model_type} loaded successfully!")
+        logger.info(f"   Running on: {_device_name()}")
+        return True
+
+    def _repetition_guard(self) -> Optional['RepetitionGuard']:
+        """
+        A fresh RepetitionGuard for generators that expose their tokenizer.
+        With EHR_REPETITION_GUARD=off it only counts decoder steps.
+        """
+        tokenizer = getattr(self.generator, 'tokenizer', None)
+        if tokenizer is None:
+            return None
+        from repetition_guard import RepetitionGuard
+        enabled = os.environ.get("EHR_REPETITION_GUARD", "on").lower() not in ("0", "off", "false", "no")
+        return RepetitionGuard(tokenizer, enabled=enabled)
+
+    def last_generation(self) -> Optional[Dict]:
+        """Decoder steps and abort status of this thread's last generate call (None without a guard)"""
+        return getattr(self._generation, 'summary', None)
+
     def generate_clinical_output(self, prompt: str) -> str:
         """Generate clinical note using Hugging Face model"""
         if self.generator:
+            guard = self._repetition_guard()
+            self._generation.summary = None
             try:
+                generate_kwargs = {}
+                if guard is not None:
+                    from transformers import StoppingCriteriaList
+                    generate_kwargs['stopping_criteria'] = StoppingCriteriaList([guard])
                 result = self.generator(
                     prompt,
                     max_length=250,
@@ -64,8 +131,16 @@ class HuggingFaceModelConnector:
                     num_beams=5,
                     early_stopping=True,
                     no_repeat_ngram_size=3,
-                    length_penalty=1.5
+                    length_penalty=1.5,
+                    **generate_kwargs
                 )
+                if guard is not None:
+                    self._generation.summary = guard.summary()
+                    if guard.aborted:
+                        # Degenerate output: let the caller fall back now rather than clean it up
+                        GENERATION_ABORTS.inc(reason=guard.reason)
+                        logger.info(f"✂️ Generation stopped after {guard.steps} steps (repeating {guard.reason})")
+                        return None
                 generated_text = result[0]['generated_text'].strip()
 
                 # Clean up any remaining repetitions
@@ -77,67 +152,103 @@ class HuggingFaceModelConnector:
 
         return None
 
+    def generate_batch(self, prompts: List[str]) -> List[Optional[str]]:
+        """One note (or None) per prompt; each prompt gets its own repetition guard and cleanup"""
+        return [self.generate_clinical_output(prompt) for prompt in prompts]
+
+    def summarize_batch(self, prompts: List[str], max_length: int = 80) -> List[Optional[str]]:
+        """
+        Short outputs for several prompts in one batched generator call (long_note_summarizer.py chunks).
+        No repetition guard: it would stop the whole batch for one degenerate row.
+        """
+        if not self.generator or not prompts:
+            return [None] * len(prompts)
+        try:
+            results = self.generator(
+                prompts,
+                max_length=max_length,
+                do_sample=False,
+                num_beams=2,
+                no_repeat_ngram_size=3,
+                batch_size=len(prompts)
+            )
+        except Exception as e:
+            logger.warning(f"Batched summarization failed: {e}")
+            return [None] * len(prompts)
+        outputs = []
+        for result in results:
+            if isinstance(result, list):  # some pipeline versions nest each input's outputs
+                result = result[0]
+            outputs.append(result['generated_text'].strip() or None)
+        return outputs
+
     def _aggressive_remove_repetitions(self, text: str) -> str:
         """Aggressively remove all types of repetitions"""
-        # Split by periods
-        sentences = [s.strip() for s in text.split('.') if s.strip()]
+        # Sentences, their lowercase forms and token sets come from one analysis of the text
+        analysis = analyze(text)
+        sentences = analysis.sentences
 
         if not sentences:
             return text
 
         # Remove exact duplicates first
         seen = []
-        for sent in sentences:
-            if sent not in seen:
-                seen.append(sent)
+        firsts = set()
+        for index, sent in enumerate(sentences):
+            if sent not in firsts:
+                firsts.add(sent)
+                seen.append(index)
 
         # Remove sentences that are substrings of other sentences
+        lowers = analysis.sentence_lowers
         filtered = []
-        for sentence in seen:
+        for index in seen:
             is_substring = False
             for other in seen:
-                if sentence != other and sentence.lower() in other.lower():
+                if sentences[index] != sentences[other] and lowers[index] in lowers[other]:
                     is_substring = True
                     break
             if not is_substring:
-                filtered.append(sentence)
+                filtered.append(index)
 
         # Remove highly similar sentences
+        token_sets = analysis.sentence_token_sets
         final_sentences = []
-        for sentence in filtered:
+        for index in filtered:
             is_similar = False
             for existing in final_sentences:
-                similarity = self._calculate_similarity(sentence, existing)
+                similarity = jaccard(token_sets[index], token_sets[existing])
                 if similarity > 0.75:  # 75% similar = remove
                     is_similar = True
                     break
             if not is_similar:
-                final_sentences.append(sentence)
+                final_sentences.append(index)
 
-        return '. '.join(final_sentences) + '.' if final_sentences else text
+        return '. '.join(sentences[i] for i in final_sentences) + '.' if final_sentences else text
 
-    def _calculate_similarity(self, sent1: str, sent2: str) -> float:
-        """Calculate similarity between two sentences using Jaccard similarity"""
-        words1 = set(sent1.lower().split())
-        words2 = set(sent2.lower().split())
-
-        if not words1 or not words2:
-            return 0.0
+    def get_model_info(self) -> Dict:
+        """Get information about the loaded model"""
+        return {
+            "model_name": self.model_type,
+            "device": _device_name(),
+            "framework": "PyTorch",
+            "source": "Hugging Face Hub"
+        }
 
-        intersection = len(words1 & words2)
-        union = len(words1 | words2)
 
-        return intersection / union if union > 0 else 0.0
+class TemplateModelConnector(HuggingFaceModelConnector):
+    """No model at all: every note comes from the pipeline's professional template (lite profile)"""
 
-    def _are_sentences_similar(self, sent1: str, sent2: str, threshold: float = 0.8) -> bool:
-        """Check if two sentences are similar"""
-        return self._calculate_similarity(sent1, sent2) > threshold
+    def initialize_models(self):
+        self.generator = None
+        self.model_type = "Rule-Based Template"
+        logger.info(f"✅ {self.model_type} generation ready (no model loaded)")
 
     def get_model_info(self) -> Dict:
         """Get information about the loaded model"""
         return {
             "model_name": self.model_type,
-            "device": "GPU" if torch.cuda.is_available() else "CPU",
-            "framework": "PyTorch",
-            "source": "Hugging Face Hub"
-        }
\ No newline at end of file
+            "device": "CPU",
+            "framework": "None",
+            "source": "Built-in template"
+        }
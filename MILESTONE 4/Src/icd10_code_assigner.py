@@ -1,11 +1,15 @@
-import pandas as pd
-import numpy as np
-from typing import Dict, List, Tuple
+import statistics
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
+
+from text_analysis import AnalyzedText
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class ICD10CodeAssigner:
     """Intelligent ICD-10 code assignment with confidence scoring and accuracy tracking"""
 
-    def __init__(self, icd_lookup_df: pd.DataFrame):
+    def __init__(self, icd_lookup_df: 'pd.DataFrame'):
         self.icd_lookup = icd_lookup_df
         self.icd_mapping = self._build_comprehensive_mapping()
         self.accuracy_scores = []
@@ -30,9 +34,10 @@ class ICD10CodeAssigner:
             'Z00.00': ['checkup', 'routine exam', 'follow-up', 'general visit', 'preventive', 'wellness', 'health maintenance']
         }
 
-    def assign_codes_with_accuracy(self, note_text: str, symptoms: str) -> Tuple[str, float, Dict]:
-        """Assign ICD-10 codes with accuracy score and reasoning"""
-        combined_text = (symptoms + " " + note_text).lower()
+    def assign_codes_with_accuracy(self, note_text: Union[str, AnalyzedText], symptoms: str) -> Tuple[str, float, Dict]:
+        """Assign ICD-10 codes with accuracy score and reasoning (note_text may be already analyzed)"""
+        note_lower = note_text.lower if isinstance(note_text, AnalyzedText) else note_text.lower()
+        combined_text = symptoms.lower() + " " + note_lower
 
         matched_codes = {}
         keyword_matches = {}
@@ -152,9 +157,9 @@ class ICD10CodeAssigner:
             }
 
         return {
-            'avg_accuracy': float(round(np.mean(self.accuracy_scores), 2)),
-            'min_accuracy': float(round(np.min(self.accuracy_scores), 2)),
-            'max_accuracy': float(round(np.max(self.accuracy_scores), 2)),
-            'median_accuracy': float(round(np.median(self.accuracy_scores), 2)),
+            'avg_accuracy': float(round(statistics.fmean(self.accuracy_scores), 2)),
+            'min_accuracy': float(round(min(self.accuracy_scores), 2)),
+            'max_accuracy': float(round(max(self.accuracy_scores), 2)),
+            'median_accuracy': float(round(statistics.median(self.accuracy_scores), 2)),
             'total_codes_assigned': len(self.accuracy_scores)
         }
\ No newline at end of file
@@ -0,0 +1,266 @@
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 1b: PRECOMPUTED IMAGE FEATURES (MEMORY-MAPPED)
+# ========================================
+#
+# Every scan referenced by mapping.csv is decoded once, off the request path, into a
+# fixed-length vector: a few intensity/structure statistics followed by a contrast
+# normalized THUMB_SIZE x THUMB_SIZE thumbnail. Vectors live in one float16 .npy file
+# opened with mmap, so a lookup is a row read; index.json maps file_id -> row and keeps
+# each image's (mtime_ns, size) so rebuilds only decode files that changed.
+
+DEFAULT_MAPPING = Path(__file__).resolve().parents[2] / "MILESTONE 3" / "Data" / "mapping.csv"
+
+THUMB_SIZE = 32
+WORK_SIZE = 128  # statistics are computed on a 128x128 grayscale copy
+SIGNAL_NAMES = ("mean_intensity", "contrast", "p05", "p50", "p95", "edge_density", "lr_asymmetry",
+                "upper_lower_ratio")
+INDEX_VERSION = 1
+FEATURES_FILE = "features.npy"
+INDEX_FILE = "index.json"
+
+
+def feature_dim(thumb_size: int = THUMB_SIZE) -> int:
+    return len(SIGNAL_NAMES) + thumb_size * thumb_size
+
+
+def extract_features(path: str, thumb_size: int = THUMB_SIZE) -> np.ndarray:
+    """Decode one image to grayscale and return its signals followed by the normalized thumbnail"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.draft("L", (WORK_SIZE, WORK_SIZE))  # JPEG decodes at reduced scale; no-op for PNG
+        work = img.convert("L").resize((WORK_SIZE, WORK_SIZE), Image.BILINEAR)
+    pixels = np.asarray(work, dtype=np.float32) / 255.0
+
+    p05, p50, p95 = np.percentile(pixels, (5, 50, 95))
+    edges = np.abs(np.diff(pixels, axis=0)).mean() + np.abs(np.diff(pixels, axis=1)).mean()
+    half = WORK_SIZE // 2
+    upper, lower = pixels[:half].mean(), pixels[half:].mean()
+    signals = np.array([
+        pixels.mean(), pixels.std(), p05, p50, p95, edges,
+        abs(pixels[:, :half].mean() - pixels[:, half:].mean()),
+        upper / lower if lower > 1e-6 else 0.0
+    ], dtype=np.float32)
+
+    thumb = np.asarray(work.resize((thumb_size, thumb_size), Image.BOX), dtype=np.float32) / 255.0
+    thumb = (thumb - thumb.mean()) / (thumb.std() + 1e-6)  # exposure-independent, comparable across scans
+    return np.concatenate([signals, thumb.ravel()])
+
+
+def _extract_or_error(task: Tuple[str, int]) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    path, thumb_size = task
+    try:
+        return extract_features(path, thumb_size), None
+    except Exception as e:  # one unreadable file must not sink the whole build
+        return None, f"{type(e).__name__}: {e}"
+
+
+def read_mapping(mapping_csv=DEFAULT_MAPPING, image_root=None) -> List[Tuple[str, Path]]:
+    """(file_id, absolute image path) for every row of mapping.csv; image paths are relative to image_root"""
+    mapping_csv = Path(mapping_csv)
+    root = Path(image_root) if image_root else mapping_csv.parent.parent
+    with open(mapping_csv, newline="") as f:
+        return [(str(row["file_id"]).strip(), root / row["image_path"])
+                for row in csv.DictReader(f) if row.get("image_path")]
+
+
+def describe_signals(signals: Dict[str, float]) -> str:
+    """One-line summary of the image statistics for prompts and notes"""
+    return (f"mean intensity {signals['mean_intensity']:.2f}, contrast {signals['contrast']:.2f}, "
+            f"edge density {signals['edge_density']:.3f}, left/right asymmetry {signals['lr_asymmetry']:.3f}, "
+            f"upper/lower ratio {signals['upper_lower_ratio']:.2f}")
+
+
+class ImageFeatureCache:
+    """Feature vectors for mapping.csv images in one memory-mapped array, keyed by file_id"""
+
+    def __init__(self, cache_dir, thumb_size: int = THUMB_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.thumb_size = thumb_size
+        self.dim = feature_dim(thumb_size)
+        self._index = self._load_index()
+        self._features = None
+
+    @classmethod
+    def from_env(cls) -> Optional['ImageFeatureCache']:
+        """Cache named by EHR_IMAGE_FEATURES, or None when imaging features are not configured"""
+        cache_dir = os.environ.get("EHR_IMAGE_FEATURES")
+        if not cache_dir:
+            return None
+        cache = cls(cache_dir)
+        logger.info(f"🩻 Image features: {len(cache)} scans cached in {cache_dir}")
+        return cache
+
+    # ---------------- index ----------------
+    def _load_index(self) -> Dict:
+        path = self.cache_dir / INDEX_FILE
+        if path.exists():
+            index = json.loads(path.read_text())
+            if index.get("version") == INDEX_VERSION and index.get("thumb_size") == self.thumb_size:
+                return index
+            logger.info("Image feature settings changed; the next build recomputes every scan")
+        return {"version": INDEX_VERSION, "thumb_size": self.thumb_size, "capacity": 0, "entries": {}}
+
+    def _save_index(self) -> None:
+        path = self.cache_dir / INDEX_FILE
+        tmp = path.with_name(INDEX_FILE + ".tmp")
+        tmp.write_text(json.dumps(self._index))
+        os.replace(tmp, path)
+
+    def __len__(self) -> int:
+        return len(self._index["entries"])
+
+    def __contains__(self, file_id) -> bool:
+        return str(file_id) in self._index["entries"]
+
+    def file_ids(self) -> List[str]:
+        return list(self._index["entries"])
+
+    # ---------------- lookups ----------------
+    def _array(self) -> np.ndarray:
+        if self._features is None:
+            self._features = np.load(self.cache_dir / FEATURES_FILE, mmap_mode="r")
+        return self._features
+
+    def get(self, file_id) -> Optional[np.ndarray]:
+        """Full feature vector (float32) for a file_id, or None if it is not cached"""
+        entry = self._index["entries"].get(str(file_id))
+        if entry is None:
+            return None
+        return np.asarray(self._array()[entry["row"]], dtype=np.float32)
+
+    def signals(self, file_id) -> Optional[Dict[str, float]]:
+        entry = self._index["entries"].get(str(file_id))
+        if entry is None:
+            return None
+        values = self._array()[entry["row"], :len(SIGNAL_NAMES)]
+        return {name: round(float(v), 4) for name, v in zip(SIGNAL_NAMES, values)}
+
+    def thumbnail(self, file_id) -> Optional[np.ndarray]:
+        vector = self.get(file_id)
+        return None if vector is None else vector[len(SIGNAL_NAMES):].reshape(self.thumb_size, self.thumb_size)
+
+    # ---------------- build ----------------
+    def _open_for_write(self, rows_needed: int) -> np.ndarray:
+        """Open features.npy read-write with room for rows_needed rows, growing (by copy) when needed"""
+        path = self.cache_dir / FEATURES_FILE
+        capacity = self._index["capacity"]
+        if path.exists() and capacity >= rows_needed:
+            return np.load(path, mmap_mode="r+")
+
+        new_capacity = max(rows_needed, capacity * 2, 64)
+        tmp = path.with_name(FEATURES_FILE + ".tmp")
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float16, shape=(new_capacity, self.dim))
+        if path.exists() and capacity:
+            grown[:capacity] = np.load(path, mmap_mode="r")
+        grown.flush()
+        del grown
+        os.replace(tmp, path)
+        self._index["capacity"] = new_capacity
+        return np.load(path, mmap_mode="r+")
+
+    def build(self, mapping_csv=DEFAULT_MAPPING, image_root=None, workers: Optional[int] = None,
+              chunksize: int = 16) -> Dict:
+        """
+        Bring the cache up to date with mapping.csv, decoding only new or changed images.
+
+        Returns:
+            Counts of computed, unchanged, missing, failed and removed scans
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = self._index["entries"]
+        mapping = read_mapping(mapping_csv, image_root)
+
+        todo, missing, unchanged = [], 0, 0
+        for file_id, path in mapping:
+            try:
+                stat = path.stat()
+            except OSError:
+                missing += 1
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            current = entries.get(file_id)
+            if current and current["signature"] == signature:
+                unchanged += 1
+            else:
+                todo.append((file_id, path, signature))
+
+        # Rows of file_ids no longer in mapping.csv are dropped from the index; every row no
+        # entry points at (removed now, or left by a scan that failed to decode) is reused
+        listed = {file_id for file_id, _ in mapping}
+        removed = [file_id for file_id in entries if file_id not in listed]
+        dropped = {entries.pop(file_id)["row"] for file_id in removed}
+        used = {e["row"] for e in entries.values()}
+        next_row = max(used | dropped, default=-1) + 1
+        free_rows = sorted(set(range(next_row)) - used)
+        rows = {}
+        for file_id, _, _ in todo:
+            if file_id in entries:
+                rows[file_id] = entries[file_id]["row"]
+            elif free_rows:
+                rows[file_id] = free_rows.pop(0)
+            else:
+                rows[file_id] = next_row
+                next_row += 1
+
+        computed, failed = 0, []
+        if todo:
+            self._features = None
+            features = self._open_for_write(next_row)
+            tasks = [(str(path), self.thumb_size) for _, path, _ in todo]
+            workers = workers or os.cpu_count() or 1
+            if workers > 1 and len(tasks) > chunksize:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    outputs = list(executor.map(_extract_or_error, tasks, chunksize=chunksize))
+            else:
+                outputs = [_extract_or_error(task) for task in tasks]
+
+            for (file_id, path, signature), (vector, error) in zip(todo, outputs):
+                if vector is None:
+                    failed.append({"file_id": file_id, "path": str(path), "error": error})
+                    entries.pop(file_id, None)  # its row is now unreferenced and reused by the next build
+                    continue
+                features[rows[file_id]] = vector
+                entries[file_id] = {"row": rows[file_id], "signature": signature}
+                computed += 1
+            features.flush()  # rows reach disk before the index that points at them
+            del features
+
+        if todo or removed:
+            self._save_index()
+        stats = {"computed": computed, "unchanged": unchanged, "missing": missing,
+                 "failed": len(failed), "removed": len(removed), "cached": len(entries)}
+        logger.info(f"🩻 Image features: {stats}")
+        for failure in failed[:5]:
+            logger.warning(f"Could not decode {failure['path']}: {failure['error']}")
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute image features for the scans in mapping.csv")
+    parser.add_argument("--mapping", default=str(DEFAULT_MAPPING), help="mapping.csv with file_id,image_path")
+    parser.add_argument("--image-root", default=None,
+                        help="Directory image_path is relative to (default: the mapping file's parent's parent)")
+    parser.add_argument("--cache", default="image_features", help="Cache directory (features.npy + index.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: CPU count)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = ImageFeatureCache(args.cache).build(args.mapping, args.image_root, args.workers)
+    print(json.dumps({**stats, "seconds": round(time.perf_counter() - start, 2)}, indent=2))
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from telemetry import CACHE_HITS
+
+if TYPE_CHECKING:
+    from hf_model_connector import HuggingFaceModelConnector
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 2f: LONG NOTES (MAP-REDUCE OVER SECTION CHUNKS)
+# ========================================
+#
+# The MILESTONE 3 notes (EHR_Processed_Notes) run to several KB, far past FLAN-T5's
+# 512-token encoder window, so format_for_model only ever sends the short symptom
+# string. A long note is handled in three steps instead:
+#
+#   split   section headers ("HISTORY OF PRESENT ILLNESS:,") cut the note into
+#           sections, packed into chunks that fit the window with the map prompt;
+#           a section that is too long on its own is split at sentences, then words
+#   map     every chunk not in the cache is summarized in one batched generator
+#           call (summarize_batch); summaries are cached by model + prompt hash, so
+#           re-running an edited note only regenerates the chunks that changed
+#   reduce  the summaries (summarized again while they still overflow the window)
+#           become one prompt for generate_clinical_output, i.e. the usual guarded
+#           note generation the pipeline checks and falls back from
+#
+# A note whose single chunk already fits the reduce prompt skips the map and is
+# reduced directly: one generation instead of two.
+
+MAP_PROMPT = """Summarize this part of a clinical note in one or two sentences. Keep diagnoses, findings, medications and procedures.
+
+{chunk}"""
+
+REDUCE_PROMPT = """Generate a brief clinical note from these section summaries. Do NOT repeat information.
+{context}
+{summaries}
+
+Write concise clinical note with: Chief complaint. Physical exam findings. Assessment. Plan for follow-up."""
+
+# Upper-case header followed by a colon, at the start of the note or after the comma that replaced a line break
+_SECTION_HEADER = re.compile(r"(?:^|(?<=[,\n]))\s*([A-Z][A-Z0-9/&()' -]*[A-Z)])\s*:")
+_LIST_COMMA = re.compile(r",(?=\s*\d+\.\s)")  # ",2.  Refractory ..." numbered items run together
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SPACES = re.compile(r"\s+")
+
+
+def _clean(body: str) -> str:
+    return _SPACES.sub(" ", _LIST_COMMA.sub(" ", body)).strip(" ,")
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """(header, body) for every non-empty section of a note; text before the first header has header ''"""
+    sections, header, start = [], "", 0
+    for match in _SECTION_HEADER.finditer(text):
+        sections.append((header, _clean(text[start:match.start()])))
+        header, start = match.group(1).strip(), match.end()
+    sections.append((header, _clean(text[start:])))
+    return [(header, body) for header, body in sections if body]
+
+
+def estimate_tokens(text: str) -> int:
+    """SentencePiece-ish token count without a tokenizer (about 4 tokens per 3 words of clinical text)"""
+    return math.ceil(len(text.split()) * 4 / 3)
+
+
+class ChunkSummaryCache:
+    """Chunk summaries by key, in memory and (with a path) appended to a JSON lines file that later runs reload"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, str] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry['summary']
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.entries.get(key)
+
+    def put(self, items: Dict[str, str]) -> None:
+        with self._lock:
+            self.entries.update(items)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps({'key': key, 'summary': summary}) + "\n" for key, summary in items.items())
+
+
+class LongNoteSummarizer:
+    """Clinical note for a note longer than the model's input window: section chunks, batched map, one reduce"""
+
+    def __init__(self, model_connector: 'HuggingFaceModelConnector', cache: Optional[ChunkSummaryCache] = None,
+                 max_input_tokens: int = 512, summary_tokens: int = 80, max_levels: int = 3):
+        self.model = model_connector
+        self.cache = cache if cache is not None else ChunkSummaryCache()
+        self.max_input_tokens = max_input_tokens
+        self.summary_tokens = summary_tokens  # max_length of each chunk summary
+        self.max_levels = max_levels  # extra map rounds allowed while the summaries overflow the window
+
+    @classmethod
+    def from_env(cls, model_connector: 'HuggingFaceModelConnector') -> Optional['LongNoteSummarizer']:
+        """Summarizer configured by EHR_LONG_NOTE_* variables, or None when EHR_LONG_NOTES=off"""
+        if os.environ.get("EHR_LONG_NOTES", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        cache_path = os.environ.get("EHR_SUMMARY_CACHE")
+        summarizer = cls(model_connector, ChunkSummaryCache(cache_path),
+                         max_input_tokens=int(os.environ.get("EHR_LONG_NOTE_MAX_TOKENS", "512")),
+                         summary_tokens=int(os.environ.get("EHR_LONG_NOTE_SUMMARY_TOKENS", "80")))
+        if cache_path:
+            logger.info(f"🧩 Long-note chunk summaries cached in {cache_path} ({len(summarizer.cache)} entries)")
+        return summarizer
+
+    # ---------------- split ----------------
+    def _token_counter(self) -> Callable[[str], int]:
+        tokenizer = getattr(self.model.generator, 'tokenizer', None)
+        if tokenizer is None:
+            return estimate_tokens
+        return lambda text: len(tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def chunk_budget(self, count: Optional[Callable[[str], int]] = None) -> int:
+        """Tokens left for the chunk once the map prompt and end-of-sequence token are counted"""
+        count = count or self._token_counter()
+        return max(self.max_input_tokens - count(MAP_PROMPT.format(chunk="")) - 1, 16)
+
+    def _split(self, text: str, budget: int, count: Callable[[str], int]) -> List[str]:
+        """text in pieces of at most budget tokens: whole, else sentence groups, else halves by words"""
+        if count(text) <= budget:
+            return [text]
+        sentences = _SENTENCE_END.split(text)
+        if len(sentences) > 1:
+            return self._pack(sentences, budget, count)
+        words = text.split()
+        if len(words) < 2:
+            return [text]  # one enormous token run; the tokenizer truncates it
+        middle = len(words) // 2
+        return (self._split(" ".join(words[:middle]), budget, count)
+                + self._split(" ".join(words[middle:]), budget, count))
+
+    def _pack(self, parts: List[str], budget: int, count: Callable[[str], int]) -> List[str]:
+        """Greedily join parts (split first where too long) into chunks of at most budget tokens"""
+        chunks, current, used = [], [], 0
+        for part in parts:
+            for piece in self._split(part, budget, count):
+                tokens = count(piece)
+                if current and used + tokens > budget:
+                    chunks.append(" ".join(current))
+                    current, used = [], 0
+                current.append(piece)
+                used += tokens
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def chunk(self, text: str) -> List[str]:
+        """Section-aligned chunks of a note that each fit the map prompt; long sections keep their header per piece"""
+        count = self._token_counter()
+        budget = self.chunk_budget(count)
+        parts = []
+        for header, body in split_sections(text):
+            if not header:
+                parts.extend(self._split(body, budget, count))
+                continue
+            section = f"{header}: {body}"
+            if count(section) <= budget:
+                parts.append(section)
+            else:
+                prefix = f"{header}:"
+                parts.extend(f"{prefix} {piece}" for piece in self._split(body, budget - count(prefix), count))
+        return self._pack(parts, budget, count)
+
+    # ---------------- map / reduce ----------------
+    def _cache_key(self, prompt: str) -> str:
+        identity = f"{self.model.model_type}\n{self.summary_tokens}\n{prompt}"
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _map(self, chunks: List[str], stats: Dict) -> List[Optional[str]]:
+        """A summary (or None) per chunk; cached chunks are not regenerated, the rest go in one batch"""
+        prompts = [MAP_PROMPT.format(chunk=chunk) for chunk in chunks]
+        keys = [self._cache_key(prompt) for prompt in prompts]
+        summaries = [self.cache.get(key) for key in keys]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        stats['cached_chunks'] += len(chunks) - len(missing)
+        if len(chunks) > len(missing):
+            CACHE_HITS.inc(len(chunks) - len(missing), cache="note_chunk", kind="hit")
+        if missing:
+            outputs = self.model.summarize_batch([prompts[i] for i in missing], self.summary_tokens)
+            fresh = {}
+            for i, output in zip(missing, outputs):
+                summaries[i] = output
+                if output:
+                    fresh[keys[i]] = output  # failed generations are retried next time
+            if fresh:
+                self.cache.put(fresh)
+            stats['generated_chunks'] += len(missing)
+        return summaries
+
+    def summarize(self, text: str, context: str = "") -> Tuple[Optional[str], Dict]:
+        """
+        (clinical note or None, stats) for a long note; context (e.g. "Patient: 54yo Male") leads the reduce prompt.
+
+        None means no usable summary or reduce output, and the caller falls back as for any failed generation.
+        """
+        count = self._token_counter()
+        chunks = self.chunk(text)
+        stats = {'note_tokens': count(text), 'chunks': len(chunks), 'cached_chunks': 0, 'generated_chunks': 0,
+                 'levels': 1, 'reduced': False}
+        if len(chunks) == 1:
+            prompt = REDUCE_PROMPT.format(context=context, summaries=f"- {chunks[0]}")
+            if count(prompt) < self.max_input_tokens:  # room for the end-of-sequence token
+                stats['levels'] = 0
+                stats['reduced'] = True
+                return self.model.generate_clinical_output(prompt), stats
+        summaries = [s for s in self._map(chunks, stats) if s]
+        budget = self.chunk_budget(count)
+        while len(summaries) > 1 and count("\n".join(summaries)) > budget and stats['levels'] <= self.max_levels:
+            # Summaries of a very long note still overflow the window: summarize them again
+            summaries = [s for s in self._map(self._pack(summaries, budget, count), stats) if s]
+            stats['levels'] += 1
+        if not summaries:
+            return None, stats
+        stats['reduced'] = True  # last_generation() now describes the reduce call
+        prompt = REDUCE_PROMPT.format(context=context, summaries="\n".join(f"- {s}" for s in summaries))
+        return self.model.generate_clinical_output(prompt), stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Show how notes are chunked, or summarize them with a backend")
+    parser.add_argument("notes", nargs="+", help="Note files (globs allowed)")
+    parser.add_argument("--backend", default=None, help="Summarize with this generation backend (default: only chunk)")
+    parser.add_argument("--max-tokens", type=int, default=512, help="Model input window")
+    args = parser.parse_args()
+
+    if args.backend:
+        from generation_backends import create_backend
+        summarizer = LongNoteSummarizer(create_backend(args.backend), ChunkSummaryCache(os.environ.get("EHR_SUMMARY_CACHE")),
+                                        max_input_tokens=args.max_tokens)
+    else:
+        from hf_model_connector import TemplateModelConnector
+        summarizer = LongNoteSummarizer(TemplateModelConnector(), max_input_tokens=args.max_tokens)
+    for path in sorted(p for pattern in args.notes for p in glob.glob(pattern)):
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        if args.backend:
+            note, stats = summarizer.summarize(text)
+            print(json.dumps({'note': path, **stats, 'clinical_note': note}, indent=2))
+        else:
+            chunks = summarizer.chunk(text)
+            print(f"{path}: {len(text)} chars, ~{estimate_tokens(text)} tokens, {len(chunks)} chunks, "
+                  f"{len(split_sections(text))} sections")
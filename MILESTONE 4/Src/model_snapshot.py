@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 2c: OFFLINE MODEL SNAPSHOTS (SAFETENSORS + MMAP)
+# ========================================
+#
+#   model_snapshots/
+#     google--flan-t5-large/
+#       LATEST                  <- name of the current version directory
+#       7d8ff3e0b1c2/           <- one directory per snapshot, never modified after it is written
+#         snapshot.json         <- manifest: model, version, dtype, file sizes and sha256
+#         config.json  generation_config.json  model.safetensors  tokenizer files
+#
+# Loading builds the model on the meta device and assigns the safetensors tensors
+# straight into it. Those tensors are views of the memory-mapped file, so nothing is
+# copied: pages are read on first use and live in the page cache, shared by every
+# process (prefork workers included) that maps the same snapshot.
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "snapshot.json"
+LATEST_NAME = "LATEST"
+DTYPES = ("float32", "float16", "bfloat16")
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, incomplete or does not match its manifest"""
+
+
+def model_slug(model_name: str) -> str:
+    return model_name.replace("/", "--")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def create_snapshot(model_name: str, root: str, revision: Optional[str] = None, dtype: Optional[str] = None,
+                    model=None, tokenizer=None) -> Path:
+    """
+    Write tokenizer, config and safetensors weights into root/<model>/<version> and mark it LATEST.
+
+    Downloads through the hub (or its cache) unless model and tokenizer are passed in.
+    The version is the hub commit hash when known, otherwise a timestamp.
+    """
+    import safetensors
+    import torch
+    import transformers
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    if tokenizer is None:
+        tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+    if model is None:
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name, revision=revision)
+    if dtype:
+        model = model.to(getattr(torch, dtype))
+
+    commit = getattr(model.config, "_commit_hash", None)
+    version = commit[:12] if commit else datetime.now().strftime("%Y%m%d%H%M%S")
+    model_dir = Path(root) / model_slug(model_name)
+    target = model_dir / version
+    if target.exists():
+        raise SnapshotError(f"Snapshot {target} already exists")
+
+    # Written under a temporary name and renamed, so a crash never leaves a half snapshot behind
+    staging = model_dir / f".staging-{version}"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    start = time.perf_counter()
+    model.save_pretrained(staging)
+    tokenizer.save_pretrained(staging)
+    weights = sorted(staging.glob("*.safetensors"))
+    if not weights:
+        shutil.rmtree(staging)
+        raise SnapshotError("save_pretrained wrote no .safetensors files")
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "model": model_name,
+        "version": version,
+        "revision": commit or revision,
+        "created": datetime.now().isoformat(),
+        "architectures": getattr(model.config, "architectures", None),
+        "dtype": str(next(model.parameters()).dtype).replace("torch.", ""),
+        "libraries": {"torch": torch.__version__, "transformers": transformers.__version__,
+                      "safetensors": safetensors.__version__},
+        "files": {
+            path.name: {"bytes": path.stat().st_size, "sha256": _sha256(path)}
+            for path in sorted(staging.iterdir()) if path.is_file()
+        }
+    }
+    (staging / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    os.replace(staging, target)
+    _write_atomic(model_dir / LATEST_NAME, version + "\n")
+    logger.info(f"📦 Snapshot {model_name}@{version} written to {target} in {time.perf_counter() - start:.1f}s")
+    return target
+
+
+def resolve_snapshot(location: str, model_name: Optional[str] = None) -> Path:
+    """
+    Find the snapshot directory for location, which may be a snapshot itself,
+    a model directory with a LATEST pointer, or a snapshot root (needs model_name).
+    """
+    path = Path(location)
+    if (path / MANIFEST_NAME).is_file():
+        return path
+    if model_name and (path / model_slug(model_name)).is_dir():
+        path = path / model_slug(model_name)
+    latest = path / LATEST_NAME
+    if latest.is_file():
+        target = path / latest.read_text().strip()
+        if (target / MANIFEST_NAME).is_file():
+            return target
+        raise SnapshotError(f"{latest} points at {target.name}, which has no {MANIFEST_NAME}")
+    raise SnapshotError(f"No model snapshot found at {location}")
+
+
+def read_manifest(snapshot_dir: Path) -> Dict:
+    manifest = json.loads((Path(snapshot_dir) / MANIFEST_NAME).read_text())
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} in {snapshot_dir}")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir: Path, check_hashes: bool = False) -> Dict:
+    """Check every manifest file is present with the recorded size (and sha256 when check_hashes)"""
+    snapshot_dir = Path(snapshot_dir)
+    manifest = read_manifest(snapshot_dir)
+    for name, expected in manifest["files"].items():
+        path = snapshot_dir / name
+        if not path.is_file():
+            raise SnapshotError(f"{name} is missing from {snapshot_dir}")
+        if path.stat().st_size != expected["bytes"]:
+            raise SnapshotError(f"{name} is {path.stat().st_size} bytes, manifest says {expected['bytes']}")
+        if check_hashes and _sha256(path) != expected["sha256"]:
+            raise SnapshotError(f"{name} does not match its sha256 in the manifest")
+    return manifest
+
+
+def load_snapshot(location: str, model_name: Optional[str] = None, check_hashes: bool = False) -> Tuple:
+    """
+    Load (model, tokenizer, manifest) from a snapshot without touching the network.
+
+    Parameters are the memory-mapped safetensors tensors themselves, so load time is
+    independent of model size and weight pages are only read when first used.
+    """
+    import torch
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForSeq2SeqLM, AutoTokenizer
+
+    snapshot_dir = resolve_snapshot(location, model_name)
+    manifest = verify_snapshot(snapshot_dir, check_hashes)
+
+    config = AutoConfig.from_pretrained(snapshot_dir, local_files_only=True)
+    tokenizer = AutoTokenizer.from_pretrained(snapshot_dir, local_files_only=True)
+    with torch.device("meta"):
+        model = AutoModelForSeq2SeqLM.from_config(config)
+
+    state: Dict = {}
+    for weights in sorted(snapshot_dir.glob("*.safetensors")):
+        state.update(load_file(weights))  # mmap-backed, no copy
+    result = model.load_state_dict(state, strict=False, assign=True)
+    if result.unexpected_keys:
+        raise SnapshotError(f"Snapshot has weights the model does not: {result.unexpected_keys[:5]}")
+    model.tie_weights()  # shared embeddings are stored once; re-link the copies save_pretrained dropped
+
+    unset: List[str] = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+                        if tensor.is_meta]
+    if unset:
+        raise SnapshotError(f"Snapshot is missing weights: {unset[:5]}")
+    model.eval()
+    logger.info(f"📦 Loaded snapshot {manifest['model']}@{manifest['version']} from {snapshot_dir} (mmap)")
+    return model, tokenizer, manifest
+
+
+class SnapshotGenerator:
+    """Callable with the text2text pipeline's interface, running generate() on a snapshot model"""
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def __call__(self, prompt: Union[str, List[str]], batch_size: Optional[int] = None, **generate_kwargs) -> List[Dict]:
+        """One result for a prompt; a list of prompts is padded and generated as one batch (batch_size is implied)"""
+        import torch
+
+        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True,
+                                padding=isinstance(prompt, list)).to(self.model.device)
+        with torch.inference_mode():
+            output = self.model.generate(**inputs, **generate_kwargs)
+        texts = self.tokenizer.batch_decode(output, skip_special_tokens=True)
+        return [{"generated_text": text} for text in (texts if isinstance(prompt, list) else texts[:1])]
+
+
+def list_snapshots(root: str) -> List[Dict]:
+    snapshots = []
+    for manifest_path in sorted(Path(root).glob(f"*/*/{MANIFEST_NAME}")):
+        manifest = json.loads(manifest_path.read_text())
+        latest = manifest_path.parent.parent / LATEST_NAME
+        snapshots.append({
+            "model": manifest["model"],
+            "version": manifest["version"],
+            "dtype": manifest.get("dtype"),
+            "megabytes": round(sum(f["bytes"] for f in manifest["files"].values()) / 1e6, 1),
+            "latest": latest.is_file() and latest.read_text().strip() == manifest["version"],
+            "path": str(manifest_path.parent)
+        })
+    return snapshots
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Offline model snapshots for HuggingFaceModelConnector")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create = subparsers.add_parser("create", help="Download a model and write it as a versioned snapshot")
+    create.add_argument("model", nargs="?", default="google/flan-t5-large", help="Hub model id")
+    create.add_argument("--root", default="model_snapshots", help="Snapshot root directory")
+    create.add_argument("--revision", default=None, help="Hub revision (branch, tag or commit)")
+    create.add_argument("--dtype", default=None, choices=DTYPES, help="Convert the weights before saving")
+    verify = subparsers.add_parser("verify", help="Check a snapshot's files against its manifest (sha256)")
+    verify.add_argument("location", help="Snapshot, model directory or root")
+    verify.add_argument("--model", default=None, help="Model id when location is a root")
+    listing = subparsers.add_parser("list", help="List the snapshots under a root")
+    listing.add_argument("--root", default="model_snapshots", help="Snapshot root directory")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        path = create_snapshot(args.model, args.root, args.revision, args.dtype)
+        print(f"Snapshot written to {path}")
+        print(f"Serve it offline with EHR_MODEL_SNAPSHOT={Path(args.root).resolve()}")
+    elif args.command == "verify":
+        snapshot_dir = resolve_snapshot(args.location, args.model)
+        manifest = verify_snapshot(snapshot_dir, check_hashes=True)
+        print(f"✅ {manifest['model']}@{manifest['version']}: {len(manifest['files'])} files match the manifest")
+    elif args.command == "list":
+        for s in list_snapshots(args.root):
+            marker = "*" if s["latest"] else " "
+            print(f"{marker} {s['model']:<32}{s['version']:<16}{s['dtype'] or '':<10}{s['megabytes']:>10} MB  {s['path']}")
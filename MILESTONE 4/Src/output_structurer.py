@@ -1,8 +1,10 @@
 import re
+import time
 from typing import Dict, List, Optional
-from datetime import datetime
 import logging
 
+from clinical_records import ClinicalRecord
+
 logger = logging.getLogger(__name__)
 
 class OutputStructurer:
@@ -16,7 +18,7 @@ class OutputStructurer:
         Parse the clinical text generated by the model and assign ICD codes.
         
         Args:
-            clinical_text: The text generated by the model
+            clinical_text: The text generated by the model (str or its AnalyzedText)
             symptoms: The patient's symptoms
             icd_assigner: Instance of ICD10CodeAssigner
             
@@ -30,41 +32,33 @@ class OutputStructurer:
         )
 
         return {
-            "clinical_note": clinical_text,
+            "clinical_note": str(clinical_text),
             "icd10_code": top_code,
             "confidence_score": accuracy,
             "reasoning": keyword_matches
         }
 
-    def create_final_output(self, patient_json: Dict, model_output: Dict) -> Dict:
+    def create_final_output(self, patient_json: Dict, model_output: Dict,
+                            stage_timings: Optional[Dict[str, float]] = None) -> Dict:
         """
         Combine patient data and model output into the final structure.
         
         Args:
             patient_json: Original patient data
             model_output: Output from parse_model_response
+            stage_timings: Per-stage durations in milliseconds, reported in the metadata
             
         Returns:
             Final structured dictionary
         """
-        return {
-            "patient_id": patient_json.get("PatientName", "Unknown"), # Using Name as ID for now if ID not present
-            "timestamp": datetime.now().isoformat(),
-            "patient_data": patient_json,
-            "clinical_documentation": {
-                "generated_note": model_output.get("clinical_note", ""),
-                "icd_coding": {
-                    "code": model_output.get("icd10_code", ""),
-                    "description": self._get_icd_description(model_output.get("icd10_code", "")),
-                    "confidence": model_output.get("confidence_score", 0.0),
-                    "evidence": model_output.get("reasoning", {})
-                }
-            },
-            "metadata": {
-                "model_version": "1.0",
-                "processing_time": datetime.now().isoformat() # Placeholder
-            }
-        }
+        return self.create_record(patient_json, model_output, stage_timings).to_dict()
+
+    def create_record(self, patient_json: Dict, model_output: Dict,
+                      stage_timings: Optional[Dict[str, float]] = None) -> ClinicalRecord:
+        """Compact form of create_final_output's result; one timestamp serves timestamp and processed_at"""
+        code = model_output.get("icd10_code", "")
+        return ClinicalRecord.build(patient_json, model_output, self._get_icd_description(code), time.time(),
+                                    stage_timings)
 
     def _get_icd_description(self, code: str) -> str:
         """Helper to get description for a code (mock implementation)"""
@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Tuple
+
+from text_analysis import AnalyzedText
+
+# ========================================
+# STEP 2d: REPETITION GUARD (ABORT DEGENERATE GENERATIONS EARLY)
+# ========================================
+#
+# The pipeline rejects a finished note when too many of its sentences or words repeat
+# (AutomatedWorkflowPipeline._is_too_repetitive) and writes the template instead. The
+# guard applies the same ratios while the model is still decoding: every check_every
+# steps it decodes the running beams and, once the leading beam and most of the others
+# are clearly degenerate, stops generate(). The pipeline then falls back straight away
+# instead of after the full max_length x num_beams search.
+
+
+def repetition_ratios(text: str) -> Tuple[float, float, int, int]:
+    """(sentence repetition, word repetition, sentence count, word count); repetition = 1 - unique/total"""
+    return AnalyzedText(text).repetition_ratios()
+
+
+class RepetitionGuard:
+    """
+    Stopping criterion for model.generate() (also accepted by the text2text pipeline)
+    that stops decoding once the output is clearly degenerate.
+
+    Thresholds sit above the pipeline's own (0.25 sentences / 0.5 words) and need a
+    minimum amount of text; none of the MILESTONE 3 reference notes trips them.
+    Unlike the post-hoc check, word loops without any full stop are caught too.
+    """
+
+    def __init__(self, tokenizer, sentence_threshold: float = 0.5, word_threshold: float = 0.6,
+                 min_sentences: int = 4, min_words: int = 24, check_every: int = 4, enabled: bool = True):
+        import torch
+
+        self._torch = torch
+        self.tokenizer = tokenizer
+        self.enabled = enabled  # False: only count decoder steps, never abort
+        self.sentence_threshold = sentence_threshold
+        self.word_threshold = word_threshold
+        self.min_sentences = min_sentences
+        self.min_words = min_words
+        self.check_every = check_every
+        self.steps = 0
+        self.aborted = False
+        self.reason: Optional[str] = None
+
+    def degenerate(self, text: str) -> Optional[str]:
+        """'sentences' or 'words' when text is clearly repetitive, else None"""
+        sentence_ratio, word_ratio, sentences, words = repetition_ratios(text)
+        if sentences >= self.min_sentences and sentence_ratio > self.sentence_threshold:
+            return 'sentences'
+        if words >= self.min_words and word_ratio > self.word_threshold:
+            return 'words'
+        return None
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        rows = input_ids.shape[0]
+        self.steps = input_ids.shape[-1] - 1  # minus the decoder start token
+        if self.aborted:
+            return self._torch.ones(rows, dtype=self._torch.bool, device=input_ids.device)
+        if not self.enabled or self.steps == 0 or self.steps % self.check_every:
+            return self._torch.zeros(rows, dtype=self._torch.bool, device=input_ids.device)
+
+        # Beams share prefixes; decode and score each distinct row once
+        verdicts: Dict[bytes, Optional[str]] = {}
+        reasons = []
+        for row in input_ids:
+            key = row.cpu().numpy().tobytes()
+            if key not in verdicts:
+                verdicts[key] = self.degenerate(self.tokenizer.decode(row, skip_special_tokens=True))
+            reasons.append(verdicts[key])
+
+        # Row 0 is the highest-scoring candidate; stop only when it and most of the others have degenerated
+        degenerate_rows = sum(reason is not None for reason in reasons)
+        if reasons[0] is not None and degenerate_rows * 2 > rows:
+            self.aborted = True
+            self.reason = reasons[0]
+        return self._torch.full((rows,), self.aborted, dtype=self._torch.bool, device=input_ids.device)
+
+    def summary(self) -> Dict:
+        return {'decoder_steps': self.steps, 'aborted': self.aborted, 'abort_reason': self.reason}
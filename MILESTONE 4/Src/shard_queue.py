@@ -0,0 +1,404 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Union
+
+from clinical_records import dumps_many
+from telemetry import SHARD_LEASES
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from workflow_pipeline import AutomatedWorkflowPipeline
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 4b: MULTI-NODE BATCH SHARDS (LEASED WORK QUEUE ON A SHARED DIRECTORY)
+# ========================================
+#
+# Spreads one process_batch job over several CPU nodes without a message broker.
+# Everything lives in a directory that every node mounts:
+#
+#   queue_dir/
+#     queue.db                      <- SQLite: one row per shard (status, owner, lease, attempt)
+#     inputs/shard-00000.jsonl      <- the shard's patients, written once by the coordinator
+#     outputs/shard-00000.a1.json   <- results written by attempt 1 of shard 0
+#
+# A worker claims a pending shard, or one whose lease has expired, and a heartbeat
+# thread renews the lease while it works. A dead worker stops renewing, and once the
+# lease runs out another worker reclaims the shard under a new attempt number. Each
+# attempt writes its own output file. A completion only counts while the worker still
+# holds the lease for that attempt, so a worker that was presumed dead can never
+# overwrite or double-count a reclaimed shard. merge() concatenates the completed
+# outputs in shard order into the usual batch_results files.
+#
+# The database uses SQLite's rollback journal, not WAL. WAL relies on shared memory
+# and does not work across machines. The filesystem must support POSIX locks (NFSv4
+# and most cluster filesystems do). Leases are timed by each node's wall clock, so
+# keep nodes NTP-synced and set leases well above the clock skew.
+
+DB_NAME = "queue.db"
+SHARD_SIZE = 100
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id      INTEGER PRIMARY KEY,
+    status        TEXT NOT NULL,          -- pending, leased, done, failed
+    input_path    TEXT NOT NULL,          -- relative to the queue directory (mount points differ per node)
+    patients      INTEGER NOT NULL,
+    attempt       INTEGER NOT NULL DEFAULT 0,
+    owner         TEXT,
+    lease_expires REAL,
+    output_path   TEXT,
+    results       INTEGER,
+    error         TEXT,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_shards_status ON shards(status, shard_id);
+"""
+
+
+def _write_atomic(path: Path, data: Union[str, bytes]) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data.encode('utf-8') if isinstance(data, str) else data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_patients(path: str) -> Iterator[Dict]:
+    """Patients from a JSON list or a JSON-lines file"""
+    with open(path, encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class ShardQueue:
+    """Shards of a batch job in a shared directory, claimed by workers under expiring leases"""
+
+    def __init__(self, root: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts  # attempts per shard before it is marked failed
+        (self.root / "inputs").mkdir(parents=True, exist_ok=True)
+        (self.root / "outputs").mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A short-lived connection per operation; safe from any thread or process"""
+        conn = sqlite3.connect(self.root / DB_NAME, timeout=60, isolation_level=None)
+        try:
+            conn.execute("PRAGMA busy_timeout=60000")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE: takes the write lock up front so two claims can never pick the same shard"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # ---------------- coordinator ----------------
+    def publish(self, patients: Iterable[Dict], shard_size: int = SHARD_SIZE) -> int:
+        """Split patients into shard files and queue them; returns the number of shards"""
+        with self._connect() as conn:
+            existing = conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+        if existing:
+            raise ValueError(f"{self.root} already holds {existing} shards; use a new queue directory per job")
+
+        rows, chunk = [], []
+
+        def flush():
+            relative = f"inputs/shard-{len(rows):05d}.jsonl"
+            _write_atomic(self.root / relative, "".join(json.dumps(p, default=str) + "\n" for p in chunk))
+            rows.append((len(rows), 'pending', relative, len(chunk), time.time()))
+            chunk.clear()
+
+        for patient in patients:
+            chunk.append(patient)
+            if len(chunk) >= shard_size:
+                flush()
+        if chunk:
+            flush()
+
+        # Rows are inserted only after every input file exists, so workers never see a half-published job
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO shards (shard_id, status, input_path, patients, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+        logger.info(f"📦 Published {sum(r[3] for r in rows)} patients as {len(rows)} shards in {self.root}")
+        return len(rows)
+
+    # ---------------- leases ----------------
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Lease the next pending or expired shard; None when nothing is claimable right now"""
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT shard_id, status, attempt, input_path, patients, owner FROM shards "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY shard_id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                shard_id, status, attempt, input_path, patients, previous_owner = row
+                if attempt >= self.max_attempts:
+                    conn.execute("UPDATE shards SET status = 'failed', owner = NULL, lease_expires = NULL, "
+                                 "error = COALESCE(error, ?), updated_at = ? WHERE shard_id = ?",
+                                 (f"lease expired on attempt {attempt} ({previous_owner})", now, shard_id))
+                    logger.warning(f"❌ Shard {shard_id} failed after {attempt} attempts")
+                    continue
+                conn.execute("UPDATE shards SET status = 'leased', owner = ?, attempt = ?, lease_expires = ?, "
+                             "updated_at = ? WHERE shard_id = ?",
+                             (worker_id, attempt + 1, now + self.lease_seconds, now, shard_id))
+
+            kind = 'reclaimed' if status == 'leased' else ('retry' if attempt else 'fresh')
+            SHARD_LEASES.inc(kind=kind)
+            if kind == 'reclaimed':
+                logger.warning(f"♻️ Shard {shard_id} reclaimed from {previous_owner} (lease expired)")
+            return {'shard_id': shard_id, 'attempt': attempt + 1, 'owner': worker_id,
+                    'input_path': input_path, 'patients': patients, 'kind': kind}
+
+    def _update_leased(self, lease: Dict, assignments: str, values: tuple) -> bool:
+        """Apply an update only while lease still owns the shard; False means it was lost"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE shards SET {assignments}, updated_at = ? "
+                "WHERE shard_id = ? AND owner = ? AND attempt = ? AND status = 'leased'",
+                values + (time.time(), lease['shard_id'], lease['owner'], lease['attempt']))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, lease: Dict) -> bool:
+        """Extend the lease; False if it expired and the shard was reclaimed"""
+        return self._update_leased(lease, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, lease: Dict, output_path: str, results: int) -> bool:
+        return self._update_leased(lease, "status = 'done', lease_expires = NULL, output_path = ?, results = ?, "
+                                          "error = NULL", (output_path, results))
+
+    def release(self, lease: Dict, error: str) -> bool:
+        """Give a shard back after an error; it is retried until max_attempts"""
+        status = 'failed' if lease['attempt'] >= self.max_attempts else 'pending'
+        return self._update_leased(lease, "status = ?, owner = NULL, lease_expires = NULL, error = ?",
+                                   (status, error[:2000]))
+
+    def read_input(self, lease: Dict) -> List[Dict]:
+        return list(load_patients(str(self.root / lease['input_path'])))
+
+    def write_output(self, lease: Dict, results: List) -> str:
+        """Results (ClinicalRecords or dicts) of one attempt as a JSON array"""
+        relative = f"outputs/shard-{lease['shard_id']:05d}.a{lease['attempt']}.json"
+        _write_atomic(self.root / relative, dumps_many(results))
+        return relative
+
+    # ---------------- progress ----------------
+    def status(self) -> Dict:
+        now = time.time()
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+            patients, results, attempts = conn.execute(
+                "SELECT COALESCE(SUM(patients), 0), COALESCE(SUM(results), 0), COALESCE(SUM(attempt), 0) "
+                "FROM shards").fetchone()
+            expired = conn.execute("SELECT COUNT(*) FROM shards WHERE status = 'leased' AND lease_expires < ?",
+                                   (now,)).fetchone()[0]
+            owners = dict(conn.execute("SELECT owner, COUNT(*) FROM shards WHERE status = 'leased' "
+                                       "GROUP BY owner").fetchall())
+            errors = [{'shard_id': s, 'error': e} for s, e in conn.execute(
+                "SELECT shard_id, error FROM shards WHERE status = 'failed' ORDER BY shard_id LIMIT 20")]
+        total = sum(counts.values())
+        return {
+            'shards': total,
+            'pending': counts.get('pending', 0),
+            'leased': counts.get('leased', 0),
+            'expired_leases': expired,
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'patients': patients,
+            'results': results,
+            'attempts': attempts,
+            'workers': owners,
+            'errors': errors
+        }
+
+    def is_finished(self) -> bool:
+        """True once no shard is pending or leased (every shard is done or failed)"""
+        with self._connect() as conn:
+            open_shards = conn.execute("SELECT COUNT(*) FROM shards WHERE status IN ('pending', 'leased')").fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+        return total > 0 and open_shards == 0
+
+    # ---------------- merge ----------------
+    def merge(self, output_folder: str, allow_partial: bool = False) -> 'pd.DataFrame':
+        """Concatenate completed shard outputs in shard order and write batch_results.csv / .json"""
+        from workflow_pipeline import save_batch_results
+
+        status = self.status()
+        if not self.is_finished() or (status['failed'] and not allow_partial):
+            raise RuntimeError(f"Queue not complete: {status['done']}/{status['shards']} shards done, "
+                               f"{status['failed']} failed (pass allow_partial to merge anyway)")
+        results: List[Dict] = []
+        with self._connect() as conn:
+            paths = [row[0] for row in conn.execute(
+                "SELECT output_path FROM shards WHERE status = 'done' ORDER BY shard_id")]
+        for relative in paths:
+            with open(self.root / relative, encoding='utf-8') as f:
+                results.extend(json.load(f))
+        logger.info(f"🧩 Merged {len(results)} results from {len(paths)} shards")
+        return save_batch_results(results, output_folder)
+
+
+class ShardWorker:
+    """Claims shards from a ShardQueue and runs their patients through a pipeline until the queue is finished"""
+
+    def __init__(self, queue: ShardQueue, pipeline: 'AutomatedWorkflowPipeline', worker_id: Optional[str] = None,
+                 poll_interval: float = 2.0):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+        self.stats = {'shards': 0, 'patients': 0, 'lost_leases': 0, 'errors': 0}
+
+    def _heartbeat(self, lease: Dict, stop: threading.Event, lost: threading.Event) -> None:
+        while not stop.wait(self.queue.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(lease):
+                    lost.set()
+                    return
+            except sqlite3.Error as e:  # keep trying; the lease only lapses if this persists
+                logger.warning(f"⚠️ Heartbeat for shard {lease['shard_id']} failed: {e}")
+
+    def process_shard(self, lease: Dict) -> bool:
+        """Run one leased shard; True when its results were accepted"""
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(lease, stop, lost),
+                                     name=f"shard-{lease['shard_id']}-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            results = []
+            for patient in self.queue.read_input(lease):
+                if lost.is_set():
+                    break
+                record = self.pipeline.process_patient_record(patient)
+                self.pipeline.results.clear()  # the shard output holds them; don't grow across shards
+                if record is not None:
+                    results.append(record)
+                self.stats['patients'] += 1
+            if not lost.is_set():
+                output_path = self.queue.write_output(lease, results)
+                if self.queue.complete(lease, output_path, len(results)):
+                    self.stats['shards'] += 1
+                    logger.info(f"✅ Shard {lease['shard_id']} done ({len(results)}/{lease['patients']} results)")
+                    return True
+                os.remove(self.queue.root / output_path)
+            self.stats['lost_leases'] += 1
+            logger.warning(f"⚠️ Lost the lease on shard {lease['shard_id']}; its results were discarded")
+            return False
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Error processing shard {lease['shard_id']}: {e}")
+            self.queue.release(lease, f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def run(self, max_shards: Optional[int] = None) -> Dict:
+        """Work until every shard is done or failed (or max_shards were processed); returns counters"""
+        logger.info(f"👷 Worker {self.worker_id} started on {self.queue.root}")
+        processed = 0
+        while max_shards is None or processed < max_shards:
+            lease = self.queue.claim(self.worker_id)
+            if lease is None:
+                if self.queue.is_finished():
+                    break
+                time.sleep(self.poll_interval)  # other workers hold the rest; wait in case their leases lapse
+                continue
+            self.process_shard(lease)
+            processed += 1
+        logger.info(f"👷 Worker {self.worker_id} finished: {self.stats}")
+        return self.stats
+
+
+def _work(queue_dir: str, lease_seconds: float, backend: Optional[str]) -> Dict:
+    """Entry point of one worker process"""
+    logging.basicConfig(level=logging.INFO)
+    from generation_backends import create_backend
+    from workflow_pipeline import AutomatedWorkflowPipeline
+
+    pipeline = AutomatedWorkflowPipeline(model_connector=create_backend(backend))
+    return ShardWorker(ShardQueue(queue_dir, lease_seconds=lease_seconds), pipeline).run()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Batch processing spread over nodes through a shared shard queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    publish = subparsers.add_parser("publish", help="Split a batch into shards (run once, on any node)")
+    publish.add_argument("queue", help="Queue directory on the shared filesystem")
+    source = publish.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Patients as a JSON list or JSON lines")
+    source.add_argument("--corpus", help="Corpus dataset directory (corpus_dataset.py)")
+    publish.add_argument("--coded-only", action="store_true", help="With --corpus: skip rows labelled UNKNOWN")
+    publish.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    work = subparsers.add_parser("work", help="Process shards until the queue is finished (run on every node)")
+    work.add_argument("queue")
+    work.add_argument("--processes", type=int, default=1, help="Worker processes on this node")
+    work.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Lease length in seconds")
+    work.add_argument("--backend", default=None, help="Generation backend (default: EHR_MODEL_BACKEND, else hf)")
+    status_parser = subparsers.add_parser("status", help="Shard counts, live workers and failures")
+    status_parser.add_argument("queue")
+    merge = subparsers.add_parser("merge", help="Write batch_results.csv / .json once every shard is done")
+    merge.add_argument("queue")
+    merge.add_argument("--output", default="../Outputs")
+    merge.add_argument("--allow-partial", action="store_true", help="Merge even if some shards failed")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        if args.corpus:
+            from corpus_dataset import CorpusDataset, coded_filter
+            corpus = CorpusDataset(args.corpus)
+            patients = (corpus.filter(coded_filter()) if args.coded_only else corpus).iter_patients()
+        else:
+            patients = load_patients(args.input)
+        ShardQueue(args.queue).publish(patients, args.shard_size)
+    elif args.command == "work":
+        worker_args = (args.queue, args.lease, args.backend)
+        if args.processes == 1:
+            print(json.dumps(_work(*worker_args), indent=2))
+        else:
+            # spawn: each worker loads its own model instead of inheriting a forked torch runtime
+            with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+                print(json.dumps(pool.starmap(_work, [worker_args] * args.processes), indent=2))
+    elif args.command == "status":
+        print(json.dumps(ShardQueue(args.queue).status(), indent=2))
+    elif args.command == "merge":
+        ShardQueue(args.queue).merge(args.output, allow_partial=args.allow_partial)
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import random
+import re
+import time
+from typing import Dict, List, Union
+
+from hf_model_connector import HuggingFaceModelConnector
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 2b: DETERMINISTIC STUB MODEL (OFFLINE)
+# ========================================
+
+_PROMPT_FIELDS = re.compile(r"Patient: (?P<age>\S+)yo (?P<gender>[^\n]*)\nChief Complaint: (?P<symptoms>[^\n]*)\nImaging: (?P<scan>[^\n]*)")
+
+_OPENINGS = [
+    "The patient is a {age}yo {gender} with {symptoms}.",
+    "{age}-year-old {gender} presents with {symptoms}.",
+    "Patient reports {symptoms} on presentation.",
+]
+_EXAM = [
+    "Physical exam findings are consistent with the clinical presentation.",
+    "On examination the patient is alert and oriented with stable vital signs.",
+    "The physical exam is unremarkable apart from the reported complaints.",
+]
+_IMAGING = [
+    "{scan}.",
+    "Imaging reviewed: {scan}.",
+]
+_PLAN = [
+    "Assessment suggests a condition consistent with {symptoms}.",
+    "The patient will be followed up in two weeks to review symptoms.",
+    "Plan includes symptomatic treatment and a follow-up visit.",
+    "Patient counseled on warning signs and advised to return if symptoms worsen.",
+]
+
+
+class StubTextGenerator:
+    """Deterministic stand-in for the transformers text2text pipeline"""
+
+    def __init__(self, latency_ms: float = 0.0, repetition_rate: float = 0.1):
+        self.latency_ms = latency_ms
+        self.repetition_rate = repetition_rate
+
+    def __call__(self, prompt: Union[str, List[str]], **generate_kwargs) -> List[Dict]:
+        if isinstance(prompt, list):
+            # A batch pays one latency_ms, like one padded forward pass
+            results = [{'generated_text': self._text(p)} for p in prompt]
+        else:
+            results = [{'generated_text': self._text(prompt)}]
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return results
+
+    def _text(self, prompt: str) -> str:
+        seed = int(hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+
+        match = _PROMPT_FIELDS.search(prompt)
+        fields = match.groupdict() if match else {}
+        values = {
+            'age': fields.get('age', 'Unknown'),
+            'gender': fields.get('gender', 'patient').strip().lower(),
+            'symptoms': fields.get('symptoms', 'general checkup').strip().lower(),
+            'scan': fields.get('scan', 'No imaging').strip().rstrip('.'),
+        }
+
+        if rng.random() < self.repetition_rate:
+            # Degenerate output so the pipeline's repetition fallback gets exercised too
+            sentence = rng.choice(_OPENINGS).format(**values)
+            return " ".join([sentence] * 4)
+        else:
+            sentences = [
+                rng.choice(_OPENINGS),
+                rng.choice(_EXAM),
+                rng.choice(_IMAGING),
+                *rng.sample(_PLAN, 2),
+            ]
+            return " ".join(s.format(**values) for s in sentences)
+
+
+class StubModelConnector(HuggingFaceModelConnector):
+    """HuggingFaceModelConnector backed by StubTextGenerator, for benchmarks and offline runs"""
+
+    def __init__(self, latency_ms: float = 0.0, repetition_rate: float = 0.1):
+        self.latency_ms = latency_ms
+        self.repetition_rate = repetition_rate
+        super().__init__()
+
+    def initialize_models(self):
+        """Install the deterministic stub instead of downloading a model"""
+        self.generator = StubTextGenerator(self.latency_ms, self.repetition_rate)
+        self.model_type = "Deterministic Stub"
+        logger.info(f"✅ {self.model_type} generator ready (latency={self.latency_ms}ms)")
+
+    def get_model_info(self) -> Dict:
+        """Get information about the loaded model"""
+        return {
+            "model_name": self.model_type,
+            "device": "CPU",
+            "framework": "None",
+            "source": "Local stub"
+        }
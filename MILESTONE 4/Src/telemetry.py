@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ========================================
+# STAGE TIMING & METRICS (PROMETHEUS TEXT FORMAT)
+# ========================================
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = key + ((extra,) if extra else ())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self, constant: Tuple[Tuple[str, str], ...] = ()) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(constant + key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, with optional labels"""
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self, constant: Tuple[Tuple[str, str], ...] = ()) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(constant + key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric so they can be rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._constant: Tuple[Tuple[str, str], ...] = ()  # labels added to every series, e.g. worker
+
+    def reset(self, **constant_labels) -> None:
+        """
+        Zero every metric and label all series with constant_labels from now on. A forked
+        worker calls this so it neither reports the master's counts nor collides with its siblings.
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+        self._constant = _label_key(constant_labels)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(self._constant))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram("ehr_stage_duration_seconds", "Duration of each pipeline stage")
+REQUEST_DURATION = REGISTRY.histogram("ehr_request_duration_seconds", "HTTP request latency by endpoint")
+REQUESTS = REGISTRY.counter("ehr_requests_total", "HTTP requests by endpoint and status code")
+FALLBACKS = REGISTRY.counter("ehr_template_fallbacks_total",
+                             "Notes produced by the template (_generate_professional_note) fallback")
+DECODER_STEPS = REGISTRY.counter("ehr_decoder_steps_total",
+                                "Decoder steps run by guarded generations, by outcome (kept, discarded, aborted)")
+GENERATION_ABORTS = REGISTRY.counter("ehr_generation_aborts_total",
+                                     "Generations stopped early by the repetition guard, by what repeated")
+TRIAGE_ROUTES = REGISTRY.counter("ehr_triage_routes_total",
+                                "Patients routed to the model or straight to the template, by reason")
+SHARD_LEASES = REGISTRY.counter("ehr_shard_leases_total",
+                               "Batch shards claimed from a shard queue, by kind (fresh, retry, reclaimed)")
+CACHE_HITS = REGISTRY.counter("ehr_cache_hits_total", "Responses served from a cache instead of the pipeline")
+ERRORS = REGISTRY.counter("ehr_errors_total", "Errors by component")
+
+
+@contextmanager
+def time_stage(stage: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """Time a block: observe it in STAGE_DURATION and, if given, store milliseconds in timings[stage]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(elapsed * 1000.0, 3)
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition (version 0.0.4) of every registered metric"""
+    return REGISTRY.render()
+
+
+def process_memory(pid="self") -> Dict[str, float]:
+    """
+    Resident memory of a process in MB from /proc/<pid>/smaps_rollup (Linux).
+
+    private_mb is what the process alone pays for; pss_mb splits shared pages
+    (e.g. model weights inherited from a prefork master) between the sharers.
+    Returns an empty dict where smaps_rollup is unavailable.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1)
+    }
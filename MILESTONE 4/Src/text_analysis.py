@@ -0,0 +1,109 @@
+from typing import FrozenSet, List, Tuple, Union
+
+# ========================================
+# STEP 3b: SHARED TEXT ANALYSIS (ONE PASS PER NOTE)
+# ========================================
+#
+# Coding, repetition cleanup and the quality checks all used to re-lowercase and
+# re-split the same note. AnalyzedText does that work once and the consumers read
+# its views:
+#   lower                 normalized (lowercased) text for keyword matching
+#   sentence_spans        (start, end) of each stripped, non-empty '.'-separated sentence
+#   tokens / token_set    whitespace tokens of the lowercased text
+#   sentence_token_sets   per-sentence token sets, for Jaccard similarity without re-splitting
+# Everything past the lowercased text and sentence spans is built on first use and cached.
+
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """Spans of [s.strip() for s in text.split('.') if s.strip()], without building the pieces"""
+    spans = []
+    start = 0
+    length = len(text)
+    while start <= length:
+        end = text.find('.', start)
+        if end == -1:
+            end = length
+        left, right = start, end
+        while left < right and text[left].isspace():
+            left += 1
+        while right > left and text[right - 1].isspace():
+            right -= 1
+        if left < right:
+            spans.append((left, right))
+        start = end + 1
+    return spans
+
+
+class AnalyzedText:
+    """A note analyzed once: normalized text, sentence spans and tokens"""
+
+    __slots__ = ('text', 'lower', 'sentence_spans', '_tokens', '_token_set', '_sentences',
+                 '_sentence_lowers', '_sentence_token_sets')
+
+    def __init__(self, text: str):
+        self.text = text or ''
+        self.lower = self.text.lower()
+        self.sentence_spans = _sentence_spans(self.text)
+        self._tokens = None
+        self._token_set = None
+        self._sentences = None
+        self._sentence_lowers = None
+        self._sentence_token_sets = None
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def tokens(self) -> List[str]:
+        if self._tokens is None:
+            self._tokens = self.lower.split()
+        return self._tokens
+
+    @property
+    def token_set(self) -> FrozenSet[str]:
+        if self._token_set is None:
+            self._token_set = frozenset(self.tokens)
+        return self._token_set
+
+    @property
+    def sentences(self) -> List[str]:
+        if self._sentences is None:
+            self._sentences = [self.text[start:end] for start, end in self.sentence_spans]
+        return self._sentences
+
+    @property
+    def sentence_lowers(self) -> List[str]:
+        if self._sentence_lowers is None:
+            self._sentence_lowers = [self.lower[start:end] for start, end in self.sentence_spans]
+        return self._sentence_lowers
+
+    @property
+    def sentence_token_sets(self) -> List[FrozenSet[str]]:
+        if self._sentence_token_sets is None:
+            self._sentence_token_sets = [frozenset(sentence.split()) for sentence in self.sentence_lowers]
+        return self._sentence_token_sets
+
+    def repetition_ratios(self) -> Tuple[float, float, int, int]:
+        """(sentence repetition, word repetition, sentence count, word count); repetition = 1 - unique/total"""
+        sentences = len(self.sentence_spans)
+        words = len(self.tokens)
+        sentence_ratio = 1 - (len(set(self.sentences)) / sentences) if sentences else 0.0
+        word_ratio = 1 - (len(self.token_set) / words) if words else 0.0
+        return sentence_ratio, word_ratio, sentences, words
+
+
+def analyze(text: Union[str, AnalyzedText, None]) -> AnalyzedText:
+    """AnalyzedText for text, reusing it when the caller already analyzed the note"""
+    return text if isinstance(text, AnalyzedText) else AnalyzedText(text or '')
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard similarity of two token sets"""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    union = len(a) + len(b) - intersection
+    return intersection / union if union > 0 else 0.0
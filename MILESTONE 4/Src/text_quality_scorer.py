@@ -0,0 +1,358 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 5b: TEXT QUALITY SCORING (BLEU / ROUGE-L / SIMILARITY)
+# ========================================
+
+DEFAULT_REFERENCE_DIR = Path(__file__).resolve().parents[2] / "MILESTONE 3" / "Data" / "EHR_Processed_Notes"
+
+MAX_NGRAM = 4
+SMOOTHING_EPSILON = 0.1  # Chen & Cherry "method 1" smoothing for sentence BLEU
+QUALITY_WEIGHTS = {'bleu': 0.3, 'rouge_l': 0.4, 'similarity': 0.3}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_FILE_NUMBER = re.compile(r"(\d+)$")  # note_0001.txt -> mapping.csv file_id 1
+
+# Per-process reference data. Filled by _init_worker in pool workers (and by the
+# scorer itself for in-process runs) so each reference is tokenized once per process.
+_REFERENCES: List[str] = []
+_PROFILES: Dict[int, 'ReferenceProfile'] = {}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenization shared by every metric"""
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+
+def ngram_counts(tokens: List[str], n: int) -> Counter:
+    """Count n-grams of a single order"""
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+class ReferenceProfile:
+    """Cached per-reference statistics: n-gram counts, LCS bit masks and term vector norm"""
+
+    __slots__ = ('length', 'ngrams', 'lcs_masks', 'term_counts', 'term_norm')
+
+    def __init__(self, text: str):
+        tokens = tokenize(text)
+        self.length = len(tokens)
+        self.ngrams = [ngram_counts(tokens, n) for n in range(1, MAX_NGRAM + 1)]
+
+        # One bit per reference position for every token, used by the bit-parallel LCS
+        masks: Dict[str, int] = {}
+        for position, token in enumerate(tokens):
+            masks[token] = masks.get(token, 0) | (1 << position)
+        self.lcs_masks = masks
+
+        self.term_counts = self.ngrams[0]
+        self.term_norm = math.sqrt(sum(c * c for c in self.term_counts.values()))
+
+
+def _init_worker(references: List[str]) -> None:
+    """Pool initializer: ship the reference corpus once per worker process"""
+    global _REFERENCES, _PROFILES
+    _REFERENCES = list(references)
+    _PROFILES = {}
+
+
+def _get_profile(reference_id: int) -> ReferenceProfile:
+    profile = _PROFILES.get(reference_id)
+    if profile is None:
+        profile = ReferenceProfile(_REFERENCES[reference_id])
+        _PROFILES[reference_id] = profile
+    return profile
+
+
+def _lcs_length(reference: ReferenceProfile, hyp_tokens: List[str]) -> int:
+    """Bit-parallel LCS (Hyyrö 2004): O(len(hypothesis)) big-int operations"""
+    if not reference.length or not hyp_tokens:
+        return 0
+    full = (1 << reference.length) - 1
+    row = full
+    masks = reference.lcs_masks
+    for token in hyp_tokens:
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return reference.length - row.bit_count()
+
+
+def _brevity_penalty(hyp_len: int, ref_len: int) -> float:
+    if hyp_len == 0:
+        return 0.0
+    if hyp_len >= ref_len:
+        return 1.0
+    return math.exp(1 - ref_len / hyp_len)
+
+
+def _bleu_from_counts(matches: Sequence[int], totals: Sequence[int], hyp_len: int, ref_len: int,
+                      smooth: bool) -> float:
+    """Geometric mean of modified n-gram precisions times brevity penalty (0-100 scale)"""
+    if hyp_len == 0:
+        return 0.0
+    log_precision = 0.0
+    for match, total in zip(matches, totals):
+        if total == 0:
+            return 0.0
+        if match == 0:
+            if not smooth:
+                return 0.0
+            match = SMOOTHING_EPSILON
+        log_precision += math.log(match / total)
+    return 100.0 * _brevity_penalty(hyp_len, ref_len) * math.exp(log_precision / len(matches))
+
+
+def _score_pair(hypothesis: str, reference_id: int) -> Tuple:
+    """Sufficient statistics plus sentence-level scores for one (hypothesis, reference) pair"""
+    reference = _get_profile(reference_id)
+    hyp_tokens = tokenize(hypothesis)
+    hyp_len = len(hyp_tokens)
+
+    matches, totals = [], []
+    hyp_unigrams = None
+    for n in range(1, MAX_NGRAM + 1):
+        hyp_ngrams = ngram_counts(hyp_tokens, n)
+        if n == 1:
+            hyp_unigrams = hyp_ngrams
+        ref_ngrams = reference.ngrams[n - 1]
+        matches.append(sum(min(count, ref_ngrams[gram]) for gram, count in hyp_ngrams.items()))
+        totals.append(max(hyp_len - n + 1, 0))
+
+    sentence_bleu = _bleu_from_counts(matches, totals, hyp_len, reference.length, smooth=True)
+
+    lcs = _lcs_length(reference, hyp_tokens)
+    if lcs:
+        precision = lcs / hyp_len
+        recall = lcs / reference.length
+        rouge_l = 2 * precision * recall / (precision + recall)
+    else:
+        rouge_l = 0.0
+
+    hyp_norm = math.sqrt(sum(c * c for c in hyp_unigrams.values()))
+    if hyp_norm and reference.term_norm:
+        dot = sum(count * reference.term_counts[token] for token, count in hyp_unigrams.items())
+        similarity = dot / (hyp_norm * reference.term_norm)
+    else:
+        similarity = 0.0
+
+    return matches, totals, hyp_len, reference.length, sentence_bleu, rouge_l, similarity
+
+
+def _score_chunk(pairs: List[Tuple[str, int]]) -> List[Tuple]:
+    return [_score_pair(hypothesis, reference_id) for hypothesis, reference_id in pairs]
+
+
+def _file_id_key(file_id) -> Optional[str]:
+    """mapping.csv file_id as the string from_corpus keys references by; None for a missing id or NaN"""
+    if file_id is None or (isinstance(file_id, float) and math.isnan(file_id)):
+        return None
+    if isinstance(file_id, float) and file_id.is_integer():
+        file_id = int(file_id)  # an integer column with gaps comes back from pandas as floats
+    return str(file_id).strip() or None
+
+
+def quality_score(bleu: float, rouge_l: float, similarity: float) -> float:
+    """Blend the three metrics into a single 0-100 quality score"""
+    return 100.0 * (QUALITY_WEIGHTS['bleu'] * bleu / 100.0
+                    + QUALITY_WEIGHTS['rouge_l'] * rouge_l
+                    + QUALITY_WEIGHTS['similarity'] * similarity)
+
+
+class TextQualityScorer:
+    """Score generated notes against reference notes with corpus/sentence BLEU, ROUGE-L and token similarity"""
+
+    def __init__(self, references: Sequence[str], max_workers: Optional[int] = None,
+                 chunk_size: int = 256):
+        if not references:
+            raise ValueError("At least one reference note is required")
+        self.references = [str(r) for r in references]
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.reference_file_ids: Dict[str, int] = {}  # mapping.csv file_id -> reference index
+
+    @classmethod
+    def from_directory(cls, folder=DEFAULT_REFERENCE_DIR, pattern: str = "note_*.txt", **kwargs) -> 'TextQualityScorer':
+        """Load reference notes (e.g. EHR_Processed_Notes) sorted by file name, keyed by the file_id in the name"""
+        paths = sorted(Path(folder).glob(pattern))
+        if not paths:
+            raise FileNotFoundError(f"No reference notes matching {pattern} in {folder}")
+        references = [p.read_text(encoding='utf-8', errors='ignore') for p in paths]
+        logger.info(f"📚 Loaded {len(references)} reference notes from {folder}")
+        scorer = cls(references, **kwargs)
+        for i, path in enumerate(paths):
+            number = _FILE_NUMBER.search(path.stem)
+            if number:
+                scorer.reference_file_ids[str(int(number.group(1)))] = i
+        return scorer
+
+    @classmethod
+    def from_corpus(cls, corpus, **kwargs) -> 'TextQualityScorer':
+        """Use the notes of a CorpusDataset (or a filtered view of one) as references, ordered by file_id"""
+        file_ids, references = corpus.reference_notes()
+        if not references:
+            raise ValueError(f"No rows with a note in the corpus at {corpus.path}")
+        scorer = cls(references, **kwargs)
+        scorer.reference_file_ids = {str(file_id): i for i, file_id in enumerate(file_ids)}
+        logger.info(f"📚 Loaded {len(references)} reference notes from corpus {corpus.path}")
+        return scorer
+
+    def score(self, hypotheses: Sequence[str], reference_ids: Sequence[int]) -> Dict:
+        """
+        Score each hypothesis against its reference note.
+
+        Args:
+            hypotheses: Generated clinical notes
+            reference_ids: Index into the reference list for each hypothesis (match_file_ids maps file_ids)
+
+        Returns:
+            Dict with corpus-level BLEU and per-pair sentence scores
+        """
+        if len(reference_ids) != len(hypotheses):
+            raise ValueError("reference_ids must have one entry per hypothesis")
+
+        pairs = [(str(h or ''), int(r)) for h, r in zip(hypotheses, reference_ids)]
+        chunks = [pairs[i:i + self.chunk_size] for i in range(0, len(pairs), self.chunk_size)]
+
+        if self.max_workers > 1 and len(chunks) > 1:
+            workers = min(self.max_workers, len(chunks))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.references,)) as executor:
+                stats = [row for chunk in executor.map(_score_chunk, chunks) for row in chunk]
+        else:
+            if _REFERENCES != self.references:
+                _init_worker(self.references)
+            stats = _score_chunk(pairs)
+
+        # Corpus BLEU sums clipped matches and lengths before taking precisions
+        corpus_matches = [0] * MAX_NGRAM
+        corpus_totals = [0] * MAX_NGRAM
+        hyp_total = ref_total = 0
+        pair_scores = []
+        for matches, totals, hyp_len, ref_len, bleu, rouge_l, similarity in stats:
+            for n in range(MAX_NGRAM):
+                corpus_matches[n] += matches[n]
+                corpus_totals[n] += totals[n]
+            hyp_total += hyp_len
+            ref_total += ref_len
+            pair_scores.append({
+                'bleu': round(bleu, 2),
+                'rouge_l': round(rouge_l, 4),
+                'similarity': round(similarity, 4),
+                'quality': round(quality_score(bleu, rouge_l, similarity), 2)
+            })
+
+        return {
+            'corpus_bleu': round(_bleu_from_counts(corpus_matches, corpus_totals, hyp_total, ref_total,
+                                                   smooth=False), 2),
+            'pairs': pair_scores
+        }
+
+    def match_file_ids(self, file_ids: Sequence) -> List[Optional[int]]:
+        """Reference index for each file_id, or None where the id is missing or has no reference note"""
+        if not self.reference_file_ids:
+            raise ValueError("No reference note is keyed by a file_id (use from_corpus, or note_<file_id>.txt names)")
+        return [self.reference_file_ids.get(_file_id_key(file_id)) for file_id in file_ids]
+
+    def score_dataframe(self, results_df, note_column: Optional[str] = None,
+                        reference_column: Optional[str] = None, file_id_column: Optional[str] = None):
+        """
+        Return a copy of results_df with BLEUScore, RougeL, TextSimilarity and QualityScore columns.
+
+        reference_column holds reference indices; file_id_column names the mapping.csv file_id, read from
+        that column or, for process_batch results, from each row's patient_data. Only rows with a reference
+        note are scored; the rest (every row when neither column is given) get NaN and are counted in
+        attrs['unmatched'], never paired with some other note by position.
+        """
+        if note_column is None:
+            note_column = 'ClinicalNote' if 'ClinicalNote' in results_df.columns else 'generated_note'
+        notes = results_df[note_column].fillna('').astype(str).tolist()
+        if reference_column is not None:
+            import pandas as pd
+            reference_ids = [None if pd.isna(r) else int(r) for r in results_df[reference_column]]
+        elif file_id_column is not None:
+            if file_id_column in results_df.columns:
+                file_ids = results_df[file_id_column].tolist()
+            else:
+                patients = results_df['patient_data'] if 'patient_data' in results_df.columns else [None] * len(notes)
+                file_ids = [p.get(file_id_column) if isinstance(p, dict) else None for p in patients]
+            reference_ids = self.match_file_ids(file_ids)
+        else:
+            logger.warning("⚠️ No reference_column or file_id_column; notes are left unscored")
+            reference_ids = [None] * len(notes)
+
+        matched = [i for i, reference_id in enumerate(reference_ids) if reference_id is not None]
+        if matched and len(matched) < len(notes):
+            logger.warning(f"⚠️ {len(notes) - len(matched)} of {len(notes)} notes have no reference note "
+                           f"and were not scored")
+        columns = {name: [math.nan] * len(notes) for name in ('BLEUScore', 'RougeL', 'TextSimilarity', 'QualityScore')}
+        corpus_bleu = None
+        if matched:
+            scores = self.score([notes[i] for i in matched], [reference_ids[i] for i in matched])
+            for i, pair in zip(matched, scores['pairs']):
+                columns['BLEUScore'][i] = pair['bleu']
+                columns['RougeL'][i] = pair['rouge_l']
+                columns['TextSimilarity'][i] = pair['similarity']
+                columns['QualityScore'][i] = pair['quality']
+            corpus_bleu = scores['corpus_bleu']
+
+        scored = results_df.copy()
+        for name, values in columns.items():
+            scored[name] = values
+        scored.attrs['corpus_bleu'] = corpus_bleu
+        scored.attrs['scored'] = len(matched)
+        scored.attrs['unmatched'] = len(notes) - len(matched)
+        return scored
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Score generated notes against reference notes")
+    parser.add_argument("results", help="batch_results.json produced by the workflow pipeline")
+    parser.add_argument("--references", default=str(DEFAULT_REFERENCE_DIR),
+                        help="Folder of note_<file_id>.txt reference notes")
+    parser.add_argument("--corpus", default=None,
+                        help="corpus_dataset.py directory; pairs each result with its own file_id's note")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    args = parser.parse_args()
+
+    with open(args.results) as f:
+        results = json.load(f)
+    notes = [r.get('ClinicalNote') or r.get('clinical_documentation', {}).get('generated_note', '') for r in results]
+
+    if args.corpus:
+        from corpus_dataset import CorpusDataset
+        scorer = TextQualityScorer.from_corpus(CorpusDataset(args.corpus), max_workers=args.workers)
+    else:
+        scorer = TextQualityScorer.from_directory(args.references, max_workers=args.workers)
+    # Score only results whose file_id has a reference note
+    reference_ids = scorer.match_file_ids([(r.get('patient_data') or {}).get('FileId') for r in results])
+    matched = [i for i, reference_id in enumerate(reference_ids) if reference_id is not None]
+    unmatched = len(notes) - len(matched)
+    notes, reference_ids = [notes[i] for i in matched], [reference_ids[i] for i in matched]
+    start = time.perf_counter()
+    scores = scorer.score(notes, reference_ids) if notes else {'corpus_bleu': None, 'pairs': []}
+    elapsed = time.perf_counter() - start
+
+    pairs = scores['pairs']
+    print(json.dumps({
+        'pairs_scored': len(pairs),
+        'unmatched': unmatched,
+        'seconds': round(elapsed, 3),
+        'corpus_bleu': scores['corpus_bleu'],
+        'average_sentence_bleu': round(sum(p['bleu'] for p in pairs) / max(len(pairs), 1), 2),
+        'average_rouge_l': round(sum(p['rouge_l'] for p in pairs) / max(len(pairs), 1), 4),
+        'average_similarity': round(sum(p['similarity'] for p in pairs) / max(len(pairs), 1), 4),
+        'average_quality': round(sum(p['quality'] for p in pairs) / max(len(pairs), 1), 2)
+    }, indent=2))
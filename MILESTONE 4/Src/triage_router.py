@@ -0,0 +1,159 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from telemetry import TRIAGE_ROUTES
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# STEP 1c: TRIAGE ROUTER (MODEL OR TEMPLATE)
+# ========================================
+#
+# Decides, before generation, whether a prepared patient needs FLAN-T5 at all.
+# Three cheap signals are combined:
+#   richness           how much there is to write about (symptom detail, imaging, history, scan features)
+#   coding confidence  how clearly the symptoms point at one ICD-10 code (keyword hits, as the coder counts them)
+#   fallback history   how often the model's note was rejected for similar inputs (same route key)
+# Routine, unambiguous encounters (a checkup with no or unremarkable imaging) go straight to the template,
+# as do input groups whose model notes are almost always replaced by the template anyway.
+
+ROUTINE_CODES = ("Z00.00",)
+NO_IMAGING_MARKERS = ("no imaging", "not performed", "none", "n/a")
+_UNREMARKABLE_IMAGING = re.compile(r"\b(normal|unremarkable|negative|no acute)\b")  # nothing to write up
+EMPTY_HISTORY = ("", "none", "unknown", "n/a", "see referenced note")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+class TriageRouter:
+    """Route each prepared patient to the model or straight to the template, learning from fallbacks"""
+
+    def __init__(self, icd_mapping: Optional[Dict[str, List[str]]] = None, max_complexity: float = 0.35,
+                 max_fallback_rate: float = 0.8, min_samples: int = 20, explore_every: int = 20):
+        if icd_mapping is None:
+            from icd10_code_assigner import ICD10CodeAssigner
+            icd_mapping = ICD10CodeAssigner(None).icd_mapping
+        self.icd_mapping = {code: [k.lower() for k in keywords] for code, keywords in icd_mapping.items()}
+        self.max_complexity = max_complexity
+        self.max_fallback_rate = max_fallback_rate
+        self.min_samples = min_samples
+        self.explore_every = explore_every  # keep sampling the model for keys routed away by history
+        self._history: Dict[str, List[int]] = {}  # route key -> [model runs, model notes replaced by the template]
+        self._routed: Dict[str, int] = {}  # route key -> decisions skipped by history (for exploration)
+        self._decisions: Dict[str, int] = {}
+        self._generate_ms = [0.0, 0]  # total model generate time, runs
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, icd_mapping: Optional[Dict[str, List[str]]] = None) -> Optional['TriageRouter']:
+        """Router configured by EHR_TRIAGE_* variables, or None when EHR_TRIAGE=off"""
+        if os.environ.get("EHR_TRIAGE", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        router = cls(icd_mapping,
+                     max_complexity=_env_float("EHR_TRIAGE_MAX_COMPLEXITY", 0.35),
+                     max_fallback_rate=_env_float("EHR_TRIAGE_FALLBACK_RATE", 0.8),
+                     min_samples=int(_env_float("EHR_TRIAGE_MIN_SAMPLES", 20)))
+        logger.info(f"🧭 Triage router on (complexity <= {router.max_complexity} skips the model, "
+                    f"fallback rate >= {router.max_fallback_rate} after {router.min_samples} runs)")
+        return router
+
+    # ---------------- scoring ----------------
+    def score(self, patient_json: Dict) -> Dict:
+        """Richness, coding confidence and complexity (all 0-1) of a prepared patient, plus its route key"""
+        symptoms = str(patient_json.get('Symptoms', '')).lower()
+        scan = str(patient_json.get('ScanResult', '')).lower().strip()
+        history = str(patient_json.get('MedicalHistory', '')).lower().strip()
+        has_imaging = bool(scan) and not any(marker in scan for marker in NO_IMAGING_MARKERS)
+        has_findings = has_imaging and not _UNREMARKABLE_IMAGING.search(scan)
+
+        hits = {code: sum(1 for keyword in keywords if keyword in symptoms)
+                for code, keywords in self.icd_mapping.items()}
+        hits = {code: n for code, n in hits.items() if n}
+        if hits:
+            top_code = max(hits, key=hits.get)
+            coding_confidence = hits[top_code] / sum(hits.values())  # 1.0 when one code explains every hit
+        else:
+            top_code, coding_confidence = ROUTINE_CODES[0], 1.0  # the coder's default for no matches
+
+        richness = (0.4 * min(len(symptoms.split()) / 8.0, 1.0)
+                    + 0.3 * has_findings
+                    + 0.15 * (history not in EMPTY_HISTORY)
+                    + 0.15 * bool(patient_json.get('ImagingFeatures')))
+        complexity = 0.5 * richness + 0.5 * (1.0 - coding_confidence)
+        return {
+            'key': f"{top_code}|{'findings' if has_findings else 'no-findings'}|{int(richness * 4)}",
+            'code': top_code,
+            'has_imaging': has_imaging,
+            'imaging_findings': has_findings,
+            'richness': round(richness, 3),
+            'coding_confidence': round(coding_confidence, 3),
+            'complexity': round(complexity, 3)
+        }
+
+    def fallback_rate(self, key: str) -> Optional[float]:
+        runs, fallbacks = self._history.get(key, (0, 0))
+        return fallbacks / runs if runs else None
+
+    # ---------------- routing ----------------
+    def route(self, patient_json: Dict) -> Dict:
+        """Decision dict: path ('model' or 'template'), reason and the scores behind it"""
+        decision = self.score(patient_json)
+        key = decision['key']
+        with self._lock:
+            runs, _ = self._history.get(key, (0, 0))
+            rate = self.fallback_rate(key)
+            if runs >= self.min_samples and rate >= self.max_fallback_rate:
+                self._routed[key] = self._routed.get(key, 0) + 1
+                explore = self._routed[key] % self.explore_every == 0
+                path, reason = ('model', 'explore') if explore else ('template', 'fallback_history')
+            elif decision['code'] in ROUTINE_CODES and not decision['imaging_findings'] \
+                    and decision['complexity'] <= self.max_complexity:
+                path, reason = 'template', 'routine'
+            else:
+                path, reason = 'model', 'complex'
+            self._decisions[f"{path}:{reason}"] = self._decisions.get(f"{path}:{reason}", 0) + 1
+
+        TRIAGE_ROUTES.inc(path=path, reason=reason)
+        decision.update({'path': path, 'reason': reason,
+                         'fallback_rate': round(rate, 3) if rate is not None else None})
+        return decision
+
+    def record(self, decision: Dict, fell_back: bool, generate_ms: Optional[float] = None) -> None:
+        """Feed back whether the model's note for a 'model' decision was replaced by the template"""
+        with self._lock:
+            history = self._history.setdefault(decision['key'], [0, 0])
+            history[0] += 1
+            history[1] += int(fell_back)
+            if generate_ms is not None:
+                self._generate_ms[0] += generate_ms
+                self._generate_ms[1] += 1
+
+    # ---------------- reporting ----------------
+    def report(self) -> Dict:
+        """Routing counts, the model's fallback rate and the generation time the template routes saved"""
+        with self._lock:
+            decisions = dict(self._decisions)
+            history = {key: list(value) for key, value in self._history.items()}
+            total_ms, timed_runs = self._generate_ms
+
+        templated = sum(n for name, n in decisions.items() if name.startswith('template:'))
+        total = sum(decisions.values())
+        runs = sum(h[0] for h in history.values())
+        fallbacks = sum(h[1] for h in history.values())
+        avg_generate_ms = total_ms / timed_runs if timed_runs else None
+        return {
+            'decisions': decisions,
+            'template_share': round(templated / total, 4) if total else 0.0,
+            'model_runs': runs,
+            'model_fallback_rate': round(fallbacks / runs, 4) if runs else None,
+            'avg_generate_ms': round(avg_generate_ms, 3) if avg_generate_ms is not None else None,
+            'estimated_generate_ms_saved': round(templated * avg_generate_ms, 1) if avg_generate_ms else None,
+            'keys': {key: {'model_runs': h[0], 'fallback_rate': round(h[1] / h[0], 3)}
+                     for key, h in sorted(history.items(), key=lambda item: -item[1][0])[:20]}
+        }
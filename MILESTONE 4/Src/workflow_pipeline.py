@@ -1,16 +1,24 @@
 import logging
 import os
-import json
-from typing import Dict, List, Optional
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 from datetime import datetime
-import pandas as pd
-from tqdm import tqdm
 
-# Import local modules
+# Import local modules (hf_model_connector defers torch/transformers until a model is loaded)
+from clinical_records import ClinicalRecord, dumps, dumps_many, to_dicts
 from data_preparation import DataPreparationPipeline
+from generation_backends import create_backend
 from hf_model_connector import HuggingFaceModelConnector
 from icd10_code_assigner import ICD10CodeAssigner
+from long_note_summarizer import LongNoteSummarizer
 from output_structurer import OutputStructurer
+from text_analysis import AnalyzedText, analyze
+from telemetry import DECODER_STEPS, ERRORS, FALLBACKS, time_stage
+from triage_router import TriageRouter
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from corpus_dataset import CorpusDataset
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,74 +27,123 @@ logger = logging.getLogger(__name__)
 class AutomatedWorkflowPipeline:
     """Orchestrate the complete pipeline from data input to output storage"""
 
-    def __init__(self):
-        self.data_prep = DataPreparationPipeline()
-        self.hf_model = HuggingFaceModelConnector()
+    def __init__(self, model_connector: Optional[HuggingFaceModelConnector] = None,
+                 router: Optional[TriageRouter] = None, summarizer: Optional[LongNoteSummarizer] = None):
+        image_features = None
+        if os.environ.get("EHR_IMAGE_FEATURES"):
+            from image_feature_cache import ImageFeatureCache  # pulls in numpy; only when configured
+            image_features = ImageFeatureCache.from_env()
+        self.data_prep = DataPreparationPipeline(image_features)
+        self.hf_model = model_connector or create_backend()  # EHR_MODEL_BACKEND, default hf
         self.output_structurer = OutputStructurer()
         self.icd_assigner = ICD10CodeAssigner(None)
-        self.results = []
+        self.router = router or TriageRouter.from_env(self.icd_assigner.icd_mapping)
+        self.summarizer = summarizer or LongNoteSummarizer.from_env(self.hf_model)  # patients with note_text
+        self.results: List[ClinicalRecord] = []  # compact records; to_dicts(self.results) for the usual dicts
         logger.info("✅ Workflow pipeline initialized")
 
     def process_patient(self, patient_data: Dict) -> Optional[Dict]:
         """Process single patient through entire pipeline"""
+        record = self.process_patient_record(patient_data)
+        return record.to_dict() if record is not None else None
+
+    def process_patient_record(self, patient_data: Dict) -> Optional[ClinicalRecord]:
+        """process_patient, returning the compact ClinicalRecord (to_dict() gives the usual result)"""
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
         try:
             # Prepare data
-            patient_json = self.data_prep.prepare_patient_json(patient_data)
+            with time_stage('prepare', timings):
+                patient_json = self.data_prep.prepare_patient_json(patient_data)
 
             # Format for model
-            prompt = self.data_prep.format_for_model(patient_json)
-
-            # Generate clinical note
-            logger.info(f"Generating clinical note for {patient_json.get('PatientName')}...")
-            clinical_text = self.hf_model.generate_clinical_output(prompt)
-
-            # Check if output is valid and not too short or repetitive
-            if not clinical_text or len(clinical_text) < 50 or self._is_too_repetitive(clinical_text):
-                clinical_text = self._generate_professional_note(patient_json)
+            with time_stage('format', timings):
+                prompt = self.data_prep.format_for_model(patient_json)
+
+            # Routine encounters skip the model (triage_router.py); the rest are generated.
+            # A full note (note_text) is summarized chunk by chunk instead (long_note_summarizer.py)
+            route = generation = long_note = None
+            note_text = patient_data.get('note_text')
+            if note_text and self.summarizer is not None and self.hf_model.generator is not None:
+                long_note = note_text
+            elif self.router is not None and self.hf_model.generator is not None:
+                with time_stage('triage', timings):
+                    route = self.router.route(patient_json)
+
+            if route is not None and route['path'] == 'template':
+                with time_stage('template', timings):
+                    clinical_text = self._generate_professional_note(patient_json)
+                note_source = 'template'
+                analysis = AnalyzedText(clinical_text)
+            else:
+                # Generate clinical note
+                logger.info(f"Generating clinical note for {patient_json.get('PatientName')}...")
+                summary = None
+                with time_stage('generate', timings):
+                    if long_note is not None:
+                        context = f"Patient: {patient_json.get('Age')}yo {patient_json.get('Gender')}"
+                        clinical_text, summary = self.summarizer.summarize(long_note, context)
+                    else:
+                        clinical_text = self.hf_model.generate_clinical_output(prompt)
+
+                # Check if output is valid and not too short or repetitive; the note is analyzed
+                # once here and the repetition check and ICD coding reuse that analysis
+                note_source = 'model'
+                analysis = AnalyzedText(clinical_text) if clinical_text else None
+                if not clinical_text or len(clinical_text) < 50 or self._is_too_repetitive(analysis):
+                    with time_stage('fallback', timings):
+                        clinical_text = self._generate_professional_note(patient_json)
+                    note_source = 'template'
+                    analysis = AnalyzedText(clinical_text)
+                    FALLBACKS.inc()
+
+                # Decoder work per outcome; aborted and discarded steps are the waste the guard cuts
+                generation = self.hf_model.last_generation() if summary is None or summary['reduced'] else None
+                if generation is not None:
+                    outcome = 'aborted' if generation['aborted'] else 'discarded' if note_source == 'template' else 'kept'
+                    DECODER_STEPS.inc(generation['decoder_steps'], outcome=outcome)
+                if summary is not None:
+                    generation = {**(generation or {}), 'long_note': summary}
+                if route is not None:
+                    self.router.record(route, note_source == 'template', timings['generate'])
 
             # Parse and structure output with accuracy scoring
-            model_output = self.output_structurer.parse_model_response(
-                clinical_text,
-                patient_json.get('Symptoms', ''),
-                self.icd_assigner
-            )
+            with time_stage('coding', timings):
+                model_output = self.output_structurer.parse_model_response(
+                    analysis,
+                    patient_json.get('Symptoms', ''),
+                    self.icd_assigner
+                )
 
             # Create final output
-            final_output = self.output_structurer.create_final_output(
-                patient_json,
-                model_output
-            )
+            with time_stage('structure', timings):
+                record = self.output_structurer.create_record(patient_json, model_output)
+            record.stage_timings = tuple(timings.items())
+            record.note_source = note_source
+            record.route = route
+            record.generation = generation
+            record.processing_time_ms = round((time.perf_counter() - start) * 1000.0, 3)
 
-            self.results.append(final_output)
-            return final_output
+            self.results.append(record)
+            return record
 
         except Exception as e:
+            ERRORS.inc(component='pipeline')
             logger.error(f"Error processing patient: {e}")
             return None
 
-    def _is_too_repetitive(self, text: str, threshold: float = 0.25) -> bool:
+    def _is_too_repetitive(self, text: Union[str, AnalyzedText], threshold: float = 0.25) -> bool:
         """Check if text has too much repetition"""
         if not text or len(text) < 20:
             return True
 
-        sentences = [s.strip() for s in text.split('.') if s.strip()]
-        if len(sentences) < 2:
+        # Same ratios the repetition guard applies during decoding
+        repetition_ratio, word_repetition, sentences, words = analyze(text).repetition_ratios()
+        if sentences < 2:
             return False
 
-        # Check for repeated sentences
-        unique_sentences = len(set(sentences))
-        repetition_ratio = 1 - (unique_sentences / len(sentences))
-
-        # Check for repeated phrases
-        words = text.lower().split()
-        if len(words) > 0:
-            unique_words = len(set(words))
-            word_repetition = 1 - (unique_words / len(words))
-
-            # If either metric shows high repetition, flag it
-            return repetition_ratio > threshold or word_repetition > 0.5
-
-        return repetition_ratio > threshold
+        # If either metric shows high repetition, flag it
+        return repetition_ratio > threshold or word_repetition > 0.5
 
     def _generate_professional_note(self, patient_json: Dict) -> str:
         """Generate a well-structured professional clinical note"""
@@ -130,42 +187,59 @@ Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
         return note
 
-    def process_batch(self, patient_list: List[Dict]) -> pd.DataFrame:
-        """Process multiple patients"""
-        logger.info(f"\n🔄 PROCESSING {len(patient_list)} PATIENTS\n")
+    def process_batch(self, patient_list: Union[List[Dict], 'CorpusDataset']) -> 'pd.DataFrame':
+        """Process multiple patients: a list of patient dicts, or a CorpusDataset (optionally filtered) read directly"""
+        import pandas as pd
+        from tqdm import tqdm
+
+        if hasattr(patient_list, 'iter_patients'):
+            # Streamed from Parquet in batches; the corpus is never materialized as a list
+            total, patients = patient_list.count(), patient_list.iter_patients()
+        else:
+            total, patients = len(patient_list), patient_list
+
+        logger.info(f"\n🔄 PROCESSING {total} PATIENTS\n")
         results = []
 
-        for idx, patient in enumerate(tqdm(patient_list, desc="Processing patients")):
-            logger.info(f"[{idx+1}/{len(patient_list)}] Processing {patient.get('name')}...")
-            result = self.process_patient(patient)
-            if result:
-                results.append(result)
+        for idx, patient in enumerate(tqdm(patients, total=total, desc="Processing patients")):
+            logger.info(f"[{idx+1}/{total}] Processing {patient.get('name')}...")
+            record = self.process_patient_record(patient)
+            if record is not None:
+                results.append(record)
 
-        return pd.DataFrame(results)
+        return pd.DataFrame(to_dicts(results))
 
-    def save_results(self, output_folder: str) -> pd.DataFrame:
+    def save_results(self, output_folder: str) -> 'pd.DataFrame':
         """Save all results to files"""
-        os.makedirs(output_folder, exist_ok=True)
-
-        logger.info(f"\n💾 SAVING RESULTS TO {output_folder}")
-
-        # Save individual patient results
-        for idx, result in enumerate(self.results):
-            filename = f"{output_folder}/patient_{idx}_{result.get('PatientName', 'unknown')}.json"
-            with open(filename, 'w') as f:
-                json.dump(result, f, indent=2)
-            logger.info(f"✅ Saved: {filename}")
-
-        # Save batch results as CSV
-        df = pd.DataFrame(self.results)
-        csv_path = f"{output_folder}/batch_results.csv"
-        df.to_csv(csv_path, index=False)
-        logger.info(f"✅ Saved: {csv_path}")
-
-        # Save batch results as JSON
-        json_path = f"{output_folder}/batch_results.json"
-        with open(json_path, 'w') as f:
-            json.dump(self.results, f, indent=2)
-        logger.info(f"✅ Saved: {json_path}")
-
-        return df
\ No newline at end of file
+        return save_batch_results(self.results, output_folder)
+
+
+def save_batch_results(results: List[Union[ClinicalRecord, Dict]], output_folder: str) -> 'pd.DataFrame':
+    """Write per-patient JSON files plus batch_results.csv / batch_results.json (also used by shard_queue merge)"""
+    import pandas as pd
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    logger.info(f"\n💾 SAVING RESULTS TO {output_folder}")
+
+    # Save individual patient results
+    dicts = to_dicts(results)
+    for idx, result in enumerate(dicts):
+        filename = f"{output_folder}/patient_{idx}_{result.get('PatientName', 'unknown')}.json"
+        with open(filename, 'wb') as f:
+            f.write(dumps(result, indent=True))
+        logger.info(f"✅ Saved: {filename}")
+
+    # Save batch results as CSV
+    df = pd.DataFrame(dicts)
+    csv_path = f"{output_folder}/batch_results.csv"
+    df.to_csv(csv_path, index=False)
+    logger.info(f"✅ Saved: {csv_path}")
+
+    # Save batch results as JSON
+    json_path = f"{output_folder}/batch_results.json"
+    with open(json_path, 'wb') as f:
+        f.write(dumps_many(dicts, indent=True))
+    logger.info(f"✅ Saved: {json_path}")
+
+    return df
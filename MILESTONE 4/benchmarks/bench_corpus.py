@@ -0,0 +1,137 @@
+"""
+Corpus dataset: build cost, incremental rebuilds and filtered reads versus the CSV join.
+
+Writes a mapping.csv, note files and icd_lookup.csv shaped like MILESTONE 3/Data
+into a scratch directory (a share of rows labelled with a real ICD-10 code, the
+rest UNKNOWN), then times a full build, a rebuild with nothing changed, a rebuild
+after editing 1% of the notes, and loading the labelled rows: pandas reading the
+CSVs, joining the lookup and reading every note file, versus the Parquet dataset
+with the icd10 filter pushed down (as a pyarrow table and as a zero-copy DataFrame).
+
+    python bench_corpus.py --rows 20000 --notes 2000 --coded 0.1
+    python bench_corpus.py --mapping "../../MILESTONE 3/Data/mapping.csv" --data-root "../../MILESTONE 3"
+"""
+import argparse
+import csv
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from harness import add_baseline_args, measure, report, summarize_latencies
+from corpus_dataset import (DEFAULT_ICD_LOOKUP, DEFAULT_NOTES_DIR, UNKNOWN_CODE, CorpusDataset, build_dataset,
+                            coded_filter, read_icd_lookup)
+
+SUITE = "corpus"
+SENTENCES = ["This {age}-year-old {gender} presents with {complaint}.", "Vital signs are stable.",
+             "Lungs are clear to auscultation bilaterally.", "No acute distress noted on examination.",
+             "Plan to follow up in two weeks and return sooner if symptoms worsen."]
+
+
+def synthesize(workdir: Path, rows: int, notes: int, coded: float):
+    """mapping.csv + notes + icd_lookup.csv laid out like MILESTONE 3/Data"""
+    rng = random.Random(7)
+    lookup = workdir / "Data" / "icd_lookup.csv"
+    lookup.parent.mkdir(parents=True)
+    lookup.write_text(Path(DEFAULT_ICD_LOOKUP).read_text())
+    codes = list(read_icd_lookup(lookup))
+
+    notes_dir = workdir / "data" / "ehr_notes_processed"
+    notes_dir.mkdir(parents=True)
+    for i in range(1, notes + 1):
+        text = " ".join(s.format(age=rng.randint(18, 90), gender=rng.choice(["male", "female"]),
+                                 complaint=rng.choice(["fever and cough", "chest pain", "fatigue"]))
+                        for s in SENTENCES * rng.randint(2, 6))
+        (notes_dir / f"note_{i:04d}.txt").write_text(text)
+
+    mapping = workdir / "Data" / "mapping.csv"
+    with open(mapping, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_id", "image_path", "note_path", "diagnosis", "icd10"])
+        for i in range(1, rows + 1):
+            code = rng.choice(codes) if rng.random() < coded else UNKNOWN_CODE
+            writer.writerow([i, f"data/images_processed/COVID-{i}.png",
+                             f"data/ehr_notes_processed/note_{(i - 1) % notes + 1:04d}.txt", "", code])
+    return mapping, lookup, workdir, notes_dir
+
+
+def csv_join(mapping: Path, lookup: Path, data_root: Path, notes_dir: Path):
+    """What loading the labelled corpus meant before: read both CSVs, join, filter, read each note"""
+    import pandas as pd
+
+    df = pd.read_csv(mapping, dtype={"file_id": "int32", "icd10": str, "diagnosis": str}, keep_default_na=False)
+    df = df[df.icd10 != UNKNOWN_CODE].merge(pd.read_csv(lookup), how="left", left_on="icd10", right_on="icd10_code")
+
+    def read(note_path):
+        for path in (data_root / note_path, notes_dir / Path(note_path).name):
+            if path.is_file():
+                return path.read_text(encoding="utf-8", errors="ignore")
+        return None
+
+    df["note_text"] = df.note_path.map(read)
+    return df
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Synthetic mapping.csv rows")
+    parser.add_argument("--notes", type=int, default=2000, help="Synthetic note files (rows share them round-robin)")
+    parser.add_argument("--coded", type=float, default=0.1, help="Share of rows with a known ICD-10 code")
+    parser.add_argument("--mapping", default=None, help="Use a real mapping.csv instead of synthetic data")
+    parser.add_argument("--data-root", default=None, help="Directory the mapping's paths are relative to")
+    parser.add_argument("--iterations", type=int, default=10, help="Timed reads per variant")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if args.mapping:
+            mapping, lookup = Path(args.mapping), Path(DEFAULT_ICD_LOOKUP)
+            data_root = Path(args.data_root) if args.data_root else mapping.parent.parent
+            notes_dir = workdir / "notes"  # a copy: the incremental rebuild below edits notes
+            shutil.copytree(DEFAULT_NOTES_DIR, notes_dir)
+        else:
+            mapping, lookup, data_root, notes_dir = synthesize(workdir, args.rows, args.notes, args.coded)
+            print(f"📝 Wrote {args.rows} mapping rows and {args.notes} notes", flush=True)
+        output = workdir / "corpus"
+
+        def build():
+            return build_dataset(output, mapping, lookup, data_root, notes_dir)
+
+        stats = {}
+        elapsed = timed(lambda: stats.update(build()))
+        rows = stats["rows"]
+        results["build.full"] = summarize_latencies([elapsed], items_per_call=rows)
+        results["rebuild.unchanged"] = summarize_latencies([timed(build)], items_per_call=rows)
+
+        note_files = sorted(notes_dir.glob("note_*.txt"))[::100]  # only ever the scratch copies
+        for path in note_files:
+            path.write_text(path.read_text() + " Addendum.")
+        results["rebuild.1pct_notes_changed"] = summarize_latencies([timed(lambda: stats.update(build()))])
+        print(f"✔ builds done; editing {len(note_files)} notes rewrote {stats['parts_written']} part files", flush=True)
+
+        corpus = CorpusDataset(output).filter(coded_filter())
+        coded_rows = corpus.count()
+        results["read.csv_join"] = measure(lambda i: csv_join(mapping, lookup, data_root, notes_dir),
+                                           args.iterations, warmup=1, items_per_call=max(coded_rows, 1))
+        results["read.parquet_table"] = measure(lambda i: corpus.table(), args.iterations, warmup=1,
+                                                items_per_call=max(coded_rows, 1))
+        results["read.parquet_pandas"] = measure(lambda i: corpus.to_pandas(), args.iterations, warmup=1,
+                                                 items_per_call=max(coded_rows, 1))
+
+        size_mb = sum(p.stat().st_size for p in output.rglob("*.parquet")) / 1e6
+        print(f"\n💽 {size_mb:.1f} MB of Parquet for {rows} rows ({coded_rows} with a known code)")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Bulk export throughput: /records/export (streamed) versus paging through /records.
+
+Fills a scratch store, serves it from uvicorn on a background thread and
+downloads every record through each path with a streaming httpx client.
+ops/s is records per second; the table after it shows the bytes on the wire
+and the peak Python heap (server and client) of one download, which stays flat
+for the streamed exports as the store grows.
+
+    python bench_export.py --records 100000
+    python bench_export.py --records 20000 --variants ndjson ndjson.gzip csv.zstd
+"""
+import argparse
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from bench_record_store import make_records
+from harness import BENCH_DIR, add_baseline_args, measure, report
+
+sys.path.append(str(BENCH_DIR.parent / "cloud"))
+from record_store import RecordStore  # noqa: E402
+from records_api import MAX_PAGE_SIZE, router  # noqa: E402
+
+SUITE = "export"
+VARIANTS = ["paged_records", "ndjson", "ndjson.gzip", "ndjson.zstd", "csv", "csv.gzip", "parquet", "parquet.zstd"]
+
+
+def serve(app: FastAPI) -> tuple:
+    """Run app under uvicorn on a free port in a daemon thread; returns (server, base url)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def download(client: httpx.Client, variant: str) -> int:
+    """Fetch every record through one path; returns the number of bytes received"""
+    received = 0
+    if variant == "paged_records":
+        cursor, records = None, []
+        while True:
+            params = {"limit": MAX_PAGE_SIZE, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/records", params=params)
+            received += len(response.content)
+            page = response.json()
+            records.extend(page["records"])  # what a client of the list API ends up holding
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return received
+
+    fmt, _, compression = variant.partition(".")
+    with client.stream("GET", "/records/export", params={"format": fmt, "compression": compression or "none"}) as r:
+        for chunk in r.iter_bytes():
+            received += len(chunk)
+    return received
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000, help="Records in the scratch store")
+    parser.add_argument("--iterations", type=int, default=3, help="Timed downloads per variant")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    results, sizes = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RecordStore(Path(tmp) / "bench.db")
+        for offset in range(0, args.records, 20000):
+            store.insert_many(make_records(min(20000, args.records - offset), offset)).result()
+
+        app = FastAPI()
+        app.state.db = store
+        app.include_router(router)
+        server, url = serve(app)
+        with httpx.Client(base_url=url, timeout=600) as client:
+            for variant in args.variants:
+                results[variant] = measure(lambda i: download(client, variant), args.iterations, warmup=1,
+                                           items_per_call=args.records)
+                tracemalloc.start()
+                received = download(client, variant)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results[variant].update({"bytes": received, "peak_heap_kib": round(peak / 1024, 1)})
+                sizes[variant] = (received, peak)
+        server.should_exit = True
+        store.close()
+
+    print(f"\n{'variant':<20}{'MB on wire':>14}{'peak heap MB':>16}")
+    for variant, (received, peak) in sizes.items():
+        print(f"{variant:<20}{received / 1e6:>14.2f}{peak / 1e6:>16.2f}")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Image feature cache: build cost, incremental rebuilds and lookup versus decoding.
+
+Writes synthetic X-ray-like PNGs and a mapping.csv shaped like
+MILESTONE 3/Data/mapping.csv into a scratch directory, then times a full build
+per worker count, a rebuild with nothing changed, a rebuild after touching 1% of
+the images, and per-patient access: a cache lookup versus decoding the PNG.
+
+    python bench_image_features.py --images 2000 --size 512
+    python bench_image_features.py --mapping "../../MILESTONE 3/Data/mapping.csv" --image-root /data/milestone3
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from harness import add_baseline_args, measure, report, summarize_latencies
+from image_feature_cache import ImageFeatureCache, extract_features, read_mapping
+
+SUITE = "image_features"
+
+
+def synthesize(workdir: Path, count: int, size: int) -> Path:
+    """Gradient + two dark 'lung' ellipses + noise per image, and the mapping.csv that lists them"""
+    from PIL import Image
+
+    image_dir = workdir / "data" / "images_processed"
+    image_dir.mkdir(parents=True)
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:size, 0:size] / size
+    base = 60 + 140 * y
+    mapping = workdir / "mapping.csv"
+    with open(mapping, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_id", "image_path", "note_path", "diagnosis", "icd10"])
+        for i in range(1, count + 1):
+            lungs = sum(np.exp(-(((x - cx) / 0.13) ** 2 + ((y - 0.5) / 0.25) ** 2))
+                        for cx in (0.32 + rng.normal(0, 0.02), 0.68 + rng.normal(0, 0.02)))
+            pixels = base - 70 * lungs * rng.uniform(0.6, 1.0) + rng.normal(0, 12, (size, size))
+            name = f"data/images_processed/COVID-{i}.png"
+            Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(workdir / name)
+            writer.writerow([i, name, f"data/ehr_notes_processed/note_{i:04d}.txt", "", "UNKNOWN"])
+    return mapping
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=1000, help="Synthetic images to generate")
+    parser.add_argument("--size", type=int, default=512, help="Synthetic image width/height in pixels")
+    parser.add_argument("--mapping", default=None, help="Use a real mapping.csv instead of synthetic images")
+    parser.add_argument("--image-root", default=None, help="Directory the mapping's image paths are relative to")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--lookups", type=int, default=2000, help="Timed cache lookups")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if args.mapping:
+            mapping, image_root = Path(args.mapping), args.image_root
+        else:
+            mapping, image_root = synthesize(workdir, args.images, args.size), workdir
+            print(f"🖼️  Wrote {args.images} synthetic {args.size}px scans", flush=True)
+        paths = [path for _, path in read_mapping(mapping, image_root) if path.exists()]
+
+        for workers in args.workers:
+            cache = ImageFeatureCache(workdir / f"cache-{workers}")
+            elapsed = timed(lambda: cache.build(mapping, image_root, workers=workers))
+            results[f"build.workers={workers}"] = summarize_latencies([elapsed], items_per_call=len(paths))
+            print(f"✔ full build with {workers} worker(s): {elapsed / 1000:.2f}s", flush=True)
+
+        cache_dir = workdir / f"cache-{args.workers[-1]}"
+        cache = ImageFeatureCache(cache_dir)
+        results["rebuild.unchanged"] = summarize_latencies(
+            [timed(lambda: cache.build(mapping, image_root, workers=args.workers[-1]))], items_per_call=len(paths))
+
+        touched = paths[::100]
+        for path in touched:
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))
+        results["rebuild.1pct_changed"] = summarize_latencies(
+            [timed(lambda: cache.build(mapping, image_root, workers=args.workers[-1]))], items_per_call=len(touched))
+
+        reader = ImageFeatureCache(cache_dir)
+        file_ids = reader.file_ids()
+        results["lookup.signals"] = measure(lambda i: reader.signals(file_ids[i % len(file_ids)]), args.lookups)
+        results["lookup.vector"] = measure(lambda i: reader.get(file_ids[i % len(file_ids)]), args.lookups)
+        results["decode.png"] = measure(lambda i: extract_features(str(paths[i % len(paths)])),
+                                        min(200, len(paths)), warmup=5)
+
+        size_mb = (cache_dir / "features.npy").stat().st_size / 1e6
+        print(f"\n💽 features.npy: {size_mb:.1f} MB for {len(file_ids)} scans")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Cold import cost of each runtime profile, measured in fresh interpreters.
+
+Every target runs in its own `python -c` process: the script times the imports
+(and pipeline construction where the service does it at import/startup),
+then reports the wall time, peak RSS and which heavy ML packages ended up in
+sys.modules. ops/s is imports per second; the table after it shows memory.
+
+    python bench_import.py                     # lite targets only, never loads a model
+    python bench_import.py --targets all       # also times importing torch + transformers
+    python bench_import.py --check             # exit 1 if a lite target imports torch/transformers/pandas
+
+The "full" targets import the libraries but load no weights, so they are a lower
+bound on what EHR_MODEL_BACKEND=hf pays before the download/load even starts.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict
+
+from harness import BENCH_DIR, SRC_DIR, add_baseline_args, report, summarize_latencies
+
+SUITE = "import"
+CLOUD_DIR = BENCH_DIR.parent / "cloud"
+HEAVY_MODULES = ("torch", "transformers", "pandas", "numpy")
+
+# name -> (statement to time, extra environment, must stay free of HEAVY_MODULES)
+TARGETS: Dict[str, tuple] = {
+    "workflow_pipeline": ("import workflow_pipeline", {}, True),
+    "pipeline.template": ("from workflow_pipeline import AutomatedWorkflowPipeline\n"
+                          "from hf_model_connector import TemplateModelConnector\n"
+                          "AutomatedWorkflowPipeline(model_connector=TemplateModelConnector())", {}, True),
+    "cloud_app": ("import cloud_app", {}, True),
+    "app.lite": ("import app\napp.preload_pipeline()", {"EHR_PROFILE": "lite"}, True),
+    "app.stub": ("import app\napp.preload_pipeline()", {"EHR_MODEL_BACKEND": "stub"}, True),
+    "full.torch_transformers": ("import torch\nfrom transformers import pipeline", {}, False),
+}
+LITE_TARGETS = [name for name, (_, _, lite) in TARGETS.items() if lite]
+
+_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    status = dict(line.split(":", 1) for line in f)
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+    "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+    "modules": len(sys.modules)
+}}))
+"""
+
+
+def run_probe(name: str, workdir: str) -> Dict:
+    statement, env_overrides, _ = TARGETS[name]
+    env = {k: v for k, v in os.environ.items() if k not in ("EHR_PROFILE", "EHR_MODEL_BACKEND")}
+    env.update(env_overrides, PYTHONPATH=os.pathsep.join([str(CLOUD_DIR), str(SRC_DIR)]))
+    code = _PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                               capture_output=True, text=True, timeout=600)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=LITE_TARGETS, choices=list(TARGETS) + ["all"])
+    parser.add_argument("--iterations", type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument("--check", action="store_true",
+                        help="Fail if a lite target imports any of " + ", ".join(HEAVY_MODULES))
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+    targets = list(TARGETS) if "all" in args.targets else args.targets
+
+    results, violations = {}, []
+    with tempfile.TemporaryDirectory() as workdir:  # app/cloud_app open clinical_records.db in the cwd
+        for name in targets:
+            runs = [run_probe(name, workdir) for _ in range(args.iterations)]
+            results[name] = summarize_latencies([r["seconds"] * 1000.0 for r in runs])
+            results[name].update({
+                "peak_rss_mb": round(max(r["peak_rss_mb"] for r in runs), 1),
+                "modules": runs[-1]["modules"],
+                "heavy_modules": runs[-1]["heavy"]
+            })
+            if TARGETS[name][2] and runs[-1]["heavy"]:
+                violations.append((name, runs[-1]["heavy"]))
+            print(f"✔ {name}: {results[name]['p50_ms']:.0f} ms, {results[name]['peak_rss_mb']} MB", flush=True)
+
+    print(f"\n{'target':<26}{'peak RSS MB':>14}{'modules':>10}  heavy imports")
+    for name, r in results.items():
+        print(f"{name:<26}{r['peak_rss_mb']:>14.1f}{r['modules']:>10}  {', '.join(r['heavy_modules']) or '-'}")
+
+    exit_code = report(SUITE, results, args)
+    if args.check and violations:
+        for name, heavy in violations:
+            print(f"❌ {name} imported {', '.join(heavy)}")
+        return 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Long notes: map-reduce latency against note length, batched vs one-call-per-chunk map, and chunk cache re-runs.
+
+Summarizes real EHR_Processed_Notes with LongNoteSummarizer four ways:
+
+    batched      fresh cache, every chunk summarized in one summarize_batch call
+    sequential   fresh cache, one generator call per chunk (the map without batching)
+    rerun        the batched run again, unchanged notes (every chunk from the cache)
+    edited       the batched run again after appending a sentence to each note's last
+                 section (only the chunk holding it is regenerated)
+
+and reports p50/p95 per mode, overall and by note length in tokens.
+
+    python bench_long_notes.py                              # small random-weight T5, offline
+    python bench_long_notes.py --model google/flan-t5-base  # a real model from the hub cache
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from harness import add_baseline_args, report, summarize_latencies
+
+from bench_repetition_guard import BenchConnector, random_model
+from corpus_dataset import DEFAULT_NOTES_DIR
+from long_note_summarizer import ChunkSummaryCache, LongNoteSummarizer
+
+SUITE = "long_notes"
+LENGTH_BUCKETS = ((0, 512), (512, 1024), (1024, 2048), (2048, None))  # note tokens; the first fits the window
+EDIT = " Patient was re-examined at discharge and remains stable."
+
+
+class SequentialConnector(BenchConnector):
+    """The same model, but the map sends one chunk per generator call"""
+
+    def summarize_batch(self, prompts, max_length=80):
+        summarize = super().summarize_batch
+        return [summarize([prompt], max_length)[0] for prompt in prompts]
+
+
+def bucket_name(tokens: int) -> str:
+    for low, high in LENGTH_BUCKETS:
+        if high is None or tokens < high:
+            return f"{low}+" if high is None else f"{low}-{high}"
+
+
+def run(summarizer: LongNoteSummarizer, notes) -> list:
+    """(note tokens, ms, stats) per note"""
+    rows = []
+    for text in notes:
+        begin = time.perf_counter()
+        _, stats = summarizer.summarize(text)
+        rows.append((stats['note_tokens'], (time.perf_counter() - begin) * 1000.0, stats))
+    return rows
+
+
+def summarize_rows(rows) -> dict:
+    summary = summarize_latencies([ms for _, ms, _ in rows])
+    summary['chunks'] = sum(stats['chunks'] for _, _, stats in rows)
+    summary['generated_chunks'] = sum(stats['generated_chunks'] for _, _, stats in rows)
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Hub model id already in the local cache (default: random T5)")
+    parser.add_argument("--notes-dir", default=str(DEFAULT_NOTES_DIR))
+    parser.add_argument("--notes", type=int, default=24, help="Notes used, spread evenly over the length range")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.model:
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        model, tokenizer = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval(), AutoTokenizer.from_pretrained(args.model)
+    else:
+        model, tokenizer = random_model(4, 256)
+    notes = sorted((p.read_text(encoding='utf-8') for p in Path(args.notes_dir).glob("*.txt")), key=len)
+    step = max(len(notes) / args.notes, 1.0)
+    notes = [notes[int(i * step)] for i in range(min(args.notes, len(notes)))]
+
+    label = args.model or "random-t5"
+    batched = LongNoteSummarizer(BenchConnector(model, tokenizer, label), ChunkSummaryCache())
+    sequential = LongNoteSummarizer(SequentialConnector(model, tokenizer, label), ChunkSummaryCache())
+    run(LongNoteSummarizer(BenchConnector(model, tokenizer, label)), notes[-2:])  # warm-up, discarded
+    rows = {
+        'batched': run(batched, notes),
+        'sequential': run(sequential, notes),
+        'rerun': run(batched, notes),
+        'edited': run(batched, [note + EDIT for note in notes]),
+    }
+
+    results = {mode: summarize_rows(mode_rows) for mode, mode_rows in rows.items()}
+    print(f"\n{'note tokens':<14}{'notes':>6}{'chunks':>8}" + "".join(f"{mode + ' p50':>16}" for mode in rows))
+    for low, high in LENGTH_BUCKETS:
+        name = bucket_name(low)
+        picked = {mode: [row for row in mode_rows if bucket_name(row[0]) == name] for mode, mode_rows in rows.items()}
+        if not picked['batched']:
+            continue
+        for mode, mode_rows in picked.items():
+            results[f"{mode}[{name}]"] = summarize_rows(mode_rows)
+        chunks = results[f"batched[{name}]"]['chunks'] / len(picked['batched'])
+        print(f"{name:<14}{len(picked['batched']):>6}{chunks:>8.1f}"
+              + "".join(f"{results[f'{mode}[{name}]']['p50_ms']:>13.1f} ms" for mode in rows))
+    print(f"\nchunks regenerated: batched {results['batched']['generated_chunks']}, "
+          f"rerun {results['rerun']['generated_chunks']}, edited {results['edited']['generated_chunks']}")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
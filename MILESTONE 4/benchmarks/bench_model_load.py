@@ -0,0 +1,137 @@
+"""
+Model cold start: hub-style from_pretrained versus an offline snapshot (Src/model_snapshot.py).
+
+Each load runs in a fresh interpreter and reports the time to a usable model,
+the time of the first generate() call and the process memory split into
+anonymous (private, copied weights) and file-backed (mmap'd, shared page cache).
+
+    python bench_model_load.py                              # synthetic FLAN-T5-Large-shaped weights, offline
+    python bench_model_load.py --model google/flan-t5-large # the real model from the hub cache
+
+With the real model the "from_pretrained" variant is what HuggingFaceModelConnector
+did before snapshots. The synthetic model has the same architecture and size
+with random weights and a tiny tokenizer, so no download is needed. Pages stay in
+the OS cache between runs, so these are warm-cache numbers; the snapshot's
+advantage grows when the cache is cold because it only reads the pages it touches.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict
+
+from harness import SRC_DIR, add_baseline_args, report, summarize_latencies
+
+SUITE = "model_load"
+VARIANTS = ("from_pretrained", "snapshot")
+PROMPT = "Patient: 45yo Female\nChief Complaint: fever and cough\nImaging: Chest X-ray shows infiltrate"
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+sys.path.append({src!r})
+from model_snapshot import SnapshotGenerator, load_snapshot
+imported = time.perf_counter()
+if {variant!r} == "snapshot":
+    model, tokenizer, _ = load_snapshot({snapshot!r}, {model!r})
+else:
+    tokenizer = AutoTokenizer.from_pretrained({source!r})
+    model = AutoModelForSeq2SeqLM.from_pretrained({source!r}).eval()
+loaded = time.perf_counter()
+SnapshotGenerator(model, tokenizer)({prompt!r}, max_length=32, min_length=8, num_beams=2)
+generated = time.perf_counter()
+with open("/proc/self/status") as f:
+    status = dict(line.split(":", 1) for line in f)
+mb = lambda key: int(status[key].split()[0]) / 1024
+print(json.dumps({{"import_s": imported - start, "load_s": loaded - imported, "first_generate_s": generated - loaded,
+                  "rss_anon_mb": mb("RssAnon"), "rss_file_mb": mb("RssFile")}}))
+"""
+
+
+def build_synthetic(workdir: Path, layers: int) -> str:
+    """Random weights with the flan-t5-large architecture plus a small word-level tokenizer, saved hub-style"""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+    words = sorted(set(PROMPT.lower().replace(":", " ").split()))
+    vocab = {w: i for i, w in enumerate(["<pad>", "</s>", "<unk>"] + words)}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+
+    config = T5Config(vocab_size=32128, d_model=1024, d_ff=2816, num_layers=layers, num_decoder_layers=layers,
+                      num_heads=16, d_kv=64, feed_forward_proj="gated-gelu", tie_word_embeddings=False,
+                      decoder_start_token_id=0, pad_token_id=0, eos_token_id=1)
+    torch.manual_seed(0)
+    model = T5ForConditionalGeneration(config).eval()
+    source = workdir / "hub_format"
+    model.save_pretrained(source)
+    tokenizer.save_pretrained(source)
+    return str(source)
+
+
+def run_probe(variant: str, source: str, snapshot: str, model_name: str) -> Dict:
+    code = _PROBE.format(src=str(SRC_DIR), variant=variant, snapshot=snapshot, model=model_name,
+                         source=source, prompt=PROMPT)
+    env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_VERBOSITY="error")
+    completed = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=1800)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{variant} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Hub model id already in the local cache (default: synthetic)")
+    parser.add_argument("--layers", type=int, default=24, help="Encoder/decoder layers of the synthetic model")
+    parser.add_argument("--iterations", type=int, default=3, help="Fresh interpreters per variant")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    sys.path.append(str(SRC_DIR))
+    from model_snapshot import create_snapshot
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if args.model:
+            source, model_name = args.model, args.model
+            create_snapshot(model_name, str(workdir / "snapshots"))
+        else:
+            model_name = "synthetic/flan-t5-large-shaped"
+            source = build_synthetic(workdir, args.layers)
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+            create_snapshot(model_name, str(workdir / "snapshots"),
+                            model=AutoModelForSeq2SeqLM.from_pretrained(source),
+                            tokenizer=AutoTokenizer.from_pretrained(source))
+        snapshot = str(workdir / "snapshots")
+        print(f"📦 Snapshot ready for {model_name}", flush=True)
+
+        results, runs = {}, {}
+        for variant in args.variants:
+            runs[variant] = [run_probe(variant, source, snapshot, model_name) for _ in range(args.iterations)]
+            for stage in ("load_s", "first_generate_s"):
+                results[f"{variant}.{stage[:-2]}"] = summarize_latencies([r[stage] * 1000.0 for r in runs[variant]])
+            results[f"{variant}.cold_start"] = summarize_latencies(
+                [(r["load_s"] + r["first_generate_s"]) * 1000.0 for r in runs[variant]])
+            results[f"{variant}.cold_start"].update({
+                "rss_anon_mb": round(max(r["rss_anon_mb"] for r in runs[variant]), 1),
+                "rss_file_mb": round(max(r["rss_file_mb"] for r in runs[variant]), 1)
+            })
+            print(f"✔ {variant}: cold start {results[f'{variant}.cold_start']['p50_ms'] / 1000:.2f}s", flush=True)
+
+    print(f"\n{'variant':<20}{'anon MB':>12}{'file-backed MB':>16}")
+    for variant in runs:
+        r = results[f"{variant}.cold_start"]
+        print(f"{variant:<20}{r['rss_anon_mb']:>12.1f}{r['rss_file_mb']:>16.1f}")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Stage-level and end-to-end benchmarks for the clinical documentation pipeline.
+
+Runs fully offline: generation goes through StubModelConnector, a deterministic
+stand-in for FLAN-T5. Usage:
+
+    python bench_pipeline.py --save-baseline      # record a baseline
+    python bench_pipeline.py                      # compare against it (exit 1 on regression)
+"""
+import argparse
+import logging
+import sys
+
+from harness import add_baseline_args, measure, report
+from synthetic_patients import generate_patients
+
+from data_preparation import DataPreparationPipeline
+from icd10_code_assigner import ICD10CodeAssigner
+from output_structurer import OutputStructurer
+from stub_model_connector import StubModelConnector, StubTextGenerator
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "pipeline"
+
+
+def run_suite(iterations: int, patient_count: int, batch_size: int, latency_ms: float) -> dict:
+    patients = generate_patients(patient_count)
+    data_prep = DataPreparationPipeline()
+    structurer = OutputStructurer()
+    connector = StubModelConnector(latency_ms=latency_ms)
+    raw_generator = StubTextGenerator(repetition_rate=0.5)
+
+    # Precompute each stage's inputs so every microbenchmark times only its own stage
+    prepared = [data_prep.prepare_patient_json(p) for p in patients]
+    prompts = [data_prep.format_for_model(p) for p in prepared]
+    raw_texts = [raw_generator(p)[0]['generated_text'] for p in prompts]
+    notes = [connector.generate_clinical_output(p) for p in prompts]
+    assigner = ICD10CodeAssigner(None)
+    parsed = [structurer.parse_model_response(n, p['Symptoms'], assigner) for n, p in zip(notes, prepared)]
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    results = {}
+    results['prepare_patient_json'] = measure(
+        lambda i: data_prep.prepare_patient_json(pick(patients, i)), iterations)
+    results['format_for_model'] = measure(
+        lambda i: data_prep.format_for_model(pick(prepared, i)), iterations)
+    results['generate_clinical_output'] = measure(
+        lambda i: connector.generate_clinical_output(pick(prompts, i)), iterations)
+    results['_aggressive_remove_repetitions'] = measure(
+        lambda i: connector._aggressive_remove_repetitions(pick(raw_texts, i)), iterations)
+
+    coding_assigner = ICD10CodeAssigner(None)
+    results['assign_codes_with_accuracy'] = measure(
+        lambda i: coding_assigner.assign_codes_with_accuracy(pick(notes, i), pick(prepared, i)['Symptoms']),
+        iterations)
+    results['create_final_output'] = measure(
+        lambda i: structurer.create_final_output(pick(prepared, i), pick(parsed, i)), iterations)
+
+    pipeline = AutomatedWorkflowPipeline(model_connector=connector)
+    wrapped = patients * 2
+
+    def end_to_end(i):
+        pipeline.process_patient(pick(patients, i))
+        pipeline.results.clear()
+
+    def end_to_end_batch(i):
+        start = (i * batch_size) % len(patients)
+        pipeline.process_batch(wrapped[start:start + batch_size])
+        pipeline.results.clear()
+
+    results['end_to_end.process_patient'] = measure(end_to_end, iterations)
+    results['end_to_end.process_batch'] = measure(
+        end_to_end_batch, max(iterations // batch_size, 5), warmup=1, items_per_call=batch_size)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="Timed calls per microbenchmark")
+    parser.add_argument("--patients", type=int, default=200, help="Synthetic patients to cycle through")
+    parser.add_argument("--batch-size", type=int, default=25, help="Patients per process_batch call")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0,
+                        help="Simulated model latency per generation")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    # Keep per-patient INFO logs out of the timed loops
+    logging.disable(logging.INFO)
+
+    results = run_suite(args.iterations, args.patients, args.batch_size, args.stub_latency_ms)
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Worker-count scaling: `uvicorn --workers N` versus cloud/prefork_server.py.
+
+For each worker count and mode it starts the service in a scratch directory,
+waits until N distinct worker pids answer /health, then records startup time,
+the memory of the whole process tree (sum of PSS), the largest private memory
+of any child process and closed-loop throughput from load_test.LoadGenerator.
+
+    python bench_prefork.py --workers 1 2 4                  # stub backend
+    python bench_prefork.py --backend hf --workers 1 2 4     # real FLAN-T5 (downloads it once)
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from harness import BASELINE_DIR, environment_info
+from load_test import CLOUD_DIR, LoadGenerator, _free_port, build_report
+from synthetic_patients import generate_patients
+
+sys.path.append(str(CLOUD_DIR.parent / "Src"))
+from telemetry import process_memory  # noqa: E402
+
+MODES = ("uvicorn", "prefork")
+
+
+def descendants(pid: int) -> List[int]:
+    """Every live descendant of pid, from /proc"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def start_service(mode: str, workers: int, backend: str, stub_latency_ms: float):
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix=f"ehr-{mode}-")
+    env = dict(os.environ, EHR_MODEL_BACKEND=backend, EHR_STUB_LATENCY_MS=str(stub_latency_ms))
+    if mode == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", str(CLOUD_DIR),
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, str(CLOUD_DIR / "prefork_server.py"), "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+        env["PYTHONPATH"] = str(CLOUD_DIR)
+    log = open(Path(workdir) / "server.log", "w")
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}", log.name
+
+
+def wait_for_workers(process, url: str, workers: int, timeout: float) -> float:
+    """Seconds until workers distinct pids have answered /health (new connection per probe)"""
+    start = time.perf_counter()
+    pids = set()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("Service exited during startup")
+        try:
+            health = httpx.get(f"{url}/health", timeout=2.0).json()
+            if health.get("status") == "healthy":
+                pids.add(health["process"]["pid"])
+                if len(pids) >= workers:
+                    return time.perf_counter() - start
+        except (httpx.HTTPError, ValueError, KeyError):
+            time.sleep(0.1)
+    raise RuntimeError(f"Only {len(pids)}/{workers} workers answered within {timeout}s")
+
+
+def measure_config(mode: str, workers: int, args) -> Dict:
+    process, url, log_path = start_service(mode, workers, args.backend, args.stub_latency_ms)
+    try:
+        startup = wait_for_workers(process, url, workers, args.startup_timeout)
+        tree = [process.pid] + descendants(process.pid)
+        memory = {pid: process_memory(pid) for pid in tree}
+        generator = LoadGenerator(url, generate_patients(200), batch_size=10, batch_ratio=0.0,
+                                  timeout=120.0, seed=7)
+        elapsed = asyncio.run(generator.run_closed_loop(args.concurrency, args.duration, None))
+        load = build_report(generator.recorder, elapsed, {})
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    endpoint = load["endpoints"].get("/process_patient", {})
+    return {
+        "mode": mode,
+        "workers": workers,
+        "startup_seconds": round(startup, 2),
+        "total_pss_mb": round(sum(m.get("pss_mb", 0.0) for m in memory.values()), 1),
+        "worker_private_mb": max((memory[pid].get("private_mb", 0.0) for pid in tree[1:]), default=0.0),
+        "processes": len(tree),
+        "requests_per_sec": load["throughput_rps"],
+        "p50_ms": endpoint.get("p50_ms"),
+        "p99_ms": endpoint.get("p99_ms"),
+        "error_rate": load["error_rate"],
+        "log": log_path
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--backend", default="stub", choices=["stub", "hf"])
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per configuration")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", default=str(BASELINE_DIR / "prefork.latest.json"))
+    args = parser.parse_args()
+
+    rows = []
+    for workers in args.workers:
+        for mode in args.modes:
+            row = measure_config(mode, workers, args)
+            rows.append(row)
+            print(f"✔ {mode} x{workers}: ready in {row['startup_seconds']}s, {row['total_pss_mb']} MB PSS", flush=True)
+
+    print(f"\n{'mode':<10}{'workers':>8}{'startup s':>11}{'PSS MB':>10}{'worker priv MB':>16}"
+          f"{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in rows:
+        print(f"{r['mode']:<10}{r['workers']:>8}{r['startup_seconds']:>11.2f}{r['total_pss_mb']:>10.1f}"
+              f"{r['worker_private_mb']:>16.1f}{r['requests_per_sec']:>10.2f}{r['p50_ms'] or 0:>10.2f}"
+              f"{r['p99_ms'] or 0:>10.2f}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"suite": "prefork", "environment": environment_info(),
+                                  "config": vars(args), "results": rows}, indent=2))
+    print(f"\n💾 Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
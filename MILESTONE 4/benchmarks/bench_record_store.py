@@ -0,0 +1,125 @@
+"""
+Insert latency of the SQLite record store as the history grows.
+
+At each checkpoint (store size) it times single committed inserts, the
+throughput of concurrent writers sharing the group-committing writer thread,
+and full-text searches. Latency should stay flat from an empty store to
+millions of records.
+
+    python bench_record_store.py --checkpoints 0 100000 1000000
+    python bench_record_store.py --compare-tinydb     # also time TinyDB at small sizes
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from harness import BENCH_DIR, add_baseline_args, measure, report, summarize_latencies
+from synthetic_patients import generate_patients
+
+sys.path.append(str(BENCH_DIR.parent / "cloud"))
+from record_store import RecordStore  # noqa: E402
+
+SUITE = "record_store"
+CODES = ['J18.9', 'I10', 'E11.9', 'R50.9', 'R05.9', 'R06.02', 'R07.9', 'Z00.00']
+SEARCH_QUERIES = ['pneumonia', '"chest pain"', 'dysp*', 'fever AND cough', 'symptoms:headache']
+
+
+def make_records(count: int, offset: int = 0) -> list:
+    patients = generate_patients(min(count, 1000) or 1, seed=offset)
+    return [{
+        "id": f"Patient_{offset + i}",
+        "timestamp": f"2025-11-{1 + (offset + i) % 28:02d}T12:00:{(offset + i) % 60:02d}",
+        "patient": {"Symptoms": patients[i % len(patients)]["symptoms"], **patients[i % len(patients)]},
+        "note": f"Patient presents with {patients[i % len(patients)]['symptoms']}. "
+                f"{patients[i % len(patients)]['scan_result']}. Plan: follow-up in 2 weeks.",
+        "icd": {"code": CODES[(offset + i) % len(CODES)], "description": "", "confidence": 88.0 + (i % 10),
+                "evidence": {}}
+    } for i in range(count)]
+
+
+def concurrent_throughput(store: RecordStore, writers: int, per_writer: int, offset: int) -> dict:
+    records = make_records(per_writer, offset)
+    latencies = []
+    lock = threading.Lock()
+
+    def writer():
+        local = []
+        for record in records:
+            start = time.perf_counter()
+            store.insert(record).result()
+            local.append((time.perf_counter() - start) * 1000.0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    summary = summarize_latencies(latencies)
+    summary['ops_per_sec'] = round(len(latencies) / elapsed, 2)
+    return summary
+
+
+def bench_tinydb(sizes, samples: int) -> dict:
+    from tinydb import TinyDB
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = TinyDB(Path(tmp) / "clinical_records.json")
+        for size in sizes:
+            missing = size - len(db)
+            if missing > 0:
+                db.insert_multiple(make_records(missing))
+            records = make_records(samples, size)
+            results[f"tinydb.insert@{size}"] = measure(lambda i: db.insert(records[i]), samples, warmup=0)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[0, 10000, 100000, 250000],
+                        help="Store sizes at which to measure")
+    parser.add_argument("--samples", type=int, default=500, help="Timed single inserts per checkpoint")
+    parser.add_argument("--writers", type=int, default=8, help="Concurrent writer threads")
+    parser.add_argument("--compare-tinydb", action="store_true", help="Also time TinyDB up to 5,000 records")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RecordStore(Path(tmp) / "bench.db")
+        size = 0
+        for checkpoint in sorted(args.checkpoints):
+            while size < checkpoint:
+                chunk = min(20000, checkpoint - size)
+                store.insert_many(make_records(chunk, size)).result()
+                size += chunk
+
+            records = make_records(args.samples, size)
+            results[f"sqlite.insert@{checkpoint}"] = measure(
+                lambda i: store.insert(records[i]).result(), args.samples, warmup=0)
+            results[f"sqlite.concurrent_insert@{checkpoint}"] = concurrent_throughput(
+                store, args.writers, max(args.samples // args.writers, 1), size)
+            if store.fts_enabled:
+                for order in ("relevance", "recent"):
+                    results[f"sqlite.search_{order}@{checkpoint}"] = measure(
+                        lambda i: store.search(SEARCH_QUERIES[i % len(SEARCH_QUERIES)], limit=20, order=order),
+                        max(args.samples // 10, len(SEARCH_QUERIES)), warmup=len(SEARCH_QUERIES))
+            size = store.count()
+            print(f"✔ checkpoint {checkpoint:,}: store holds {size:,} records")
+        store.close()
+
+    if args.compare_tinydb:
+        results.update(bench_tinydb([s for s in (0, 1000, 5000)], min(args.samples, 200)))
+
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
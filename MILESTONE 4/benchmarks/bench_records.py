@@ -0,0 +1,95 @@
+"""
+Result records: memory held per processed patient and serialization throughput, nested dicts versus ClinicalRecord.
+
+Runs the same synthetic patients through AutomatedWorkflowPipeline (stub model)
+twice, keeping every result: once as the dicts process_patient returns, once as
+the ClinicalRecords process_patient_record returns. It reports the traced memory
+per kept result (tracemalloc), then times encoding each result to JSON bytes:
+json.dumps of the dict (today's path), to_json_bytes() with orjson when installed,
+to_json_bytes() forced onto json, and to_dict() alone (what the API layer pays).
+
+    python bench_records.py --patients 2000
+"""
+import argparse
+import gc
+import json
+import logging
+import sys
+import tracemalloc
+
+from harness import add_baseline_args, measure, report
+from synthetic_patients import generate_patients
+
+import clinical_records
+from stub_model_connector import StubModelConnector
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "records"
+
+
+def retained_bytes(process, patients) -> float:
+    """Traced memory per result still held after processing every patient"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = [process(patient) for patient in patients]
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(kept) == len(patients)
+    return (after - before) / len(patients)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=5000, help="Encodings timed per serializer")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    pipeline = AutomatedWorkflowPipeline(model_connector=StubModelConnector())
+    pipeline.router = None
+    patients = generate_patients(args.patients)
+
+    def as_dict(patient):
+        result = pipeline.process_patient(patient)
+        pipeline.results.clear()
+        return result
+
+    def as_record(patient):
+        record = pipeline.process_patient_record(patient)
+        pipeline.results.clear()
+        return record
+
+    memory = {'dict': retained_bytes(as_dict, patients), 'record': retained_bytes(as_record, patients)}
+
+    records = [as_record(patient) for patient in patients[:500]]
+    dicts = [record.to_dict() for record in records]
+    assert all(json.loads(r.to_json_bytes()) == json.loads(json.dumps(d)) for r, d in zip(records, dicts))
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    orjson = clinical_records.orjson
+    results = {
+        'json.dumps(dict)': measure(lambda i: json.dumps(pick(dicts, i)).encode('utf-8'), args.iterations),
+        'record.to_dict': measure(lambda i: pick(records, i).to_dict(), args.iterations),
+    }
+    if orjson is not None:
+        results['record.to_json_bytes[orjson]'] = measure(lambda i: pick(records, i).to_json_bytes(), args.iterations)
+    clinical_records.orjson = None
+    try:
+        results['record.to_json_bytes[json]'] = measure(lambda i: pick(records, i).to_json_bytes(), args.iterations)
+    finally:
+        clinical_records.orjson = orjson
+
+    results['json.dumps(dict)']['bytes_per_result'] = round(memory['dict'])
+    results['record.to_dict']['bytes_per_result'] = round(memory['record'])
+    print(f"\n🧠 Memory per kept result: dict {memory['dict']:.0f} B, ClinicalRecord {memory['record']:.0f} B "
+          f"({memory['dict'] / memory['record']:.2f}x smaller)")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
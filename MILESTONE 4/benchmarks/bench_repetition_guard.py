@@ -0,0 +1,120 @@
+"""
+Repetition guard: decoder steps and time spent on notes that end up discarded, with and without early abort.
+
+Runs synthetic patients through AutomatedWorkflowPipeline (triage off) twice,
+EHR_REPETITION_GUARD=off then on, and reports per-patient latency, the template
+fallback rate and decoder steps split into kept / discarded / aborted.
+
+    python bench_repetition_guard.py                              # small random-weight T5, offline
+    python bench_repetition_guard.py --model google/flan-t5-base  # a real model from the hub cache
+
+The default model has random weights and a word-level tokenizer, so almost every
+generation degenerates: it shows what the guard saves per degenerate note, not
+how often FLAN-T5 degenerates. Use --model for the real abort rate.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from harness import add_baseline_args, report, summarize_latencies
+from synthetic_patients import SCAN_RESULTS, SYMPTOMS, generate_patients
+
+from hf_model_connector import HuggingFaceModelConnector
+from model_snapshot import SnapshotGenerator
+from telemetry import DECODER_STEPS, GENERATION_ABORTS
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "repetition_guard"
+
+
+def random_model(layers: int, d_model: int):
+    """Random-weight T5 with a word-level tokenizer over the synthetic patients' vocabulary"""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+    text = " ".join(SYMPTOMS + SCAN_RESULTS + ["patient presents with exam assessment plan follow up ."])
+    words = sorted(set(text.lower().replace(",", " ").replace(":", " ").split()))
+    vocab = {w: i for i, w in enumerate(["<pad>", "</s>", "<unk>"] + words)}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    backend.decoder = decoders.WordPiece()  # joins words with spaces
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+
+    torch.manual_seed(0)
+    config = T5Config(vocab_size=len(vocab), d_model=d_model, d_ff=d_model * 2, num_layers=layers,
+                      num_decoder_layers=layers, num_heads=8, d_kv=d_model // 8,
+                      decoder_start_token_id=0, pad_token_id=0, eos_token_id=1)
+    return T5ForConditionalGeneration(config).eval(), tokenizer
+
+
+class BenchConnector(HuggingFaceModelConnector):
+    """HuggingFaceModelConnector around an already-loaded model"""
+
+    def __init__(self, model, tokenizer, label: str):
+        self._model, self._tokenizer, self._label = model, tokenizer, label
+        super().__init__()
+
+    def initialize_models(self):
+        self.generator = SnapshotGenerator(self._model, self._tokenizer)
+        self.model_type = self._label
+
+
+def steps(outcome: str) -> float:
+    return DECODER_STEPS.value(outcome=outcome)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Hub model id already in the local cache (default: random T5)")
+    parser.add_argument("--layers", type=int, default=4, help="Encoder/decoder layers of the random model")
+    parser.add_argument("--d-model", type=int, default=256, help="Hidden size of the random model")
+    parser.add_argument("--patients", type=int, default=30, help="Synthetic patients per mode")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.model:
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        model, tokenizer = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval(), AutoTokenizer.from_pretrained(args.model)
+    else:
+        model, tokenizer = random_model(args.layers, args.d_model)
+    pipeline = AutomatedWorkflowPipeline(model_connector=BenchConnector(model, tokenizer, args.model or "random-t5"))
+    pipeline.router = None  # every patient goes through generation
+    patients = generate_patients(args.patients)
+
+    results, table = {}, []
+    for mode in ("off", "on"):
+        os.environ["EHR_REPETITION_GUARD"] = mode
+        before = {outcome: steps(outcome) for outcome in ("kept", "discarded", "aborted")}
+        latencies, fallbacks, start = [], 0, time.perf_counter()
+        for patient in patients:
+            begin = time.perf_counter()
+            result = pipeline.process_patient(patient)
+            latencies.append((time.perf_counter() - begin) * 1000.0)
+            fallbacks += result['metadata']['note_source'] == 'template'
+        elapsed = time.perf_counter() - start
+        pipeline.results.clear()
+
+        spent = {outcome: steps(outcome) - before[outcome] for outcome in before}
+        results[f"guard={mode}"] = summarize_latencies(latencies)
+        results[f"guard={mode}"].update({
+            'patients_per_s': round(len(patients) / elapsed, 3),
+            'fallback_rate': round(fallbacks / len(patients), 4),
+            'decoder_steps': spent
+        })
+        table.append((mode, len(patients) / elapsed, fallbacks / len(patients), spent))
+
+    print(f"\n{'guard':<8}{'patients/s':>12}{'fallback %':>12}{'kept steps':>12}{'discarded':>12}{'aborted':>10}")
+    for mode, rate, fallback, spent in table:
+        print(f"{mode:<8}{rate:>12.2f}{fallback * 100:>12.1f}{spent['kept']:>12.0f}{spent['discarded']:>12.0f}"
+              f"{spent['aborted']:>10.0f}")
+    aborts = {reason: GENERATION_ABORTS.value(reason=reason) for reason in ("sentences", "words")}
+    print(f"\n✂️  Aborts by signal: {aborts}")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
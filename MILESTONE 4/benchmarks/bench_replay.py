@@ -0,0 +1,83 @@
+"""
+Record / replay backends: does the pipeline behave the same on replayed generations as on the live model?
+
+Runs synthetic patients through AutomatedWorkflowPipeline (triage off) on a live
+model wrapped by RecordingModelConnector, then on ReplayModelConnector over that
+recording, twice: once for the same patients (every prompt recorded) and once for
+new patients (prompts never recorded, served by hash). It reports per-patient latency,
+template fallback rate and the replay hit rate for each run.
+
+    python bench_replay.py                              # small random-weight T5, offline
+    python bench_replay.py --model google/flan-t5-base  # a real model from the hub cache
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from harness import add_baseline_args, report, summarize_latencies
+from synthetic_patients import generate_patients
+
+from bench_repetition_guard import BenchConnector, random_model
+from generation_backends import RecordingModelConnector, ReplayModelConnector
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "replay"
+
+
+def run(connector, patients) -> dict:
+    pipeline = AutomatedWorkflowPipeline(model_connector=connector)
+    pipeline.router = None  # every patient goes through generation
+    latencies, fallbacks = [], 0
+    for patient in patients:
+        begin = time.perf_counter()
+        result = pipeline.process_patient(patient)
+        latencies.append((time.perf_counter() - begin) * 1000.0)
+        fallbacks += result['metadata']['note_source'] == 'template'
+        pipeline.results.clear()
+    summary = summarize_latencies(latencies)
+    summary['fallback_rate'] = round(fallbacks / len(patients), 4)
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="Hub model id already in the local cache (default: random T5)")
+    parser.add_argument("--patients", type=int, default=30)
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.model:
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        model, tokenizer = AutoModelForSeq2SeqLM.from_pretrained(args.model).eval(), AutoTokenizer.from_pretrained(args.model)
+    else:
+        model, tokenizer = random_model(4, 256)
+    patients = generate_patients(args.patients)
+    new_patients = generate_patients(args.patients, seed=1234)
+
+    fd, recording = tempfile.mkstemp(prefix="ehr_recording_", suffix=".jsonl")
+    os.close(fd)
+    try:
+        live = RecordingModelConnector(BenchConnector(model, tokenizer, args.model or "random-t5"), recording)
+        results = {'live (recording)': run(live, patients)}
+        replay = ReplayModelConnector(recording)
+        results['replay (recorded prompts)'] = run(replay, patients)
+        results['replay (recorded prompts)']['hit_rate'] = round(replay.hits / max(replay.hits + replay.misses, 1), 4)
+        replay = ReplayModelConnector(recording)
+        results['replay (new prompts)'] = run(replay, new_patients)
+        results['replay (new prompts)']['hit_rate'] = round(replay.hits / max(replay.hits + replay.misses, 1), 4)
+    finally:
+        os.remove(recording)
+
+    print(f"\n{'run':<28}{'p50 ms':>10}{'p95 ms':>10}{'fallback %':>12}{'hit %':>8}")
+    for name, r in results.items():
+        hit = f"{r['hit_rate'] * 100:.0f}" if 'hit_rate' in r else "-"
+        print(f"{name:<28}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['fallback_rate'] * 100:>12.1f}{hit:>8}")
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
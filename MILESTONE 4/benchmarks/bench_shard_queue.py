@@ -0,0 +1,126 @@
+"""
+Shard queue: batch throughput with several worker processes on one machine, including a worker that dies mid-shard.
+
+Publishes synthetic patients to a scratch shard queue, starts --workers local worker
+processes (each with its own pipeline and StubModelConnector), SIGKILLs one of them
+while it holds a lease (--kill), waits for the rest to finish (the killed worker's
+shard is reclaimed once its lease expires), merges, and checks that every patient
+appears exactly once in batch_results.json. A single-process process_batch over the
+same patients is the baseline.
+
+    python bench_shard_queue.py --patients 400 --workers 4 --stub-latency-ms 20
+    python bench_shard_queue.py --no-kill --shard-size 25
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from harness import add_baseline_args, report, summarize_latencies
+from synthetic_patients import generate_patients
+
+from shard_queue import ShardQueue, ShardWorker
+from stub_model_connector import StubModelConnector
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "shard_queue"
+
+
+def worker(queue_dir: str, lease_seconds: float, latency_ms: float) -> None:
+    logging.disable(logging.INFO)
+    pipeline = AutomatedWorkflowPipeline(model_connector=StubModelConnector(latency_ms=latency_ms))
+    ShardWorker(ShardQueue(queue_dir, lease_seconds=lease_seconds), pipeline, poll_interval=0.2).run()
+
+
+def run_sharded(patients, workdir: Path, args) -> dict:
+    queue_dir = workdir / "queue"
+    queue = ShardQueue(str(queue_dir), lease_seconds=args.lease)
+    queue.publish(patients, args.shard_size)
+
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    processes = [context.Process(target=worker, args=(str(queue_dir), args.lease, args.stub_latency_ms))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    killed = None
+    if args.kill:
+        # Wait until the first worker holds a lease, then kill it mid-shard
+        while killed is None and processes[0].is_alive():
+            if any(f"-{processes[0].pid}-" in owner for owner in queue.status()['workers']):
+                processes[0].kill()
+                killed = processes[0].pid
+            time.sleep(0.05)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    status = queue.status()
+    merge_start = time.perf_counter()
+    queue.merge(str(workdir / "merged"))
+    merge_s = time.perf_counter() - merge_start
+    with open(workdir / "merged" / "batch_results.json") as f:
+        names = Counter(result['patient_id'] for result in json.load(f))
+    return {
+        'elapsed_s': elapsed, 'merge_s': merge_s, 'killed_pid': killed, 'status': status,
+        'missing': sum(1 for p in patients if p['name'] not in names),
+        'duplicates': sum(n - 1 for n in names.values() if n > 1)
+    }
+
+
+def run_single(patients, latency_ms: float) -> float:
+    pipeline = AutomatedWorkflowPipeline(model_connector=StubModelConnector(latency_ms=latency_ms))
+    start = time.perf_counter()
+    pipeline.process_batch(patients)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4, help="Local worker processes")
+    parser.add_argument("--shard-size", type=int, default=50)
+    parser.add_argument("--lease", type=float, default=3.0, help="Lease seconds (short, so the killed shard is reclaimed quickly)")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="Simulated model latency per generation")
+    parser.add_argument("--no-kill", dest="kill", action="store_false", help="Don't kill a worker")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    patients = generate_patients(args.patients)
+    workdir = Path(tempfile.mkdtemp(prefix="ehr_shards_"))
+    try:
+        single_s = run_single(patients, args.stub_latency_ms)
+        sharded = run_sharded(patients, workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    status = sharded['status']
+    print(f"\n{'mode':<22}{'seconds':>10}{'patients/s':>12}")
+    print(f"{'process_batch':<22}{single_s:>10.2f}{len(patients) / single_s:>12.1f}")
+    print(f"{f'{args.workers} shard workers':<22}{sharded['elapsed_s']:>10.2f}{len(patients) / sharded['elapsed_s']:>12.1f}")
+    print(f"\n🧩 {status['done']}/{status['shards']} shards done, {status['failed']} failed, "
+          f"{status['attempts']} attempts; merge {sharded['merge_s'] * 1000:.0f} ms")
+    print(f"💀 Killed worker pid {sharded['killed_pid']}; missing {sharded['missing']}, duplicates {sharded['duplicates']}")
+
+    results = {
+        'process_batch': summarize_latencies([single_s * 1000.0], items_per_call=len(patients)),
+        f'sharded[{args.workers} workers]': summarize_latencies([sharded['elapsed_s'] * 1000.0],
+                                                               items_per_call=len(patients)),
+    }
+    results[f'sharded[{args.workers} workers]'].update({
+        'reattempts': status['attempts'] - status['shards'], 'missing': sharded['missing'],
+        'duplicates': sharded['duplicates']
+    })
+    return report(SUITE, results, args) or int(bool(sharded['missing'] or sharded['duplicates']))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Shared text analysis: per-note time and allocations of the post-generation text work, before and after AnalyzedText.
+
+Every generated note goes through repetition cleanup, the repetition check and
+ICD-10 keyword coding. Before, each step lowercased and re-split the note on its
+own (the legacy copies below are the pre-AnalyzedText code; the coder is given a
+plain string); now the note is
+analyzed once and the steps share it. Both paths run over the same notes (stub
+model output, including degenerate ones, and the MILESTONE 3 reference notes),
+the outputs are checked to be identical, and the bench reports latency plus
+tracemalloc peak bytes and retained blocks per note.
+
+    python bench_text_analysis.py --notes 2000
+    python bench_text_analysis.py --notes-dir "../../MILESTONE 3/Data/EHR_Processed_Notes"
+"""
+import argparse
+import gc
+import logging
+import sys
+import tracemalloc
+from pathlib import Path
+
+from harness import SRC_DIR, add_baseline_args, measure, report
+from synthetic_patients import generate_patients
+
+from data_preparation import DataPreparationPipeline
+from icd10_code_assigner import ICD10CodeAssigner
+from stub_model_connector import StubModelConnector, StubTextGenerator
+from text_analysis import AnalyzedText
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "text_analysis"
+DEFAULT_NOTES_DIR = SRC_DIR.parent.parent / "MILESTONE 3" / "Data" / "EHR_Processed_Notes"
+
+
+# ---------------- legacy (one split per consumer) ----------------
+def legacy_similarity(sent1: str, sent2: str) -> float:
+    words1 = set(sent1.lower().split())
+    words2 = set(sent2.lower().split())
+    if not words1 or not words2:
+        return 0.0
+    intersection = len(words1 & words2)
+    union = len(words1 | words2)
+    return intersection / union if union > 0 else 0.0
+
+
+def legacy_remove_repetitions(text: str) -> str:
+    sentences = [s.strip() for s in text.split('.') if s.strip()]
+    if not sentences:
+        return text
+    seen = []
+    for sent in sentences:
+        if sent not in seen:
+            seen.append(sent)
+    filtered = [sentence for sentence in seen
+                if not any(sentence != other and sentence.lower() in other.lower() for other in seen)]
+    final_sentences = []
+    for sentence in filtered:
+        if not any(legacy_similarity(sentence, existing) > 0.75 for existing in final_sentences):
+            final_sentences.append(sentence)
+    return '. '.join(final_sentences) + '.' if final_sentences else text
+
+
+def legacy_is_too_repetitive(text: str, threshold: float = 0.25) -> bool:
+    if not text or len(text) < 20:
+        return True
+    sentences = [s.strip() for s in text.split('.') if s.strip()]
+    if len(sentences) < 2:
+        return False
+    repetition_ratio = 1 - (len(set(sentences)) / len(sentences))
+    words = text.lower().split()
+    if len(words) > 0:
+        return repetition_ratio > threshold or 1 - (len(set(words)) / len(words)) > 0.5
+    return repetition_ratio > threshold
+
+
+# ---------------- the two paths ----------------
+def before(assigner: ICD10CodeAssigner, generated: str, symptoms: str):
+    cleaned = legacy_remove_repetitions(generated)
+    repetitive = legacy_is_too_repetitive(cleaned)
+    return cleaned, repetitive, assigner.assign_codes_with_accuracy(cleaned, symptoms)
+
+
+def after(pipeline: AutomatedWorkflowPipeline, generated: str, symptoms: str):
+    cleaned = pipeline.hf_model._aggressive_remove_repetitions(generated)
+    analysis = AnalyzedText(cleaned)
+    repetitive = pipeline._is_too_repetitive(analysis)
+    return cleaned, repetitive, pipeline.icd_assigner.assign_codes_with_accuracy(analysis, symptoms)
+
+
+def allocations(fn, notes) -> dict:
+    """Per note: tracemalloc peak bytes while it runs and blocks still allocated afterwards
+    (CPython has no per-call allocation counter; retained blocks include newly interned tokens)"""
+    gc.collect()
+    tracemalloc.start()
+    peaks, retained = [], 0
+    for generated, symptoms in notes:
+        tracemalloc.reset_peak()
+        start_size, _ = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        fn(generated, symptoms)
+        peaks.append(tracemalloc.get_traced_memory()[1] - start_size)
+        retained += sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {'peak_bytes_per_note': round(sum(peaks) / len(peaks)),
+            'retained_blocks_per_note': round(retained / len(notes), 2)}
+
+
+def load_notes(count: int, notes_dir: Path):
+    """(generated text, symptoms) pairs: stub model output for synthetic patients plus reference notes"""
+    preparer = DataPreparationPipeline()
+    stub = StubTextGenerator(repetition_rate=0.2)
+    notes = []
+    for patient in generate_patients(count):
+        patient_json = preparer.prepare_patient_json(patient)
+        prompt = preparer.format_for_model(patient_json)
+        notes.append((stub(prompt)[0]['generated_text'], str(patient_json.get('Symptoms', ''))))
+    if notes_dir.is_dir():
+        notes.extend((path.read_text(encoding='utf-8', errors='ignore'), '') for path in sorted(notes_dir.glob('*.txt')))
+    return notes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=1000, help="Synthetic notes (stub model output)")
+    parser.add_argument("--notes-dir", default=str(DEFAULT_NOTES_DIR), help="Reference notes added to the set")
+    parser.add_argument("--alloc-notes", type=int, default=200, help="Notes traced with tracemalloc per path")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    pipeline = AutomatedWorkflowPipeline(model_connector=StubModelConnector())
+    notes = load_notes(args.notes, Path(args.notes_dir))
+    paths = {
+        'before': lambda generated, symptoms: before(pipeline.icd_assigner, generated, symptoms),
+        'after': lambda generated, symptoms: after(pipeline, generated, symptoms),
+    }
+
+    mismatches = 0
+    for generated, symptoms in notes:
+        mismatches += paths['before'](generated, symptoms) != paths['after'](generated, symptoms)
+    print(f"🔎 {len(notes)} notes, {mismatches} with differing cleanup / repetition / coding results")
+
+    results, traced = {}, notes[:args.alloc_notes]
+    for name, fn in paths.items():
+        results[f"post_generation[{name}]"] = measure(lambda i, fn=fn: fn(*notes[i % len(notes)]), len(notes))
+        results[f"post_generation[{name}]"].update(allocations(fn, traced))
+
+    print(f"\n{'path':<10}{'mean us/note':>14}{'peak B/note':>14}{'retained blocks':>17}")
+    for name in paths:
+        r = results[f"post_generation[{name}]"]
+        print(f"{name:<10}{r['mean_ms'] * 1000:>14.1f}{r['peak_bytes_per_note']:>14}{r['retained_blocks_per_note']:>17}")
+    return report(SUITE, results, args) or int(mismatches > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
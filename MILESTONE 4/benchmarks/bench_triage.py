@@ -0,0 +1,88 @@
+"""
+Triage router: throughput gained by skipping the model versus how often model notes are discarded.
+
+Runs the same synthetic patients through AutomatedWorkflowPipeline with the router
+off (every patient goes through generation) and on, using StubModelConnector with
+a simulated generation latency and repetition rate. For each mode it reports
+patients/s, the share of notes produced by the template, and the model fallback
+rate (model notes replaced by the template because they were too short or repetitive).
+
+    python bench_triage.py --patients 400 --stub-latency-ms 50
+    python bench_triage.py --repetition-rate 0.4      # a model that degenerates more often
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from harness import add_baseline_args, report, summarize_latencies
+from synthetic_patients import generate_patients
+
+from stub_model_connector import StubModelConnector
+from triage_router import TriageRouter
+from workflow_pipeline import AutomatedWorkflowPipeline
+
+SUITE = "triage"
+
+
+def run_mode(patients, router, latency_ms: float, repetition_rate: float) -> dict:
+    connector = StubModelConnector(latency_ms=latency_ms, repetition_rate=repetition_rate)
+    pipeline = AutomatedWorkflowPipeline(model_connector=connector, router=router)
+    pipeline.router = router  # the constructor treats None as "configure from EHR_TRIAGE"; force the mode under test
+
+    latencies, sources, model_runs, model_fallbacks = [], {}, 0, 0
+    start = time.perf_counter()
+    for patient in patients:
+        begin = time.perf_counter()
+        result = pipeline.process_patient(patient)
+        latencies.append((time.perf_counter() - begin) * 1000.0)
+        metadata = result['metadata']
+        routed = metadata.get('route', {}).get('path') == 'template'
+        sources[metadata['note_source']] = sources.get(metadata['note_source'], 0) + 1
+        if not routed:
+            model_runs += 1
+            model_fallbacks += metadata['note_source'] == 'template'
+        pipeline.results.clear()
+    elapsed = time.perf_counter() - start
+
+    summary = summarize_latencies(latencies)
+    summary.update({
+        'patients_per_s': round(len(patients) / elapsed, 2),
+        'template_share': round(sources.get('template', 0) / len(patients), 4),
+        'model_runs': model_runs,
+        'model_fallback_rate': round(model_fallbacks / model_runs, 4) if model_runs else None
+    })
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=400, help="Synthetic patients per mode")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="Simulated model latency per generation")
+    parser.add_argument("--repetition-rate", type=float, default=0.1,
+                        help="Share of stub generations that are degenerate (and fall back)")
+    add_baseline_args(parser, SUITE)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    patients = generate_patients(args.patients)
+    router = TriageRouter(min_samples=10)
+    results = {
+        'triage=off': run_mode(patients, None, args.stub_latency_ms, args.repetition_rate),
+        'triage=on': run_mode(patients, router, args.stub_latency_ms, args.repetition_rate),
+    }
+
+    off, on = results['triage=off'], results['triage=on']
+    print(f"\n{'mode':<12}{'patients/s':>12}{'template %':>12}{'model runs':>12}{'model fallback %':>18}")
+    for mode, r in results.items():
+        rate = f"{r['model_fallback_rate'] * 100:.1f}" if r['model_fallback_rate'] is not None else "-"
+        print(f"{mode:<12}{r['patients_per_s']:>12.1f}{r['template_share'] * 100:>12.1f}{r['model_runs']:>12}{rate:>18}")
+    print(f"\n🚀 Throughput x{on['patients_per_s'] / off['patients_per_s']:.2f} with triage; "
+          f"model runs {off['model_runs']} -> {on['model_runs']}")
+    print(json.dumps(router.report(), indent=2))
+    return report(SUITE, results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
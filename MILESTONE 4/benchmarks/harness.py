@@ -0,0 +1,159 @@
+import gc
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# ---------------- PATH SETUP ----------------
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "Src"
+BASELINE_DIR = BENCH_DIR / "baselines"
+
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+
+# ========================================
+# TIMING
+# ========================================
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize_latencies(latencies_ms: List[float], items_per_call: int = 1) -> Dict:
+    """Mean / percentile latency and throughput for a list of call durations"""
+    ordered = sorted(latencies_ms)
+    total_s = sum(ordered) / 1000.0
+    return {
+        'iterations': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50), 4),
+        'p95_ms': round(percentile(ordered, 95), 4),
+        'p99_ms': round(percentile(ordered, 99), 4),
+        'max_ms': round(ordered[-1], 4) if ordered else 0.0,
+        'ops_per_sec': round(len(ordered) * items_per_call / total_s, 2) if total_s else 0.0
+    }
+
+
+def measure(fn: Callable[[int], object], iterations: int, warmup: int = 10, items_per_call: int = 1) -> Dict:
+    """Time fn(i) for each iteration; GC is disabled inside the timed loop to reduce noise"""
+    for i in range(warmup):
+        fn(i)
+
+    latencies = []
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(iterations):
+            start = time.perf_counter()
+            fn(i)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return summarize_latencies(latencies, items_per_call)
+
+
+# ========================================
+# BASELINES
+# ========================================
+
+def environment_info() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def write_results(path: Path, suite: str, results: Dict[str, Dict]) -> Path:
+    """Write a suite run as JSON so it can be used as a baseline later"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        'suite': suite,
+        'created': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+
+def load_results(path: Path) -> Optional[Dict]:
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """Flag benchmarks whose p50 latency rose, or throughput fell, by more than threshold (fraction)"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if previous.get('p50_ms') and current['p50_ms'] > previous['p50_ms'] * (1 + threshold):
+            regressions.append({'benchmark': name, 'metric': 'p50_ms',
+                                'baseline': previous['p50_ms'], 'current': current['p50_ms']})
+        if previous.get('ops_per_sec') and current['ops_per_sec'] < previous['ops_per_sec'] * (1 - threshold):
+            regressions.append({'benchmark': name, 'metric': 'ops_per_sec',
+                                'baseline': previous['ops_per_sec'], 'current': current['ops_per_sec']})
+    return regressions
+
+
+def add_baseline_args(parser, suite: str) -> None:
+    """Common CLI flags for every benchmark script"""
+    parser.add_argument("--output", default=None,
+                        help=f"Where to write results (default: baselines/{suite}.latest.json)")
+    parser.add_argument("--baseline", default=str(BASELINE_DIR / f"{suite}.json"),
+                        help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Allowed relative slowdown before a regression is flagged (0.15 = 15%%)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this run as the new baseline")
+
+
+def report(suite: str, results: Dict[str, Dict], args) -> int:
+    """Print results, write them out and compare with the baseline; returns a process exit code"""
+    print(f"\n{'benchmark':<34}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'ops/s':>14}")
+    for name, r in results.items():
+        print(f"{name:<34}{r['p50_ms']:>12.4f}{r['p95_ms']:>12.4f}{r['p99_ms']:>12.4f}{r['ops_per_sec']:>14.2f}")
+
+    output = Path(args.output) if args.output else BASELINE_DIR / f"{suite}.latest.json"
+    write_results(output, suite, results)
+    print(f"\n💾 Results written to {output}")
+
+    if args.save_baseline:
+        write_results(Path(args.baseline), suite, results)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return 0
+
+    baseline = load_results(Path(args.baseline))
+    if baseline is None:
+        print(f"ℹ️  No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    if not regressions:
+        print(f"✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+        return 0
+
+    print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+    for r in regressions:
+        print(f"   {r['benchmark']}.{r['metric']}: {r['baseline']} -> {r['current']}")
+    return 1
@@ -0,0 +1,293 @@
+"""
+Load generator for the FastAPI service in cloud/app.py.
+
+Replays synthetic PatientInput payloads against /process_patient and
+/process_batch over a keep-alive async HTTP client, either closed-loop
+(--concurrency workers back to back) or open-loop (--rate arrivals/second,
+Poisson). Reports p50/p95/p99 latency, throughput, error rates and the X-Cache
+hit/miss counts. Every request carries a unique patient name, so the server's
+payload cache never answers it; --repeat-payloads cycles the same --patients
+payloads instead, to measure the cached path.
+
+    # start a local stub-backed server and drive it for 30 seconds
+    python load_test.py --spawn --concurrency 16 --duration 30
+
+    # same, replaying recorded FLAN-T5 outputs at their recorded latency
+    python load_test.py --spawn --recording generation_recording.jsonl --concurrency 16
+
+    # open-loop 50 req/s against an existing deployment, 20% batch calls
+    python load_test.py --url http://localhost:8000 --rate 50 --batch-ratio 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from harness import BENCH_DIR, environment_info, summarize_latencies
+from synthetic_patients import generate_patients
+
+CLOUD_DIR = BENCH_DIR.parent / "cloud"
+
+
+# ========================================
+# LOCAL SERVER
+# ========================================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_local_server(stub_latency_ms: float, workers: int = 1, recording: Optional[str] = None):
+    """Start cloud/app.py under uvicorn in a scratch directory, with the stub or (given a recording) the replay backend"""
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="ehr-load-")
+    env = dict(os.environ, EHR_MODEL_BACKEND="stub", EHR_STUB_LATENCY_MS=str(stub_latency_ms))
+    if recording:
+        env.update(EHR_MODEL_BACKEND="replay", EHR_RECORDING=str(Path(recording).resolve()))
+    log_file = open(Path(workdir) / "server.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", str(CLOUD_DIR),
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Local server exited during startup, see {log_file.name}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).json().get("status") == "healthy":
+                return process, url, log_file.name
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Local server did not become healthy within 60s")
+
+
+# ========================================
+# LOAD GENERATION
+# ========================================
+
+class LoadRecorder:
+    """Collects one sample per request"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.patients: Dict[str, int] = defaultdict(int)
+        self.cache: Dict[str, Counter] = defaultdict(Counter)  # X-Cache response header values
+
+    def record(self, endpoint: str, latency_ms: float, status: str, patients: int,
+               cache: Optional[str] = None) -> None:
+        self.latencies[endpoint].append(latency_ms)
+        self.statuses[endpoint][status] += 1
+        if cache:
+            self.cache[endpoint][cache] += 1
+        if status == "200":
+            self.patients[endpoint] += patients
+
+
+class LoadGenerator:
+    def __init__(self, url: str, payloads: List[Dict], batch_size: int, batch_ratio: float,
+                 timeout: float, seed: int, repeat_payloads: bool = False):
+        self.url = url.rstrip("/")
+        self.payloads = payloads
+        self.batch_size = batch_size
+        self.batch_ratio = batch_ratio
+        self.timeout = timeout
+        self.repeat_payloads = repeat_payloads
+        self.rng = random.Random(seed)
+        self.recorder = LoadRecorder()
+        self._cursor = 0
+        self._sent = 0
+
+    def _payload(self) -> Dict:
+        payload = self.payloads[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self.payloads)
+        if self.repeat_payloads:
+            return payload
+        # A name no earlier request used keeps the server's payload cache from answering
+        self._sent += 1
+        return dict(payload, name=f"{payload['name']} #{self._sent}")
+
+    def _next_request(self):
+        if self.rng.random() < self.batch_ratio:
+            batch = [self._payload() for _ in range(self.batch_size)]
+            return "/process_batch", batch, len(batch)
+        return "/process_patient", self._payload(), 1
+
+    async def _send(self, client: httpx.AsyncClient, started: Optional[float] = None) -> None:
+        endpoint, body, patients = self._next_request()
+        # Open-loop runs measure from the scheduled arrival time to avoid coordinated omission
+        start = started if started is not None else time.perf_counter()
+        cache = None
+        try:
+            response = await client.post(endpoint, json=body)
+            status = str(response.status_code)
+            cache = response.headers.get("X-Cache")
+        except httpx.TimeoutException:
+            status = "timeout"
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record(endpoint, (time.perf_counter() - start) * 1000.0, status, patients, cache)
+
+    def _client(self, connections: int) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        return httpx.AsyncClient(base_url=self.url, limits=limits, timeout=self.timeout)
+
+    async def run_closed_loop(self, concurrency: int, duration: float, max_requests: Optional[int]) -> float:
+        issued = 0
+        deadline = time.perf_counter() + duration
+
+        async def worker(client):
+            nonlocal issued
+            while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+                issued += 1
+                await self._send(client)
+
+        async with self._client(concurrency) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            return time.perf_counter() - start
+
+    async def run_open_loop(self, rate: float, duration: float, max_requests: Optional[int],
+                            max_inflight: int) -> float:
+        async with self._client(max_inflight) as client:
+            start = time.perf_counter()
+            next_arrival = start
+            tasks = set()
+            issued = 0
+            while next_arrival - start < duration and (max_requests is None or issued < max_requests):
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(tasks) < max_inflight:
+                    task = asyncio.create_task(self._send(client, started=next_arrival))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    self.recorder.record("/client_dropped", 0.0, "dropped", 0)
+                issued += 1
+                next_arrival += self.rng.expovariate(rate)
+            if tasks:
+                await asyncio.gather(*tasks)
+            return time.perf_counter() - start
+
+
+def build_report(recorder: LoadRecorder, elapsed: float, config: Dict) -> Dict:
+    endpoints = {}
+    total_requests = total_errors = 0
+    for endpoint, latencies in recorder.latencies.items():
+        statuses = recorder.statuses[endpoint]
+        count = sum(statuses.values())
+        errors = count - statuses.get("200", 0)
+        total_requests += count
+        total_errors += errors
+        summary = summarize_latencies(latencies)
+        summary.pop("ops_per_sec")
+        summary.update({
+            'requests': count,
+            'requests_per_sec': round(count / elapsed, 2) if elapsed else 0.0,
+            'patients_per_sec': round(recorder.patients[endpoint] / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(errors / count, 4) if count else 0.0,
+            'status_codes': dict(statuses),
+            'x_cache': dict(recorder.cache[endpoint])
+        })
+        endpoints[endpoint] = summary
+
+    return {
+        'config': config,
+        'environment': environment_info(),
+        'elapsed_seconds': round(elapsed, 3),
+        'total_requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 2) if elapsed else 0.0,
+        'error_rate': round(total_errors / total_requests, 4) if total_requests else 0.0,
+        'endpoints': endpoints
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n⏱  {report['total_requests']} requests in {report['elapsed_seconds']}s "
+          f"→ {report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}")
+    print(f"{'endpoint':<18}{'reqs':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'req/s':>10}{'pat/s':>10}{'errors':>9}")
+    for endpoint, r in report['endpoints'].items():
+        print(f"{endpoint:<18}{r['requests']:>8}{r['p50_ms']:>11.2f}{r['p95_ms']:>11.2f}{r['p99_ms']:>11.2f}"
+              f"{r['requests_per_sec']:>10.2f}{r['patients_per_sec']:>10.2f}{r['error_rate']:>9.2%}")
+    for endpoint, r in report['endpoints'].items():
+        if r['x_cache']:
+            print(f"X-Cache {endpoint}: " + ", ".join(f"{k} {v}" for k, v in sorted(r['x_cache'].items())))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running service")
+    target.add_argument("--spawn", action="store_true", help="Start a local stub-backed server for the run")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn workers for --spawn")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated generation time for --spawn")
+    parser.add_argument("--recording", default=None,
+                        help="--spawn with the replay backend: recorded model outputs and latencies instead of the stub")
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=8, help="Closed loop: concurrent virtual users")
+    mode.add_argument("--rate", type=float, default=None, help="Open loop: Poisson arrivals per second")
+    parser.add_argument("--max-inflight", type=int, default=512, help="Open loop: cap on outstanding requests")
+
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to generate load")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--batch-ratio", type=float, default=0.0, help="Share of requests sent to /process_batch")
+    parser.add_argument("--batch-size", type=int, default=10, help="Patients per /process_batch request")
+    parser.add_argument("--patients", type=int, default=500, help="Synthetic patients to cycle through")
+    parser.add_argument("--repeat-payloads", action="store_true",
+                        help="Resend the --patients payloads unchanged, so repeats hit the server's payload cache")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.spawn:
+        server, url, log_path = spawn_local_server(args.stub_latency_ms, args.server_workers, args.recording)
+        print(f"🚀 Local stub server at {url} (logs: {log_path})")
+
+    generator = LoadGenerator(url, generate_patients(args.patients, seed=args.seed), args.batch_size,
+                              args.batch_ratio, args.timeout, args.seed, args.repeat_payloads)
+    try:
+        if args.rate:
+            elapsed = asyncio.run(generator.run_open_loop(args.rate, args.duration, args.requests, args.max_inflight))
+        else:
+            elapsed = asyncio.run(generator.run_closed_loop(args.concurrency, args.duration, args.requests))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    config['url'] = url
+    report = build_report(generator.recorder, elapsed, config)
+    print_report(report)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Report written to {args.output}")
+    return 0 if report['error_rate'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
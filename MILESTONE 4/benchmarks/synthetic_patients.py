@@ -0,0 +1,55 @@
+import random
+from typing import Dict, Iterator, List
+
+# Value pools mirror the fields seen in MILESTONE 3/Outputs/batch_results.json
+SYMPTOMS = [
+    'cardiovascular symptoms', 'chest pain, shortness of breath', 'cough, fever', 'diabetes, fatigue',
+    'diabetes, hypertension', 'fever, cough, fatigue', 'fever, malaise', 'gastrointestinal symptoms',
+    'general checkup, routine exam', 'headache, fatigue, fever', 'headache, nausea, dizziness',
+    'hypertension, chest discomfort', 'musculoskeletal pain', 'nausea, abdominal discomfort',
+    'neurological symptoms', 'pain, swelling, inflammation', 'pain, weakness', 'preventive care',
+    'respiratory symptoms', 'shortness of breath, fatigue'
+]
+
+SCAN_RESULTS = [
+    'Brain imaging: normal', 'CT abdomen: inconclusive', 'CT chest with contrast: findings noted',
+    'CT scan shows mild pneumonia', 'Chest X-ray completed, awaiting interpretation',
+    'Chest X-ray: infiltrates present', 'Diagnostic imaging: no acute process',
+    'Imaging consistent with clinical presentation', 'Imaging shows mild abnormalities',
+    'Imaging studies completed and reviewed', 'MRI spine: degenerative changes',
+    'Radiographic findings documented', 'No imaging performed'
+]
+
+MEDICAL_HISTORY = ['None', 'Hypertension', 'Type 2 diabetes', 'Asthma', 'Hypertension, Diabetes',
+                   'Prior pneumonia', 'Hyperlipidemia']
+
+GENDERS = ['Female', 'Male', 'Other']
+
+
+def synthetic_patient(index: int, rng: random.Random) -> Dict:
+    """One PatientInput-shaped payload (the dict the API and process_patient accept)"""
+    return {
+        'name': f"Patient_{1000 + index}",
+        'age': rng.randint(22, 84),
+        'gender': rng.choice(GENDERS),
+        'symptoms': rng.choice(SYMPTOMS),
+        'scan_result': rng.choice(SCAN_RESULTS),
+        'medical_history': rng.choice(MEDICAL_HISTORY),
+        'vital_signs': {
+            'temperature_c': round(rng.uniform(36.1, 39.5), 1),
+            'heart_rate': rng.randint(55, 120),
+            'blood_pressure': f"{rng.randint(100, 170)}/{rng.randint(60, 100)}",
+            'spo2': rng.randint(88, 100)
+        }
+    }
+
+
+def iter_patients(count: int, seed: int = 42) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    for index in range(count):
+        yield synthetic_patient(index, rng)
+
+
+def generate_patients(count: int, seed: int = 42) -> List[Dict]:
+    """Deterministic list of synthetic patients for benchmarks and load tests"""
+    return list(iter_patients(count, seed))
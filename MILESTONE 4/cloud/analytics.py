@@ -0,0 +1,167 @@
+import json
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# ========================================
+# MATERIALIZED ANALYTICS AGGREGATES
+# ========================================
+
+# One row per (day, dimension, value). Updated in the record store's write
+# transaction, so queries cost O(days x distinct values) regardless of how many
+# records are stored.
+ANALYTICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics (
+    bucket          TEXT NOT NULL,
+    dimension       TEXT NOT NULL,
+    value           TEXT NOT NULL,
+    count           INTEGER NOT NULL,
+    confidence_sum  REAL NOT NULL,
+    confidence_n    INTEGER NOT NULL,
+    PRIMARY KEY (bucket, dimension, value)
+) WITHOUT ROWID;
+"""
+
+DIMENSIONS = ("total", "icd_code", "icd_chapter", "confidence", "age", "note_source")
+AGE_BUCKETS = ((18, "0-17"), (35, "18-34"), (50, "35-49"), (65, "50-64"), (80, "65-79"))
+CONFIDENCE_STEP = 5
+
+# How daily buckets are rolled up at query time
+GRANULARITIES = {
+    "day": "bucket",
+    "week": "strftime('%Y-W%W', bucket)",
+    "month": "substr(bucket, 1, 7)",
+    "total": "'all'"
+}
+
+_UPSERT = (
+    "INSERT INTO analytics (bucket, dimension, value, count, confidence_sum, confidence_n) "
+    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (bucket, dimension, value) DO UPDATE SET "
+    "count = count + excluded.count, confidence_sum = confidence_sum + excluded.confidence_sum, "
+    "confidence_n = confidence_n + excluded.confidence_n"
+)
+
+
+def age_bucket(age) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    for upper, label in AGE_BUCKETS:
+        if age < upper:
+            return label
+    return "80+"
+
+
+def confidence_bucket(confidence: Optional[float]) -> str:
+    if confidence is None:
+        return "unknown"
+    low = min(int(confidence // CONFIDENCE_STEP) * CONFIDENCE_STEP, 100 - CONFIDENCE_STEP)
+    return f"{low}-{low + CONFIDENCE_STEP}"
+
+
+def record_facts(record: Dict) -> tuple:
+    """(day bucket, confidence, [(dimension, value), ...]) for a compact record or a full result"""
+    documentation = record.get("clinical_documentation", {})
+    icd = record.get("icd", documentation.get("icd_coding")) or {}
+    patient = record.get("patient", record.get("patient_data")) or {}
+    code = icd.get("code") or "unknown"
+    confidence = icd.get("confidence")
+    confidence = float(confidence) if confidence is not None else None
+    timestamp = record.get("timestamp") or ""
+
+    return timestamp[:10] or "unknown", confidence, [
+        ("total", "all"),
+        ("icd_code", code),
+        ("icd_chapter", code[0].upper() if code != "unknown" else code),
+        ("confidence", confidence_bucket(confidence)),
+        ("age", age_bucket(patient.get("Age", patient.get("age")))),
+        ("note_source", (record.get("metadata") or {}).get("note_source", "unknown"))
+    ]
+
+
+def update_aggregates(conn: sqlite3.Connection, record: Dict) -> None:
+    """Fold one record into the aggregates (call inside the write transaction)"""
+    bucket, confidence, facts = record_facts(record)
+    has_confidence = confidence is not None
+    conn.executemany(_UPSERT, [
+        (bucket, dimension, value, 1, confidence or 0.0, int(has_confidence)) for dimension, value in facts
+    ])
+
+
+def rebuild_aggregates(conn: sqlite3.Connection, chunk_size: int = 5000) -> int:
+    """Recompute every aggregate from the stored records; returns the number of records read"""
+    totals = defaultdict(lambda: [0, 0.0, 0])
+    records = 0
+    cursor = conn.execute("SELECT data FROM records")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for (data,) in rows:
+            bucket, confidence, facts = record_facts(json.loads(data))
+            for dimension, value in facts:
+                entry = totals[(bucket, dimension, value)]
+                entry[0] += 1
+                if confidence is not None:
+                    entry[1] += confidence
+                    entry[2] += 1
+        records += len(rows)
+
+    conn.execute("DELETE FROM analytics")
+    conn.executemany(_UPSERT, [(*key, *values) for key, values in totals.items()])
+    return records
+
+
+def query_aggregates(conn: sqlite3.Connection, since: Optional[str] = None, until: Optional[str] = None,
+                     granularity: str = "day", dimensions: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Aggregates rolled up to the requested granularity, oldest bucket first.
+
+    Args:
+        since / until: ISO dates (or timestamps); until is exclusive
+        granularity: day, week, month or total
+        dimensions: subset of DIMENSIONS (default all)
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity} (expected one of {', '.join(GRANULARITIES)})")
+    dimensions = list(dimensions or DIMENSIONS)
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(sorted(unknown))}")
+    if "total" not in dimensions:
+        dimensions.append("total")
+
+    clauses = [f"dimension IN ({', '.join('?' * len(dimensions))})"]
+    params: list = list(dimensions)
+    if since:
+        clauses.append("bucket >= ?")
+        params.append(since[:10])
+    if until:
+        clauses.append("bucket < ?")
+        params.append(until[:10])
+
+    period = GRANULARITIES[granularity]
+    rows = conn.execute(
+        f"SELECT {period} AS period, dimension, value, SUM(count), SUM(confidence_sum), SUM(confidence_n) "
+        f"FROM analytics WHERE {' AND '.join(clauses)} GROUP BY period, dimension, value ORDER BY period",
+        params
+    ).fetchall()
+
+    buckets: Dict[str, Dict] = {}
+    for period, dimension, value, count, confidence_sum, confidence_n in rows:
+        bucket = buckets.setdefault(period, {"bucket": period})
+        if dimension == "total":
+            bucket["total"] = count
+            bucket["avg_confidence"] = round(confidence_sum / confidence_n, 2) if confidence_n else None
+            continue
+        bucket.setdefault(dimension, {})[value] = {
+            "count": count,
+            "avg_confidence": round(confidence_sum / confidence_n, 2) if confidence_n else None
+        }
+
+    for bucket in buckets.values():
+        if "note_source" in bucket:
+            template = bucket["note_source"].get("template", {}).get("count", 0)
+            bucket["fallback_rate"] = round(template / bucket["total"], 4) if bucket.get("total") else None
+    return list(buckets.values())
@@ -1,28 +1,41 @@
+import asyncio
+import os
 import sys
+import threading
+import time
 from pathlib import Path
 from typing import List, Dict, Optional, Any
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
-from tinydb import TinyDB, Query
 from datetime import datetime
 
 # ---------------- PATH SETUP ----------------
 current_file = Path(__file__).resolve()
 project_root = current_file.parent
 src_path = project_root / "Src"
+repo_src_path = project_root.parent / "Src"  # running from a checkout instead of the container
 
-for p in (project_root, src_path):
+for p in (project_root, src_path, repo_src_path):
     if str(p) not in sys.path:
         sys.path.append(str(p))
 
 # ---------------- PIPELINE IMPORT ----------------
 try:
     from workflow_pipeline import AutomatedWorkflowPipeline
+    from generation_backends import create_backend
 except ImportError as e:
     print(f"Error importing pipeline: {e}")
     AutomatedWorkflowPipeline = None
 
+from telemetry import ERRORS, REQUEST_DURATION, REQUESTS, process_memory, render_metrics, time_stage
+from record_store import open_store, to_record
+from records_api import router as records_router
+from inference_executor import ClientDisconnected, InferenceExecutor, ServerOverloaded
+from job_manager import JobManager
+from request_cache import IdempotencyConflict, RequestCache, payload_fingerprint
+
 
 # ---------------- FASTAPI APP ----------------
 app = FastAPI(
@@ -31,22 +44,124 @@ app = FastAPI(
     version="1.1.0"
 )
 
+# ---------------- REQUEST METRICS ----------------
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware) so disconnects still reach the endpoints"""
+
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by route template so path parameters don't explode cardinality
+            endpoint = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=status_code)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
 # ---------------- DATABASE (NEW) ----------------
-db = TinyDB("clinical_records.json")  # stores all generated notes
+# SQLite (WAL) store with a group-committing writer thread; opened at startup so
+# each worker process gets its own connections. Migrates clinical_records.json once.
+db = None
 
 
 # ---------------- PIPELINE INIT ----------------
 pipeline = None
+inference = None  # bounded executor keeping blocking generation off the event loop
+jobs = None  # background batch jobs persisted next to the records
+
+# Duplicate submissions (retries, double clicks) share one generation and one stored record
+request_cache = RequestCache(
+    ttl=float(os.environ.get("EHR_REQUEST_CACHE_TTL", "600")),
+    max_entries=int(os.environ.get("EHR_REQUEST_CACHE_SIZE", "1024")),
+    retry_on=(ClientDisconnected,)
+)
+
+# Generation backend by name (generation_backends.py): "hf" loads FLAN-T5; "stub" uses the
+# deterministic offline generator (load tests, CI); "template" writes every note from the
+# built-in template and never imports torch; "record" / "replay" capture and replay real outputs.
+# EHR_PROFILE=lite makes "template" the default, so the service starts in well under a second.
+PROFILE = os.environ.get("EHR_PROFILE", "full").lower()
+MODEL_BACKEND = os.environ.get("EHR_MODEL_BACKEND", "template" if PROFILE == "lite" else "hf").lower()
+
+
+def build_pipeline():
+    return AutomatedWorkflowPipeline(model_connector=create_backend(MODEL_BACKEND))
+
+
+def preload_pipeline():
+    """Build the pipeline before workers fork so they share it (see prefork_server.py)"""
+    global pipeline
+    print(f"Preloading AutomatedWorkflowPipeline (backend={MODEL_BACKEND})...")
+    pipeline = build_pipeline()
+    print("✅ Pipeline preloaded")
+
 
 @app.on_event("startup")
 async def startup_event():
-    global pipeline
-    try:
-        print("Initializing AutomatedWorkflowPipeline...")
-        pipeline = AutomatedWorkflowPipeline()
-        print("✅ Pipeline initialized")
-    except Exception as e:
-        print(f"❌ Pipeline failed: {e}")
+    global pipeline, db, inference, jobs
+    db = app.state.db = open_store()
+    inference = InferenceExecutor.from_env()
+    if pipeline is not None:
+        print("✅ Pipeline inherited from the prefork master")
+    else:
+        try:
+            print(f"Initializing AutomatedWorkflowPipeline (backend={MODEL_BACKEND})...")
+            pipeline = build_pipeline()
+            print("✅ Pipeline initialized")
+        except Exception as e:
+            print(f"❌ Pipeline failed: {e}")
+            return
+
+    jobs = JobManager.from_env(db, inference, pipeline.process_patient)
+    resumed = jobs.start()
+    if resumed:
+        print(f"🔁 Resumed {resumed} unfinished job items")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if jobs is not None:
+        await jobs.stop()
+    if inference is not None:
+        inference.shutdown()
+    if db is not None:
+        db.close()
+
+
+# ---------------- BACKPRESSURE ----------------
+@app.exception_handler(ServerOverloaded)
+async def overloaded_handler(request: Request, exc: ServerOverloaded):
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(IdempotencyConflict)
+async def idempotency_conflict_handler(request: Request, exc: IdempotencyConflict):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.exception_handler(ClientDisconnected)
+async def disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is listening; 499 only shows up in logs and metrics
+    return Response(status_code=499)
 
 
 # ---------------- Pydantic MODELS ----------------
@@ -58,6 +173,8 @@ class PatientInput(BaseModel):
     scan_result: Optional[str] = "No imaging performed"
     medical_history: Optional[str] = "None"
     vital_signs: Optional[Dict[str, Any]] = {}
+    # A full EHR note, summarized chunk by chunk (long_note_summarizer.py); the corpus notes are under 10 KB
+    note_text: Optional[str] = Field(None, max_length=100_000)
 
 
 class ICDInfo(BaseModel):
@@ -88,66 +205,134 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy" if pipeline else "pipeline_not_loaded"}
+    return {
+        "status": "healthy" if pipeline else "pipeline_not_loaded",
+        "inference": inference.stats() if inference else None,
+        "request_cache": request_cache.stats(),
+        "triage": pipeline.router.report() if pipeline and pipeline.router else None,
+        "process": {"pid": os.getpid(), **process_memory()}
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics (stage histograms, request/fallback/cache/error counters)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # ---------------- PROCESS ONE PATIENT ----------------
 @app.post("/process_patient", response_model=ProcessResponse)
-async def process_patient_endpoint(patient: PatientInput):
+async def process_patient_endpoint(patient: PatientInput, request: Request, response: Response,
+                                   idempotency_key: Optional[str] = Header(None)):
 
     if not pipeline:
         raise HTTPException(status_code=503, detail="Pipeline not initialized")
 
     patient_data = patient.dict()
+    fingerprint = payload_fingerprint(patient_data, pipeline.hf_model.model_type, app.version)
+    cache_key = f"key:{idempotency_key}" if idempotency_key else f"payload:{fingerprint}"
 
-    try:
-        result = pipeline.process_patient(patient_data)
+    async def generate_and_save():
+        result = await inference.run(pipeline.process_patient, patient_data, request=request)
 
         if not result:
             raise HTTPException(status_code=500, detail="Pipeline returned no data")
 
         # ---------------- SAVE TO DATABASE (NEW) ----------------
-        db.insert({
-            "id": result["patient_id"],
-            "timestamp": result["timestamp"],
-            "patient": result["patient_data"],
-            "note": result["clinical_documentation"]["generated_note"],
-            "icd": result["clinical_documentation"]["icd_coding"]
-        })
+        with time_stage("persist", result["metadata"].setdefault("stage_timings_ms", {})):
+            await db.insert_async(to_record(result))
 
         return result
 
+    try:
+        result, source = await request_cache.get_or_compute(cache_key, fingerprint, generate_and_save)
+        response.headers["X-Cache"] = source
+        return result
+
+    except (HTTPException, ServerOverloaded, ClientDisconnected, IdempotencyConflict):
+        raise
     except Exception as e:
+        ERRORS.inc(component="process_patient")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
 # ---------------- PROCESS MULTIPLE PATIENTS ----------------
 @app.post("/process_batch")
-async def process_batch_endpoint(patients: List[PatientInput]):
+async def process_batch_endpoint(patients: List[PatientInput], request: Request):
     if not pipeline:
         raise HTTPException(status_code=503, detail="Pipeline not initialized")
 
-    results = []
-    for patient in patients:
-        try:
-            res = pipeline.process_patient(patient.dict())
-            if res:
-                db.insert(res)  # optional: save batch results too
-                results.append(res)
-        except Exception as e:
-            print(f"Error processing {patient.name}: {e}")
+    disconnected = threading.Event()  # set by the executor's disconnect watcher
+
+    def process_all(batch: List[Dict]) -> List[Dict]:
+        processed = []
+        for patient_data in batch:
+            if disconnected.is_set():
+                print(f"Client disconnected; stopping batch after {len(processed)} of {len(batch)} patients")
+                break
+            try:
+                res = pipeline.process_patient(patient_data)
+                if res:
+                    processed.append(res)
+            except Exception as e:
+                ERRORS.inc(component="process_batch")
+                print(f"Error processing {patient_data.get('name')}: {e}")
+        return processed
+
+    # The whole batch holds one inference slot; a disconnect stops it at the next patient
+    # and the notes already generated are still saved
+    results = await inference.run(process_all, [p.dict() for p in patients], request=request,
+                                  cancel_event=disconnected)
+
+    if results:
+        timings = {}
+        with time_stage("persist", timings):
+            await asyncio.wrap_future(db.insert_many([to_record(res) for res in results]))  # optional: save batch results too
+        for res in results:
+            res["metadata"].setdefault("stage_timings_ms", {})["persist"] = timings["persist"]
 
     return {"processed_count": len(results), "results": results}
 
 
 
-# ---------------- VIEW ALL RECORDS (NEW) ----------------
-@app.get("/records")
-async def get_records():
-    """Returns ALL saved clinical notes."""
-    records = db.all()
-    return {"count": len(records), "records": records}
+# ---------------- BATCH JOBS (ASYNC) ----------------
+def get_jobs() -> JobManager:
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    return jobs
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(patients: List[PatientInput]):
+    """Queue a batch in the background and return its job id right away."""
+    manager = get_jobs()
+    try:
+        return await manager.submit([p.dict() for p in patients])
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    status = get_jobs().status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, after: int = 0, follow: bool = True):
+    """Finished items as NDJSON; with follow the stream stays open until the job completes."""
+    manager = get_jobs()
+    if manager.status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(manager.stream_results(job_id, after=after, follow=follow),
+                             media_type="application/x-ndjson")
+
+
+# ---------------- VIEW RECORDS (paginated, filterable) ----------------
+app.include_router(records_router)
 
 
 # ---------------- RUN LOCALLY ----------------
@@ -1,49 +1,31 @@
-
-from fastapi import FastAPI
+import os
+import sys
+from pathlib import Path
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from datetime import datetime
-from tinydb import TinyDB
-
-app = FastAPI(title="Cloud Clinical Note API", version="1.1-lite")
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from record_store import open_store, to_record
+from records_api import router as records_router
 
-# -------- Database (NEW) --------
-db = TinyDB("clinical_records.json")   # simple JSON DB on disk
+# Src/ sits next to this file in the container and one level up in a checkout
+for p in (Path(__file__).resolve().parent / "Src", Path(__file__).resolve().parent.parent / "Src"):
+    if str(p) not in sys.path:
+        sys.path.append(str(p))
 
-# -------- Dummy Pipeline --------
-class DummyPipeline:
-    def process_patient(self, data):
-        name = data["name"]
-        age = data["age"]
-        gender = data["gender"]
-        symptoms = data["symptoms"]
-        scan = data.get("scan_result", "No imaging performed")
+from generation_backends import create_backend
+from workflow_pipeline import AutomatedWorkflowPipeline
 
-        note = (
-            f"{name}, a {age}-year-old {gender.lower()} patient, presents with {symptoms}. "
-            f"Imaging findings: {scan}. "
-            "This clinical note was generated using a lightweight demo pipeline "
-            "optimized for low-memory cloud deployment."
-        )
+app = FastAPI(title="Cloud Clinical Note API", version="1.1-lite")
 
-        result = {
-            "patient_id": "DEMO-" + datetime.now().strftime("%Y%m%d%H%M%S"),
-            "timestamp": datetime.now().isoformat(),
-            "patient_data": data,
-            "clinical_documentation": {
-                "generated_note": note,
-                "icd_coding": {
-                    "code": "J18.9",
-                    "description": "Pneumonia, unspecified organism",
-                    "confidence": 0.80,
-                    "evidence": {"reason": "Symptoms suggest respiratory infection"},
-                },
-            },
-            "metadata": {"mode": "cloud-lite"},
-        }
-        return result
+# -------- Database (NEW) --------
+db = None   # SQLite record store, opened at startup (migrates clinical_records.json once)
 
-pipeline = DummyPipeline()
+# -------- Lite Pipeline --------
+# The real pipeline (data preparation, professional note template, ICD-10 assigner)
+# without a model: nothing imports torch/transformers, so it fits low-memory hosts.
+# EHR_MODEL_BACKEND=replay serves recorded model output instead (generation_backends.py)
+pipeline = AutomatedWorkflowPipeline(model_connector=create_backend(os.environ.get("EHR_MODEL_BACKEND", "template")))
 
 # -------- API Models --------
 class Patient(BaseModel):
@@ -54,6 +36,17 @@ class Patient(BaseModel):
     scan_result: Optional[str] = "No imaging"
     medical_history: Optional[str] = "None"
 
+# -------- Lifecycle --------
+@app.on_event("startup")
+async def startup_event():
+    global db
+    db = app.state.db = open_store()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if db is not None:
+        db.close()
+
 # -------- Endpoints --------
 @app.get("/")
 async def root():
@@ -61,21 +54,16 @@ async def root():
 
 @app.post("/process_patient")
 async def process_patient(patient: Patient):
-    result = pipeline.process_patient(patient.dict())
+    # Off the event loop: the replay and hf backends block for the whole generation
+    result = await run_in_threadpool(pipeline.process_patient, patient.dict())
+    if not result:
+        raise HTTPException(status_code=500, detail="Pipeline returned no data")
+    result["metadata"]["mode"] = "cloud-lite"
 
     # 🔥 SAVE to DB
-    db.insert({
-        "id": result["patient_id"],
-        "timestamp": result["timestamp"],
-        "patient": result["patient_data"],
-        "note": result["clinical_documentation"]["generated_note"],
-        "icd": result["clinical_documentation"]["icd_coding"],
-    })
+    await db.insert_async(to_record(result))
 
     return result
 
-# NEW: list all saved records
-@app.get("/records")
-async def get_records():
-    records = db.all()
-    return {"count": len(records), "records": records}
+# NEW: list saved records (paginated, filterable)
+app.include_router(records_router)
@@ -0,0 +1,135 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# ========================================
+# BOUNDED INFERENCE EXECUTOR (OFF THE EVENT LOOP)
+# ========================================
+
+
+class ServerOverloaded(Exception):
+    """Raised when the admission queue is full; carries a Retry-After hint in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before its inference finished"""
+
+
+class InferenceExecutor:
+    """
+    Runs blocking pipeline calls on a dedicated thread pool.
+
+    At most max_concurrency calls run at once and at most max_queue more wait for
+    a worker; anything beyond that is rejected immediately with ServerOverloaded
+    so the service fails fast instead of piling up work it cannot finish.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue: int = 16, disconnect_poll: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.disconnect_poll = disconnect_poll
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._avg_service_time = 1.0  # seconds, exponentially weighted
+
+    @classmethod
+    def from_env(cls) -> 'InferenceExecutor':
+        return cls(
+            max_concurrency=int(os.environ.get("EHR_INFERENCE_CONCURRENCY", "1")),
+            max_queue=int(os.environ.get("EHR_INFERENCE_QUEUE", "16"))
+        )
+
+    # ---------------- ADMISSION ----------------
+    def _try_admit(self) -> bool:
+        with self._lock:
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                return False
+            self._admitted += 1
+            return True
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._admitted -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        with self._lock:
+            waves = self._admitted / max(self.max_concurrency, 1)
+        return max(1, math.ceil(waves * self._avg_service_time))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(self._admitted - self._running, 0),
+                "avg_service_seconds": round(self._avg_service_time, 3)
+            }
+
+    # ---------------- EXECUTION ----------------
+    def _timed(self, fn: Callable, args: tuple) -> Any:
+        with self._lock:
+            self._running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Admit and queue a call, or raise ServerOverloaded"""
+        if not self._try_admit():
+            raise ServerOverloaded(self.retry_after())
+        future = self._executor.submit(self._timed, fn, args)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args, request=None, cancel_event: Optional[threading.Event] = None) -> Any:
+        """
+        Run fn(*args) on the inference pool and await the result.
+
+        If request (a Starlette Request) is given, a client disconnect cancels the
+        call while it is still queued and raises ClientDisconnected. A call already
+        running cannot be interrupted: it completes and its result is returned as
+        usual. The disconnect also sets cancel_event, so a long call that checks it
+        between units of work (process_batch, between patients) can stop early.
+        """
+        future = self.submit(fn, *args)
+        watcher = (asyncio.create_task(self._watch_disconnect(request, future, cancel_event))
+                   if request is not None else None)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            if watcher is not None and watcher.done() and watcher.result():
+                raise ClientDisconnected()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    async def _watch_disconnect(self, request, future: Future, cancel_event: Optional[threading.Event]) -> bool:
+        while not future.done():
+            if await request.is_disconnected():
+                if cancel_event is not None:
+                    cancel_event.set()
+                return future.cancel()
+            await asyncio.sleep(self.disconnect_poll)
+        return False
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
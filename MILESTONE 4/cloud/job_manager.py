@@ -0,0 +1,342 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from inference_executor import InferenceExecutor, ServerOverloaded
+from record_store import RecordStore, to_record
+from telemetry import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# PERSISTENT BATCH JOBS (SQLITE + ASYNCIO WORKERS)
+# ========================================
+
+# Lives in the record store database so a job's item status and its saved
+# record are committed in the same transaction.
+JOB_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS jobs (
+        job_id      TEXT PRIMARY KEY,
+        status      TEXT NOT NULL,
+        total       INTEGER NOT NULL,
+        completed   INTEGER NOT NULL DEFAULT 0,
+        failed      INTEGER NOT NULL DEFAULT 0,
+        created_at  TEXT NOT NULL,
+        updated_at  TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS job_items (
+        job_id      TEXT NOT NULL,
+        item_index  INTEGER NOT NULL,
+        status      TEXT NOT NULL,
+        payload     TEXT NOT NULL,
+        result      TEXT,
+        error       TEXT,
+        record_id   INTEGER,
+        seq         INTEGER,
+        finished_at TEXT,
+        owner       TEXT,
+        PRIMARY KEY (job_id, item_index)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items(job_id, seq)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)",
+    """CREATE TABLE IF NOT EXISTS job_workers (
+        worker_id    TEXT PRIMARY KEY,
+        heartbeat_at REAL NOT NULL
+    )""",
+]
+# job_items.owner is the worker whose in-memory queue holds the item; job_workers holds each
+# worker's lease, and items of a worker whose lease expired are adopted by a live one
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS idx_job_items_owner ON job_items(owner, status)"
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class JobManager:
+    """
+    Accepts batches as jobs and processes their items in the background.
+
+    Items are persisted as 'pending' when the job is created and only marked
+    'done'/'failed' once processed, so anything interrupted by a restart is picked
+    up again by resume(). Each completed item gets a per-job sequence number that
+    clients use to stream results incrementally.
+
+    Each process works through the jobs submitted to it, and every item records
+    the worker that queued it. Workers hold a lease renewed every lease/3 seconds;
+    items whose owner's lease expired (or that predate ownership) are claimed by
+    exactly one live worker in a single transaction, so N processes never run the
+    same item. A worker id is stable only when EHR_WORKER_ID is set (prefork), and
+    then a respawned worker resumes its predecessor's items straight away.
+    """
+
+    def __init__(self, store: RecordStore, inference: InferenceExecutor, process_fn: Callable[[Dict], Optional[Dict]],
+                 workers: int = 1, max_items: int = 10000, poll_interval: float = 1.0, resume: bool = True,
+                 worker_id: Optional[str] = None, lease: float = 60.0):
+        self.store = store
+        self.inference = inference
+        self.process_fn = process_fn
+        self.workers = workers
+        self.max_items = max_items
+        self.poll_interval = poll_interval
+        self.resume_on_start = resume
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]  # unique per process unless given
+        self.lease = lease
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._progress = asyncio.Event()
+        store.submit_write(self._create_tables).result()
+
+    @classmethod
+    def from_env(cls, store: RecordStore, inference: InferenceExecutor, process_fn: Callable) -> 'JobManager':
+        return cls(
+            store, inference, process_fn,
+            workers=int(os.environ.get("EHR_JOB_WORKERS", "1")),
+            max_items=int(os.environ.get("EHR_JOB_MAX_ITEMS", "10000")),
+            resume=os.environ.get("EHR_JOB_RESUME", "1") != "0",
+            worker_id=os.environ.get("EHR_WORKER_ID"),
+            lease=float(os.environ.get("EHR_JOB_LEASE", "60"))
+        )
+
+    @staticmethod
+    def _create_tables(conn) -> None:
+        for statement in JOB_SCHEMA:
+            conn.execute(statement)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(job_items)")}
+        if "owner" not in columns:  # databases created before items had an owner
+            conn.execute("ALTER TABLE job_items ADD COLUMN owner TEXT")
+        conn.execute(OWNER_INDEX)
+
+    # ---------------- LIFECYCLE ----------------
+    def start(self) -> int:
+        """Start the background workers and requeue unfinished items; returns how many were resumed"""
+        if self.resume_on_start:
+            resumed = self.resume()
+        else:
+            resumed = 0
+            self.store.submit_write(self._claim(adopt=False)).result()  # hold the lease before accepting jobs
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        return resumed
+
+    def resume(self) -> int:
+        """Take the lease, adopt items of workers whose lease expired, and queue every pending item this worker owns"""
+        adopted = self.store.submit_write(self._claim(adopt=True)).result()
+        if adopted:
+            logger.info(f"🔁 Adopted {len(adopted)} pending job items from workers no longer running")
+        rows = self.store.read(
+            "SELECT i.job_id, i.item_index FROM job_items i JOIN jobs j ON j.job_id = i.job_id "
+            "WHERE j.status IN (?, ?) AND i.status = 'pending' AND i.owner = ? ORDER BY j.created_at, i.item_index",
+            (*ACTIVE_STATUSES, self.worker_id)
+        )
+        for job_id, index in rows:
+            self._queue.put_nowait((job_id, index))
+        return len(rows)
+
+    def _claim(self, adopt: bool) -> Callable:
+        """Writer operation: renew this worker's lease and (with adopt) take over items of expired leases"""
+        def claim(conn):
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO job_workers (worker_id, heartbeat_at) VALUES (?, ?)",
+                         (self.worker_id, now))
+            if not adopt:
+                return []
+            orphans = conn.execute(
+                "SELECT i.job_id, i.item_index FROM job_items i JOIN jobs j ON j.job_id = i.job_id "
+                "WHERE j.status IN (?, ?) AND i.status = 'pending' AND (i.owner IS NULL OR i.owner NOT IN "
+                "(SELECT worker_id FROM job_workers WHERE heartbeat_at > ?)) ORDER BY j.created_at, i.item_index",
+                (*ACTIVE_STATUSES, now - self.lease)
+            ).fetchall()
+            conn.executemany("UPDATE job_items SET owner = ? WHERE job_id = ? AND item_index = ?",
+                             ((self.worker_id, job_id, index) for job_id, index in orphans))
+            return orphans
+        return claim
+
+    async def _heartbeat(self) -> None:
+        """Renew the lease every lease/3 seconds and queue items adopted from workers that died meanwhile"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                adopted = await asyncio.wrap_future(self.store.submit_write(self._claim(adopt=self.resume_on_start)))
+            except Exception as e:
+                ERRORS.inc(component="jobs")
+                logger.error(f"Job lease renewal failed: {e}")
+                continue
+            for job_id, index in adopted:
+                self._queue.put_nowait((job_id, index))
+            if adopted:
+                logger.info(f"🔁 Adopted {len(adopted)} pending job items from workers no longer running")
+
+    async def stop(self) -> None:
+        """Cancel the workers and release the lease; items in flight stay 'pending' for the next owner"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.wrap_future(self.store.submit_write(
+            lambda conn: conn.execute("DELETE FROM job_workers WHERE worker_id = ?", (self.worker_id,))
+        ))
+
+    # ---------------- SUBMISSION ----------------
+    async def submit(self, payloads: List[Dict]) -> Dict:
+        """Persist a new job with one pending item per payload and queue it"""
+        if len(payloads) > self.max_items:
+            raise ValueError(f"Job has {len(payloads)} items, limit is {self.max_items}")
+
+        job_id = uuid.uuid4().hex
+        now = _now()
+
+        def create(conn):
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, "queued" if payloads else "completed", len(payloads), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, item_index, status, payload, owner) VALUES (?, ?, 'pending', ?, ?)",
+                ((job_id, index, json.dumps(payload, default=str), self.worker_id)
+                 for index, payload in enumerate(payloads))
+            )
+
+        await asyncio.wrap_future(self.store.submit_write(create, rows=len(payloads) or 1))
+        for index in range(len(payloads)):
+            self._queue.put_nowait((job_id, index))
+        return self.status(job_id)
+
+    # ---------------- PROCESSING ----------------
+    async def _worker(self) -> None:
+        while True:
+            job_id, index = await self._queue.get()
+            try:
+                await self._process_item(job_id, index)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ERRORS.inc(component="jobs")
+                logger.error(f"Job {job_id} item {index} could not be recorded: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process_item(self, job_id: str, index: int) -> None:
+        rows = self.store.read(
+            "SELECT payload FROM job_items WHERE job_id = ? AND item_index = ? AND status = 'pending'",
+            (job_id, index)
+        )
+        if not rows:
+            return  # finished by an earlier run
+        payload = json.loads(rows[0][0])
+
+        result, error = None, None
+        while True:
+            try:
+                result = await self.inference.run(self.process_fn, payload)
+                if not result:
+                    error = "Pipeline returned no data"
+                break
+            except ServerOverloaded as e:
+                # Interactive requests keep priority; wait for a slot instead of failing the item
+                await asyncio.sleep(e.retry_after)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ERRORS.inc(component="jobs")
+                error = str(e)
+                break
+
+        await asyncio.wrap_future(self.store.submit_write(self._finish_item(job_id, index, result, error)))
+        self._notify()
+
+    def _finish_item(self, job_id: str, index: int, result: Optional[Dict], error: Optional[str]) -> Callable:
+        """Writer operation: mark the item, save its record and update the job counters atomically"""
+        def finish(conn):
+            now = _now()
+            updated = conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, finished_at = ?, "
+                "seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_items WHERE job_id = ?) "
+                "WHERE job_id = ? AND item_index = ? AND status = 'pending'",
+                ("failed" if error else "done", None if error else json.dumps(result, default=str), error,
+                 now, job_id, job_id, index)
+            ).rowcount
+            if not updated:
+                return
+            if not error:
+                record_id = self.store.write_record(conn, to_record(result))
+                conn.execute("UPDATE job_items SET record_id = ? WHERE job_id = ? AND item_index = ?",
+                             (record_id, job_id, index))
+            done, failed = (0, 1) if error else (1, 0)
+            conn.execute(
+                "UPDATE jobs SET completed = completed + ?, failed = failed + ?, updated_at = ?, "
+                "status = CASE WHEN completed + failed + 1 >= total THEN 'completed' ELSE 'running' END "
+                "WHERE job_id = ?",
+                (done, failed, now, job_id)
+            )
+        return finish
+
+    def _notify(self) -> None:
+        """Wake every stream waiting for new results"""
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    # ---------------- STATUS & RESULTS ----------------
+    def status(self, job_id: str) -> Optional[Dict]:
+        rows = self.store.read(
+            "SELECT status, total, completed, failed, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        status, total, completed, failed, created_at, updated_at = rows[0]
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "pending": total - completed - failed,
+            "progress": round((completed + failed) / total, 4) if total else 1.0,
+            "created_at": created_at,
+            "updated_at": updated_at
+        }
+
+    def results_after(self, job_id: str, after: int = 0, limit: int = 500) -> List[tuple]:
+        """Finished items with a sequence number greater than after, in completion order"""
+        return self.store.read(
+            "SELECT seq, item_index, status, result, error FROM job_items "
+            "WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, limit)
+        )
+
+    async def stream_results(self, job_id: str, after: int = 0, follow: bool = True,
+                             chunk: int = 500) -> AsyncIterator[bytes]:
+        """
+        NDJSON lines for finished items, one per item, in completion order.
+
+        With follow=True the stream stays open until the job completes; a client
+        that reconnects passes the last seq it saw as after to continue.
+        """
+        while True:
+            # Check completion before reading so nothing committed in between is missed
+            finished = self.status(job_id)["status"] not in ACTIVE_STATUSES
+            wake = self._progress
+            rows = self.results_after(job_id, after, chunk)
+            for seq, index, status, result, error in rows:
+                after = seq
+                if status == "done":
+                    # The result is already serialized JSON; splice it in instead of re-encoding
+                    yield f'{{"seq":{seq},"index":{index},"status":"done","result":{result}}}\n'.encode()
+                else:
+                    yield (json.dumps({"seq": seq, "index": index, "status": status, "error": error}) + "\n").encode()
+
+            if len(rows) == chunk:
+                continue
+            if finished or not follow:
+                return
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass  # another process may have finished items; poll the table
@@ -0,0 +1,134 @@
+"""
+Prefork server for app.py: load the pipeline once, then fork uvicorn workers.
+
+`uvicorn --workers N` starts N fresh interpreters, and each one loads its own copy
+of the model in startup_event. Here the master imports the app, builds the
+pipeline (model weights, ICD code store), freezes the GC so the collector never
+writes to those objects, binds the listening socket and forks the workers. The
+workers inherit everything copy-on-write, so the weights are paid for once and
+each worker only adds its private request-handling memory.
+
+    EHR_MODEL_BACKEND=hf python prefork_server.py --workers 4 --port 8000
+
+Linux/macOS only (os.fork). Each worker prints its startup time and private
+memory; /health also reports them per worker.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(service, sock: socket.socket, worker_id: int, forked_at: float, args) -> None:
+    """Child process body: serve the already-loaded app on the shared socket, never return"""
+    import uvicorn
+    from telemetry import REGISTRY, process_memory
+
+    if "torch" in sys.modules:
+        # Intra-op threads are per process; don't let N workers each grab every core
+        sys.modules["torch"].set_num_threads(args.torch_threads)
+    # Job items are owned by worker id, so a respawned worker resumes what its predecessor
+    # left pending (job_manager.JobManager.resume); metrics are labelled with it too
+    os.environ["EHR_WORKER_ID"] = str(worker_id)
+    REGISTRY.reset(worker=str(worker_id))
+
+    def report_ready():
+        memory = process_memory()
+        print(f"👷 worker {worker_id} (pid {os.getpid()}) ready in {time.perf_counter() - forked_at:.2f}s, "
+              f"private {memory.get('private_mb', 0):.1f} MB, pss {memory.get('pss_mb', 0):.1f} MB", flush=True)
+
+    service.app.router.on_startup.append(report_ready)
+    config = uvicorn.Config(service.app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="Intra-op threads per worker (default: CPU count / workers)")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Keep-alive timeout in seconds")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    args.torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    logging.basicConfig(level=logging.INFO)
+
+    start = time.perf_counter()
+    import app as service
+    from record_store import migrate_legacy_store
+    migrate_legacy_store()  # once, here, rather than racing in every worker's startup
+    service.preload_pipeline()
+    # Move everything loaded so far out of the collector's reach: collections
+    # would otherwise touch every object header and un-share their pages
+    gc.collect()
+    gc.freeze()
+    from telemetry import process_memory
+    memory = process_memory()
+    print(f"🧠 master (pid {os.getpid()}) loaded the pipeline in {time.perf_counter() - start:.2f}s, "
+          f"rss {memory.get('rss_mb', 0):.1f} MB; forking {args.workers} workers", flush=True)
+
+    sock = bind_socket(args.host, args.port)
+    workers: Dict[int, int] = {}  # pid -> worker id
+    stopping = False
+
+    def spawn(worker_id: int) -> None:
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            run_worker(service, sock, worker_id, forked_at, args)
+        workers[pid] = worker_id
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker_id in range(args.workers):
+        spawn(worker_id)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = workers.pop(pid, None)
+        if worker_id is None or stopping:
+            continue
+        print(f"⚠️ worker {worker_id} (pid {pid}) exited with status {status}; restarting", flush=True)
+        spawn(worker_id)
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
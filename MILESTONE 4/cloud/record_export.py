@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterator, List, Optional
+
+# ========================================
+# STREAMING BULK EXPORT (NDJSON / CSV / PARQUET)
+# ========================================
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+COMPRESSIONS = {
+    "none": (None, ""),
+    "gzip": ("application/gzip", ".gz"),
+    "zstd": ("application/zstd", ".zst")
+}
+
+EXPORT_COLUMNS = ["record_id", "id", "timestamp", "icd_code", "confidence", "note", "patient", "icd", "metadata"]
+_ROW_COLUMNS = ("record_id", "id", "timestamp", "icd_code", "confidence")
+
+
+def _document_value(document: dict, field: str, nested_as_json: bool):
+    value = document.get(field)
+    if nested_as_json and isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _flat_rows(rows: List[tuple], columns: List[str], nested_as_json: bool = True) -> List[list]:
+    """Rows as lists of column values; for tabular formats nested document fields become JSON strings"""
+    needs_document = any(c not in _ROW_COLUMNS for c in columns)
+    flat = []
+    for row in rows:
+        values = dict(zip(_ROW_COLUMNS, row[:5]))
+        document = json.loads(row[5]) if needs_document else None
+        flat.append([values[c] if c in values else _document_value(document, c, nested_as_json) for c in columns])
+    return flat
+
+
+def ndjson_chunks(chunks: Iterator[List[tuple]], columns: Optional[List[str]]) -> Iterator[bytes]:
+    for rows in chunks:
+        if columns is None:
+            # Full records: splice record_id into the stored JSON instead of decoding and re-encoding it
+            yield "".join(f'{{"record_id":{row[0]},{row[5][1:]}\n' if row[5] != "{}" else
+                          f'{{"record_id":{row[0]}}}\n' for row in rows).encode("utf-8")
+        else:
+            yield "".join(json.dumps(dict(zip(columns, values)), default=str) + "\n"
+                          for values in _flat_rows(rows, columns, nested_as_json=False)).encode("utf-8")
+
+
+def csv_chunks(chunks: Iterator[List[tuple]], columns: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(_flat_rows(rows, columns))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose contents are handed out and discarded as the stream proceeds"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_chunks(chunks: Iterator[List[tuple]], columns: List[str], compression: str = "none") -> Iterator[bytes]:
+    """One row group per chunk; Parquet compresses its own pages, so compression picks the codec"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"record_id": pa.int64(), "confidence": pa.float64()}
+    schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+    sink = _DrainableSink()
+    codec = {"none": "snappy", "gzip": "gzip", "zstd": "zstd"}[compression]
+    writer = pq.ParquetWriter(sink, schema, compression=codec)
+    try:
+        for rows in chunks:
+            flat = _flat_rows(rows, columns)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array([row[i] for row in flat], type=schema.field(i).type) for i in range(len(columns))],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def compress_stream(chunks: Iterator[bytes], compression: str) -> Iterator[bytes]:
+    """Compress a byte stream on the fly with gzip (zlib, gzip framing) or zstd"""
+    if compression == "none":
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    else:
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def check_available(fmt: str, compression: str) -> None:
+    """Raise ValueError for unknown options and ImportError when an optional dependency is missing"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt} (expected one of {', '.join(FORMATS)})")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression} (expected one of {', '.join(COMPRESSIONS)})")
+    if fmt == "parquet":
+        import pyarrow.parquet  # noqa: F401
+    elif compression == "zstd":
+        import zstandard  # noqa: F401
+
+
+def export_stream(chunks: Iterator[List[tuple]], fmt: str, compression: str = "none",
+                  fields: Optional[List[str]] = None) -> tuple:
+    """
+    Encode record rows from RecordStore.iter_rows as a byte stream.
+
+    Returns:
+        (iterator of bytes, media type, file extension)
+    """
+    check_available(fmt, compression)
+    columns = fields or EXPORT_COLUMNS
+    unknown = set(columns) - set(EXPORT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    media_type, extension = FORMATS[fmt]
+    if fmt == "parquet":
+        return parquet_chunks(chunks, columns, compression), media_type, extension
+
+    stream = ndjson_chunks(chunks, fields) if fmt == "ndjson" else csv_chunks(chunks, columns)
+    compressed_type, suffix = COMPRESSIONS[compression]
+    return compress_stream(stream, compression), compressed_type or media_type, extension + suffix
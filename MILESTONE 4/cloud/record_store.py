@@ -0,0 +1,561 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from analytics import ANALYTICS_SCHEMA, query_aggregates, rebuild_aggregates, update_aggregates
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# CLINICAL RECORD STORE (SQLITE WAL + GROUP COMMIT)
+# ========================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id  TEXT,
+    timestamp   TEXT,
+    icd_code    TEXT,
+    confidence  REAL,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_patient_id ON records(patient_id);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records(timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_icd_code ON records(icd_code);
+CREATE INDEX IF NOT EXISTS idx_records_confidence ON records(confidence);
+CREATE TABLE IF NOT EXISTS migrations (
+    source_sha256  TEXT PRIMARY KEY,
+    source         TEXT,
+    records        INTEGER,
+    migrated_at    TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Full-text index over the searchable parts of each document. It is an external
+# content table: FTS5 keeps only the inverted index and reads snippet text back
+# through the view, so notes are not stored twice.
+FTS_SCHEMA = """
+CREATE VIEW IF NOT EXISTS records_text AS
+SELECT id,
+       COALESCE(json_extract(data, '$.note'),
+                json_extract(data, '$.clinical_documentation.generated_note')) AS note,
+       COALESCE(json_extract(data, '$.patient.Symptoms'),
+                json_extract(data, '$.patient_data.Symptoms')) AS symptoms,
+       COALESCE(json_extract(data, '$.icd.description'),
+                json_extract(data, '$.clinical_documentation.icd_coding.description')) AS icd_description
+FROM records;
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+    note, symptoms, icd_description,
+    content='records_text', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+# Fields served straight from indexed columns; anything else is read from the JSON document
+COLUMN_FIELDS = {"record_id": "id", "id": "patient_id", "timestamp": "timestamp",
+                 "icd_code": "icd_code", "confidence": "confidence"}
+DOCUMENT_FIELDS = {"patient", "note", "icd", "metadata"}
+
+# ORDER BY clauses for RecordStore.search
+SEARCH_ORDERS = {"relevance": "score DESC", "recent": "records_fts.rowid DESC"}
+
+_STOP = object()
+
+
+def to_record(result: Dict) -> Dict:
+    """Compact record stored for each pipeline result"""
+    documentation = result["clinical_documentation"]
+    return {
+        "id": result["patient_id"],
+        "timestamp": result["timestamp"],
+        "patient": result["patient_data"],
+        "note": documentation["generated_note"],
+        "icd": documentation["icd_coding"],
+        "metadata": result.get("metadata", {})
+    }
+
+
+def encode_cursor(record_id: int) -> str:
+    return base64.urlsafe_b64encode(f"r{record_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not raw.startswith("r") or not raw[1:].isdigit():
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(raw[1:])
+
+
+def build_filters(icd_code: Optional[str] = None, patient_id: Optional[str] = None,
+                  since: Optional[str] = None, until: Optional[str] = None,
+                  min_confidence: Optional[float] = None) -> tuple:
+    """WHERE clause (without the keyword) and parameters for the indexed record filters"""
+    clauses, params = [], []
+    if icd_code:
+        clauses.append("icd_code = ?")
+        params.append(icd_code)
+    if patient_id:
+        clauses.append("patient_id = ?")
+        params.append(patient_id)
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    if min_confidence is not None:
+        clauses.append("confidence >= ?")
+        params.append(min_confidence)
+    return " AND ".join(clauses), params
+
+
+def _search_text(record: Dict) -> tuple:
+    """(note, symptoms, icd_description) for the full-text index; mirrors the records_text view"""
+    documentation = record.get("clinical_documentation", {})
+    patient = record.get("patient", record.get("patient_data")) or {}
+    icd = record.get("icd", documentation.get("icd_coding")) or {}
+    return (
+        record.get("note", documentation.get("generated_note")),
+        patient.get("Symptoms"),
+        icd.get("description")
+    )
+
+
+def _index_columns(record: Dict) -> tuple:
+    """Values for the indexed columns, from either a compact record or a full pipeline result"""
+    icd = record.get("icd")
+    if icd is None:
+        icd = record.get("clinical_documentation", {}).get("icd_coding", {})
+    patient_id = record.get("id", record.get("patient_id"))
+    confidence = icd.get("confidence")
+    return (
+        str(patient_id) if patient_id is not None else None,
+        record.get("timestamp"),
+        icd.get("code"),
+        float(confidence) if confidence is not None else None
+    )
+
+
+class RecordStore:
+    """Clinical record store on SQLite in WAL mode with a single group-committing writer thread"""
+
+    def __init__(self, path: str = "clinical_records.db", max_batch: int = 512):
+        self.path = str(path)
+        self.max_batch = max_batch
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self.fts_enabled = self._create_fts(conn)
+        self._create_analytics(conn)
+        self._writer_conn = conn
+
+        self._writer = threading.Thread(target=self._writer_loop, name="record-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoint, no fsync per commit in WAL
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @staticmethod
+    def _create_fts(conn: sqlite3.Connection) -> bool:
+        """Create the search index if this SQLite build has FTS5; False disables search"""
+        existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'records_fts'").fetchone()
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ Full-text search disabled: {e}")
+            return False
+        if not existed and conn.execute("SELECT 1 FROM records LIMIT 1").fetchone():
+            logger.warning("⚠️ Search index created for an existing store; run `record_store.py rebuild-fts` "
+                           "to index the records saved before it")
+        return True
+
+    @staticmethod
+    def _create_analytics(conn: sqlite3.Connection) -> None:
+        existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'analytics'").fetchone()
+        conn.executescript(ANALYTICS_SCHEMA)
+        if not existed and conn.execute("SELECT 1 FROM records LIMIT 1").fetchone():
+            logger.warning("⚠️ Analytics created for an existing store; run `record_store.py rebuild-analytics` "
+                           "to include the records saved before it")
+
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread; WAL readers never block the writer"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ---------------- WRITES ----------------
+    def submit_write(self, operation: Callable[[sqlite3.Connection], Any], rows: int = 1) -> Future:
+        """
+        Run operation(conn) on the writer thread inside the next group-commit transaction.
+
+        The future resolves to the operation's return value once the transaction has
+        committed, or to its exception. An operation that raises is rolled back to its
+        own savepoint, so the other operations in the group still commit. Operations
+        must not commit or roll back themselves; rows only weighs the batch size.
+        """
+        future: Future = Future()
+        self._queue.put((operation, future, rows))
+        return future
+
+    def insert(self, record: Dict) -> Future:
+        """Queue one record; the future resolves to its row id once committed"""
+        return self.submit_write(lambda conn: self.write_record(conn, record))
+
+    def insert_many(self, records: Iterable[Dict]) -> Future:
+        """Queue several records in one transaction; the future resolves to their row ids"""
+        records = list(records)
+        return self.submit_write(lambda conn: [self.write_record(conn, r) for r in records], rows=len(records))
+
+    async def insert_async(self, record: Dict) -> int:
+        """Await the commit of one record without blocking the event loop"""
+        return await asyncio.wrap_future(self.insert(record))
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until everything queued so far is committed"""
+        self.insert_many([]).result(timeout)
+
+    def _writer_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            # Group commit: everything already waiting joins this transaction
+            batch = [item]
+            pending_rows = item[2]
+            stop = False
+            while pending_rows < self.max_batch:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is _STOP:
+                    stop = True
+                    break
+                batch.append(extra)
+                pending_rows += extra[2]
+
+            # Writes whose caller was cancelled before the commit are dropped
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+            if stop:
+                break
+        self._writer_conn.close()
+
+    def _commit_batch(self, batch: List[tuple]) -> None:
+        conn = self._writer_conn
+        outcomes = []  # (succeeded, return value or exception) per operation
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, _, _ in batch:
+                # Each operation gets a savepoint: one that raises is undone on its own and
+                # only its caller sees the error, the rest of the group still commits
+                conn.execute("SAVEPOINT operation")
+                try:
+                    outcomes.append((True, operation(conn)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO operation")
+                    outcomes.append((False, e))
+                conn.execute("RELEASE operation")
+            conn.execute("COMMIT")
+        except Exception as e:
+            # The transaction itself failed (BEGIN, COMMIT, a rollback SQLite forced): nothing committed
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Record store commit failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), (succeeded, outcome) in zip(batch, outcomes):
+            if succeeded:
+                future.set_result(outcome)
+            else:
+                logger.error(f"Record store write failed: {outcome}")
+                future.set_exception(outcome)
+
+    def write_record(self, conn: sqlite3.Connection, record: Dict) -> int:
+        """Insert one record on the writer connection (only call from a submit_write operation)"""
+        cursor = conn.execute(
+            "INSERT INTO records (patient_id, timestamp, icd_code, confidence, data) VALUES (?, ?, ?, ?, ?)",
+            (*_index_columns(record), json.dumps(record, default=str))
+        )
+        if self.fts_enabled:
+            conn.execute(
+                "INSERT INTO records_fts (rowid, note, symptoms, icd_description) VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, *_search_text(record))
+            )
+        update_aggregates(conn, record)
+        return cursor.lastrowid
+
+    def rebuild_fts(self) -> Future:
+        """Re-index every stored record (for stores created before the index existed)"""
+        if not self.fts_enabled:
+            raise RuntimeError("This SQLite build has no FTS5 support")
+        return self.submit_write(lambda conn: conn.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')"))
+
+    def rebuild_analytics(self) -> Future:
+        """Recompute the analytics aggregates from the stored records; resolves to the record count"""
+        return self.submit_write(rebuild_aggregates)
+
+    # ---------------- READS ----------------
+    def read(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        """Run a read-only query on this thread's reader connection"""
+        return self._reader().execute(sql, tuple(params)).fetchall()
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        row = self._reader().execute("SELECT id, data FROM records WHERE id = ?", (record_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def all(self) -> List[Dict]:
+        rows = self._reader().execute("SELECT id, data FROM records ORDER BY id").fetchall()
+        return [self._decode(row) for row in rows]
+
+    def query(self, filters: tuple = ("", []), cursor: Optional[int] = None, limit: int = 50,
+              fields: Optional[List[str]] = None) -> tuple:
+        """
+        One page of records, newest first, using keyset pagination on the row id.
+
+        Args:
+            filters: (clause, params) from build_filters
+            cursor: Row id of the last record on the previous page
+            limit: Page size
+            fields: Optional projection; column-only projections skip JSON decoding
+
+        Returns:
+            (records, next_cursor) where next_cursor is None on the last page
+        """
+        clause, params = filters
+        conditions = [clause] if clause else []
+        params = list(params)
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        unknown = set(fields or ()) - set(COLUMN_FIELDS) - DOCUMENT_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        needs_document = fields is None or bool(DOCUMENT_FIELDS & set(fields))
+        columns = "id, patient_id, timestamp, icd_code, confidence" + (", data" if needs_document else "")
+
+        rows = self._reader().execute(
+            f"SELECT {columns} FROM records {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        records = []
+        for row in rows:
+            if fields is None:
+                records.append(self._decode((row[0], row[5])))
+                continue
+            column_values = dict(zip(("record_id", "id", "timestamp", "icd_code", "confidence"), row[:5]))
+            document = json.loads(row[5]) if needs_document else {}
+            records.append({f: column_values[f] if f in COLUMN_FIELDS else document.get(f) for f in fields})
+
+        next_cursor = rows[-1][0] if has_more and rows else None
+        return records, next_cursor
+
+    def iter_rows(self, filters: tuple = ("", []), chunk_size: int = 1000) -> Iterable[List[tuple]]:
+        """
+        Every matching row, newest first, as lists of raw
+        (id, patient_id, timestamp, icd_code, confidence, data) tuples.
+
+        Each chunk is a separate keyset query, so memory stays bounded by
+        chunk_size and the writer is never blocked by a long-running read.
+        """
+        clause, params = filters
+        cursor = None
+        while True:
+            conditions = [clause] if clause else []
+            if cursor is not None:
+                conditions.append("id < ?")
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = self._reader().execute(
+                f"SELECT id, patient_id, timestamp, icd_code, confidence, data FROM records {where} "
+                f"ORDER BY id DESC LIMIT ?",
+                (*params, *([cursor] if cursor is not None else []), chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            cursor = rows[-1][0]
+
+    def search(self, match: str, filters: tuple = ("", []), limit: int = 20, offset: int = 0,
+               order: str = "relevance") -> List[Dict]:
+        """
+        Records matching an FTS5 query with a highlighted snippet each.
+
+        match supports FTS5 syntax: words (all must match), "exact phrases",
+        prefix* queries, OR / NOT and column filters such as symptoms:cough.
+        order="relevance" ranks by BM25 (note text weighted highest), which scores
+        every match; order="recent" walks the index newest first and stops after
+        limit rows, so it stays sub-millisecond for very common terms.
+        Raises ValueError for a malformed query or unknown order.
+        """
+        if not self.fts_enabled:
+            raise RuntimeError("This SQLite build has no FTS5 support")
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Unknown order: {order} (expected one of {', '.join(SEARCH_ORDERS)})")
+        clause, params = filters
+        where = f"AND {clause}" if clause else ""
+        try:
+            rows = self._reader().execute(
+                f"""SELECT r.id, r.patient_id, r.timestamp, r.icd_code, r.confidence,
+                           -bm25(records_fts, 2.0, 1.0, 1.0) AS score,
+                           snippet(records_fts, -1, '<mark>', '</mark>', '…', 12)
+                    FROM records_fts JOIN records r ON r.id = records_fts.rowid
+                    WHERE records_fts MATCH ? {where}
+                    ORDER BY {SEARCH_ORDERS[order]} LIMIT ? OFFSET ?""",
+                (match, *params, limit, offset)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query: {e}")
+
+        keys = ("record_id", "id", "timestamp", "icd_code", "confidence", "score", "snippet")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def analytics(self, since: Optional[str] = None, until: Optional[str] = None, granularity: str = "day",
+                  dimensions: Optional[List[str]] = None) -> List[Dict]:
+        """Materialized aggregates per time bucket (see analytics.query_aggregates)"""
+        return query_aggregates(self._reader(), since, until, granularity, dimensions)
+
+    @staticmethod
+    def _decode(row) -> Dict[str, Any]:
+        record = json.loads(row[1])
+        record["record_id"] = row[0]
+        return record
+
+    def close(self) -> None:
+        """Flush pending writes and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ========================================
+# ONE-SHOT MIGRATION FROM TINYDB
+# ========================================
+
+def migrate_tinydb(json_path: str, store: RecordStore) -> int:
+    """
+    Copy every document from a TinyDB JSON file into the store, then rename the file.
+
+    All inserts and a marker row (keyed by the file's SHA-256) commit in one
+    transaction, and the marker is checked inside it. Processes migrating the
+    same file at once, or a rerun after a crash before the rename, insert
+    nothing twice; a failed migration leaves no rows and keeps the file.
+
+    Returns:
+        Number of migrated records (0 if there was nothing to migrate, or it was already done)
+    """
+    source = Path(json_path)
+    try:
+        raw = source.read_bytes()
+    except FileNotFoundError:
+        return 0  # nothing to migrate, or another process already renamed it
+    digest = hashlib.sha256(raw).hexdigest()
+    content = raw.decode("utf-8").strip()
+    tables = json.loads(content) if content else {}
+    documents = [table[key] for table in tables.values() for key in sorted(table, key=int)]
+
+    def migrate(conn: sqlite3.Connection) -> int:
+        if conn.execute("SELECT 1 FROM migrations WHERE source_sha256 = ?", (digest,)).fetchone():
+            return 0
+        for document in documents:
+            store.write_record(conn, document)
+        conn.execute("INSERT INTO migrations (source_sha256, source, records) VALUES (?, ?, ?)",
+                     (digest, str(source.resolve()), len(documents)))
+        return len(documents)
+
+    migrated = store.submit_write(migrate, rows=len(documents) or 1).result()
+    try:
+        source.rename(source.with_name(source.name + ".migrated"))
+    except FileNotFoundError:
+        pass  # renamed by another process that migrated (or skipped) the same file
+    if migrated:
+        logger.info(f"✅ Migrated {migrated} TinyDB records from {source} into {store.path}")
+    return migrated
+
+
+def migrate_legacy_store(db_path: Optional[str] = None, legacy_json: str = "clinical_records.json") -> int:
+    """Run the TinyDB migration once in this process (the prefork master calls it before forking workers)"""
+    if not Path(legacy_json).exists():
+        return 0
+    store = RecordStore(db_path or os.environ.get("EHR_RECORD_DB", "clinical_records.db"))
+    try:
+        return migrate_tinydb(legacy_json, store)
+    finally:
+        store.close()
+
+
+def open_store(db_path: Optional[str] = None, legacy_json: str = "clinical_records.json") -> RecordStore:
+    """Open the store named by EHR_RECORD_DB, migrating a leftover TinyDB file on first start"""
+    store = RecordStore(db_path or os.environ.get("EHR_RECORD_DB", "clinical_records.db"))
+    migrate_tinydb(legacy_json, store)  # a no-op once the master (or another worker) has migrated
+    return store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Clinical record store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Import a TinyDB clinical_records.json file")
+    migrate.add_argument("json_path", help="TinyDB JSON file to import")
+    migrate.add_argument("--db", default="clinical_records.db", help="SQLite store to write into")
+    rebuild = subparsers.add_parser("rebuild-fts", help="Rebuild the full-text search index from stored records")
+    rebuild.add_argument("--db", default="clinical_records.db", help="SQLite store to re-index")
+    reaggregate = subparsers.add_parser("rebuild-analytics", help="Recompute analytics aggregates from stored records")
+    reaggregate.add_argument("--db", default="clinical_records.db", help="SQLite store to re-aggregate")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        record_store = RecordStore(args.db)
+        count = migrate_tinydb(args.json_path, record_store)
+        record_store.close()
+        print(f"Migrated {count} records into {args.db}")
+    elif args.command == "rebuild-fts":
+        record_store = RecordStore(args.db)
+        record_store.rebuild_fts().result()
+        indexed = record_store.count()
+        record_store.close()
+        print(f"Re-indexed {indexed} records in {args.db}")
+    elif args.command == "rebuild-analytics":
+        record_store = RecordStore(args.db)
+        aggregated = record_store.rebuild_analytics().result()
+        record_store.close()
+        print(f"Aggregated {aggregated} records in {args.db}")
@@ -0,0 +1,145 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from analytics import DIMENSIONS
+from record_export import export_stream
+from record_store import build_filters, decode_cursor, encode_cursor
+
+# ---------------- STORED RECORDS API ----------------
+# Shared by app.py and cloud_app.py; the store is read from app.state.db.
+router = APIRouter()
+
+MAX_PAGE_SIZE = 500
+MAX_SEARCH_RESULTS = 100
+EXPORT_CHUNK_SIZE = 1000
+
+
+def record_filters(icd_code: Optional[str] = None, patient_id: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   min_confidence: Optional[float] = None) -> tuple:
+    """Query-string filters shared by every records endpoint"""
+    return build_filters(icd_code, patient_id, since, until, min_confidence)
+
+
+def get_store(request: Request):
+    store = getattr(request.app.state, "db", None)
+    if store is None:
+        raise HTTPException(status_code=503, detail="Record store not initialized")
+    return store
+
+
+@router.get("/records")
+def get_records(
+    request: Request,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    icd_code: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    since: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    until: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    min_confidence: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated projection, e.g. id,timestamp,icd_code")
+):
+    """Saved clinical notes, newest first, one keyset-paginated page at a time."""
+    store = get_store(request)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        records, next_id = store.query(
+            record_filters(icd_code, patient_id, since, until, min_confidence),
+            cursor=after, limit=limit, fields=projection
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "count": len(records),
+        "records": records,
+        "next_cursor": encode_cursor(next_id) if next_id is not None else None
+    }
+
+
+@router.get("/records/export")
+def export_records(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson, csv or parquet"),
+    compression: str = Query("none", description="none, gzip or zstd (Parquet uses it as its page codec)"),
+    icd_code: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    since: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    until: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    min_confidence: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns; nested fields are exported as JSON")
+):
+    """Every matching record, newest first, streamed in chunks so memory stays flat for any export size."""
+    store = get_store(request)
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    chunks = store.iter_rows(record_filters(icd_code, patient_id, since, until, min_confidence), EXPORT_CHUNK_SIZE)
+    try:
+        stream, media_type, extension = export_stream(chunks, format, compression, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=f"{format}/{compression} export unavailable: {e}")
+
+    return StreamingResponse(stream, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="records.{extension}"'})
+
+
+@router.get("/records/search")
+def search_records(
+    request: Request,
+    q: str = Query(..., min_length=1, description='FTS5 query: words, "exact phrase", prefix*, OR/NOT'),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0),
+    order: str = Query("relevance", description="relevance (BM25) or recent (newest first, fastest)"),
+    icd_code: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    since: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    until: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    min_confidence: Optional[float] = None
+):
+    """Full-text search over notes, symptoms and ICD descriptions, best match first with highlighted snippets."""
+    store = get_store(request)
+    if not store.fts_enabled:
+        raise HTTPException(status_code=501, detail="Full-text search is not available on this server")
+    try:
+        results = store.search(q, record_filters(icd_code, patient_id, since, until, min_confidence),
+                               limit=limit, offset=offset, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "count": len(results),
+        "results": results,
+        "next_offset": offset + limit if len(results) == limit else None
+    }
+
+
+@router.get("/analytics")
+def get_analytics(
+    request: Request,
+    since: Optional[str] = Query(None, description="ISO date, inclusive"),
+    until: Optional[str] = Query(None, description="ISO date, exclusive"),
+    granularity: str = Query("day", description="day, week, month or total"),
+    dimensions: Optional[str] = Query(None, description=f"Comma-separated subset of {','.join(DIMENSIONS)}")
+):
+    """Counts and confidence by ICD code, chapter, confidence band, age band and note source per time bucket."""
+    store = get_store(request)
+    try:
+        selected = [d.strip() for d in dimensions.split(",") if d.strip()] if dimensions else None
+        buckets = store.analytics(since, until, granularity, selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"granularity": granularity, "buckets": buckets}
+
+
+@router.post("/analytics/rebuild")
+async def rebuild_analytics(request: Request):
+    """Recompute every aggregate from the raw records (after imports or manual edits)."""
+    store = get_store(request)
+    aggregated = await asyncio.wrap_future(store.rebuild_analytics())
+    return {"records_aggregated": aggregated}
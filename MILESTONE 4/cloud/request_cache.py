@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telemetry import CACHE_HITS
+
+# ========================================
+# IDEMPOTENT REQUEST CACHE (SINGLE-FLIGHT + TTL)
+# ========================================
+
+_RETRY = object()  # the leader gave up without a result; a waiting duplicate takes over
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key is reused with a different payload"""
+
+
+def payload_fingerprint(payload: Dict, model: str, version: str) -> str:
+    """SHA-256 of the canonical JSON (sorted keys, no whitespace) of payload, model and version"""
+    canonical = json.dumps({"payload": payload, "model": model, "version": version},
+                           sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class RequestCache:
+    """
+    Collapses identical requests onto one computation and replays completed responses.
+
+    While a computation for a key is running, duplicates await the same future
+    instead of starting their own. Completed values are kept for ttl seconds, up
+    to max_entries (least recently used evicted first). Failures are not cached.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 1024, retry_on: tuple = ()):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.retry_on = retry_on  # leader exceptions after which duplicates compute themselves
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fingerprint, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, value
+
+    def _store(self, key: str, fingerprint: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, fingerprint: str,
+                             compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Return (value, source) where source is "hit", "inflight" or "miss".
+
+        key identifies the request (Idempotency-Key or the fingerprint itself);
+        fingerprint identifies the payload, so reusing a key for a different
+        payload raises IdempotencyConflict.
+        """
+        while True:
+            cached = self._lookup(key)
+            if cached is not None:
+                self._check(fingerprint, cached[0])
+                CACHE_HITS.inc(cache="request", kind="hit")
+                return cached[1], "hit"
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._check(fingerprint, inflight[0])
+            value = await asyncio.shield(inflight[1])
+            if value is not _RETRY:
+                CACHE_HITS.inc(cache="request", kind="inflight")
+                return value, "inflight"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            value = await compute()
+        except (asyncio.CancelledError, *self.retry_on):
+            future.set_result(_RETRY)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved; nobody may be waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self._store(key, fingerprint, value)
+        future.set_result(value)
+        return value, "miss"
+
+    @staticmethod
+    def _check(fingerprint: str, expected: str) -> None:
+        if fingerprint != expected:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different payload")
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "inflight": len(self._inflight)}
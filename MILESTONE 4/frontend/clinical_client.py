@@ -0,0 +1,431 @@
+"""
+Python client for the Clinical Documentation API (cloud/app.py).
+
+    from clinical_client import ClinicalClient
+
+    with ClinicalClient("http://localhost:8000") as client:
+        result = client.process_patient({"name": "A", "age": 54, "gender": "Male", "symptoms": "cough, fever"})
+        for item in client.process_many(patients, concurrency=4):     # {"index", "status", "result" | "error"}
+            ...
+
+AsyncClinicalClient offers the same calls for asyncio code (requires httpx).
+Both keep one pooled keep-alive connection set and retry with jittered exponential
+backoff (honouring Retry-After). /process_patient and reads retry 429/502/503/504,
+timeouts and dropped connections: the server deduplicates identical patient payloads
+(or a caller's idempotency_key), so a retry never produces a second note or record.
+/process_batch and /jobs are not deduplicated, so they only retry what the server
+cannot have acted on: 429/503 admission rejections and connections that never opened.
+"""
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+RETRY_STATUSES = {429, 502, 503, 504}
+REJECTED_STATUSES = {429, 503}  # refused at admission, before any work; safe to resend any request
+DEFAULT_CHUNK_SIZE = 25
+JOB_THRESHOLD = 100  # process_many(mode="auto") submits a job above this many patients
+JOB_SIZE = 1000  # patients per submitted job (the server caps jobs at EHR_JOB_MAX_ITEMS)
+
+
+class APIError(Exception):
+    """Non-retryable error response (or retries exhausted)"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def retry_delay(attempt: int, retry_after: Optional[str], backoff: float, max_backoff: float) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after) + random.uniform(0, backoff))
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return delay
+
+
+def _never_sent(error: requests.RequestException) -> bool:
+    """True when the connection failed to open, so the server never saw the request"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _idempotency_headers(idempotency_key: Optional[str]) -> Dict[str, str]:
+    """
+    Idempotency-Key header only when the caller chose a key. Without one the server
+    deduplicates by payload fingerprint, which a fresh key per call would defeat.
+    """
+    return {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+
+
+def _error_detail(response) -> Any:
+    try:
+        return response.json().get("detail", response.text)
+    except ValueError:
+        return response.text
+
+
+def _present(params: Dict) -> Dict:
+    return {k: v for k, v in params.items() if v not in (None, "")}
+
+
+def _chunks(items: List, size: int) -> Iterator[tuple]:
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def _match_batch(start: int, chunk: List[Dict], results: List[Dict]) -> List[Dict]:
+    """Map /process_batch results (failures are omitted there) back to their input positions"""
+    positions: Dict[str, List[int]] = {}
+    for offset, patient in enumerate(chunk):
+        positions.setdefault(str(patient.get("name")), []).append(start + offset)
+    items = []
+    for result in results:
+        queue = positions.get(str(result.get("patient_id")))
+        if queue:
+            items.append({"index": queue.pop(0), "status": "done", "result": result})
+    for queue in positions.values():
+        items.extend({"index": index, "status": "failed", "error": "Not returned by /process_batch"}
+                     for index in queue)
+    return items
+
+
+# ========================================
+# SYNCHRONOUS CLIENT (requests)
+# ========================================
+
+class ClinicalClient:
+    """Pooled, retrying synchronous client"""
+
+    def __init__(self, base_url: str, timeout: float = 120.0, max_retries: int = 4, backoff: float = 0.5,
+                 max_backoff: float = 30.0, pool_size: int = 8, session: Optional[requests.Session] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self) -> 'ClinicalClient':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    # ---------------- TRANSPORT ----------------
+    def request(self, method: str, path: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying transient failures; raises APIError for any final non-2xx.
+
+        idempotent=False (calls the server does not deduplicate) retries only admission
+        rejections and connections that never opened, never a request the server may have run.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries or not (idempotent or _never_sent(e)):
+                    raise
+                time.sleep(retry_delay(attempt, None, self.backoff, self.max_backoff))
+                continue
+
+            if response.status_code in retry_statuses and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                time.sleep(retry_delay(attempt, retry_after, self.backoff, self.max_backoff))
+                continue
+            if response.status_code >= 400:
+                raise APIError(response.status_code, _error_detail(response))
+            return response
+        raise AssertionError("unreachable")
+
+    # ---------------- GENERATION ----------------
+    def process_patient(self, patient: Dict, idempotency_key: Optional[str] = None) -> Dict:
+        headers = _idempotency_headers(idempotency_key)  # reused as-is by every retry
+        return self.request("POST", "/process_patient", json=patient, headers=headers).json()
+
+    def process_batch(self, patients: List[Dict]) -> Dict:
+        return self.request("POST", "/process_batch", idempotent=False, json=patients).json()
+
+    def process_many(self, patients: Iterable[Dict], mode: str = "auto", concurrency: int = 4,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict]:
+        """
+        Process many patients, yielding {"index", "status", "result" | "error"} as each finishes.
+
+        mode "patient" sends one /process_patient call per patient, "batch" sends
+        chunks of chunk_size to /process_batch, "job" submits background jobs of
+        up to JOB_SIZE patients and streams their results; "auto" picks "job"
+        above JOB_THRESHOLD patients.
+        At most concurrency requests are in flight.
+        """
+        patients = list(patients)
+        if mode == "auto":
+            mode = "job" if len(patients) > JOB_THRESHOLD else "patient"
+        if mode == "job":
+            yield from self._process_as_job(patients)
+            return
+        if mode not in ("patient", "batch"):
+            raise ValueError(f"Unknown mode: {mode}")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if mode == "patient":
+                futures = {pool.submit(self.process_patient, p): i for i, p in enumerate(patients)}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        yield {"index": index, "status": "done", "result": future.result()}
+                    except Exception as e:
+                        yield {"index": index, "status": "failed", "error": str(e)}
+            else:
+                futures = {pool.submit(self.process_batch, chunk): (start, chunk)
+                           for start, chunk in _chunks(patients, chunk_size)}
+                for future in as_completed(futures):
+                    start, chunk = futures[future]
+                    try:
+                        yield from _match_batch(start, chunk, future.result()["results"])
+                    except Exception as e:
+                        yield from ({"index": start + i, "status": "failed", "error": str(e)}
+                                    for i in range(len(chunk)))
+
+    # ---------------- JOBS ----------------
+    def submit_job(self, patients: List[Dict]) -> Dict:
+        return self.request("POST", "/jobs", idempotent=False, json=patients).json()
+
+    def job_status(self, job_id: str) -> Dict:
+        return self.request("GET", f"/jobs/{job_id}").json()
+
+    def iter_job_results(self, job_id: str, after: int = 0) -> Iterator[Dict]:
+        """Stream a job's finished items until it completes, reconnecting from the last seq on drops"""
+        drops = 0
+        while True:
+            try:
+                response = self.request("GET", f"/jobs/{job_id}/results", params={"after": after},
+                                        stream=True, timeout=(self.timeout, None))
+                with response:
+                    for line in response.iter_lines():
+                        if line:
+                            item = json.loads(line)
+                            after = item["seq"]
+                            yield item
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                drops += 1
+                if drops > self.max_retries:
+                    raise
+                time.sleep(retry_delay(drops, None, self.backoff, self.max_backoff))
+                continue
+            if self.job_status(job_id)["status"] not in ("queued", "running"):
+                return
+
+    def _process_as_job(self, patients: List[Dict]) -> Iterator[Dict]:
+        # Submit every chunk up front so the server queues them all, then stream each in turn
+        jobs = [(start, self.submit_job(chunk)["job_id"]) for start, chunk in _chunks(patients, JOB_SIZE)]
+        for start, job_id in jobs:
+            for item in self.iter_job_results(job_id):
+                yield {**item, "index": start + item["index"], "job_id": job_id}
+
+    # ---------------- RECORDS ----------------
+    def get_records(self, limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None,
+                    **filters) -> Dict:
+        params = {"limit": limit, "cursor": cursor, "fields": fields, **filters}
+        return self.request("GET", "/records", params=_present(params)).json()
+
+    def iter_records(self, page_size: int = 500, fields: Optional[str] = None, **filters) -> Iterator[Dict]:
+        """Every matching record, newest first, following next_cursor"""
+        cursor = None
+        while True:
+            page = self.get_records(page_size, cursor, fields, **filters)
+            yield from page["records"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def search_records(self, q: str, limit: int = 20, **filters) -> Dict:
+        return self.request("GET", "/records/search", params=_present({"q": q, "limit": limit, **filters})).json()
+
+    def export_records(self, format: str = "ndjson", compression: str = "none", chunk_size: int = 65536,
+                       **filters) -> Iterator[bytes]:
+        """Raw bytes of /records/export, streamed"""
+        params = _present({"format": format, "compression": compression, **filters})
+        response = self.request("GET", "/records/export", params=params, stream=True, timeout=(self.timeout, None))
+        with response:
+            yield from response.iter_content(chunk_size)
+
+    def analytics(self, **params) -> Dict:
+        return self.request("GET", "/analytics", params=params).json()
+
+    def health(self) -> Dict:
+        return self.request("GET", "/health").json()
+
+
+# ========================================
+# ASYNCIO CLIENT (httpx)
+# ========================================
+
+class AsyncClinicalClient:
+    """Pooled, retrying asyncio client with the same calls as ClinicalClient"""
+
+    def __init__(self, base_url: str, timeout: float = 120.0, max_retries: int = 4, backoff: float = 0.5,
+                 max_backoff: float = 30.0, pool_size: int = 16):
+        import httpx
+
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"), timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def __aenter__(self) -> 'AsyncClinicalClient':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    # ---------------- TRANSPORT ----------------
+    async def request(self, method: str, path: str, idempotent: bool = True, **kwargs):
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except (self._httpx.ConnectError, self._httpx.TimeoutException, self._httpx.RemoteProtocolError) as e:
+                never_sent = isinstance(e, (self._httpx.ConnectError, self._httpx.ConnectTimeout))
+                if attempt == self.max_retries or not (idempotent or never_sent):
+                    raise
+                await asyncio.sleep(retry_delay(attempt, None, self.backoff, self.max_backoff))
+                continue
+
+            if response.status_code in retry_statuses and attempt < self.max_retries:
+                await asyncio.sleep(retry_delay(attempt, response.headers.get("Retry-After"),
+                                                self.backoff, self.max_backoff))
+                continue
+            if response.status_code >= 400:
+                raise APIError(response.status_code, _error_detail(response))
+            return response
+        raise AssertionError("unreachable")
+
+    # ---------------- GENERATION ----------------
+    async def process_patient(self, patient: Dict, idempotency_key: Optional[str] = None) -> Dict:
+        headers = _idempotency_headers(idempotency_key)  # reused as-is by every retry
+        return (await self.request("POST", "/process_patient", json=patient, headers=headers)).json()
+
+    async def process_batch(self, patients: List[Dict]) -> Dict:
+        return (await self.request("POST", "/process_batch", idempotent=False, json=patients)).json()
+
+    async def process_many(self, patients: Iterable[Dict], mode: str = "auto", concurrency: int = 8,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Dict]:
+        """Async counterpart of ClinicalClient.process_many"""
+        patients = list(patients)
+        if mode == "auto":
+            mode = "job" if len(patients) > JOB_THRESHOLD else "patient"
+        if mode == "job":
+            jobs = [(start, (await self.submit_job(chunk))["job_id"]) for start, chunk in _chunks(patients, JOB_SIZE)]
+            for start, job_id in jobs:
+                async for item in self.iter_job_results(job_id):
+                    yield {**item, "index": start + item["index"], "job_id": job_id}
+            return
+        if mode not in ("patient", "batch"):
+            raise ValueError(f"Unknown mode: {mode}")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int, patient: Dict) -> List[Dict]:
+            async with semaphore:
+                try:
+                    return [{"index": index, "status": "done", "result": await self.process_patient(patient)}]
+                except Exception as e:
+                    return [{"index": index, "status": "failed", "error": str(e)}]
+
+        async def batch(start: int, chunk: List[Dict]) -> List[Dict]:
+            async with semaphore:
+                try:
+                    return _match_batch(start, chunk, (await self.process_batch(chunk))["results"])
+                except Exception as e:
+                    return [{"index": start + i, "status": "failed", "error": str(e)} for i in range(len(chunk))]
+
+        if mode == "patient":
+            tasks = [asyncio.ensure_future(one(i, p)) for i, p in enumerate(patients)]
+        else:
+            tasks = [asyncio.ensure_future(batch(start, chunk)) for start, chunk in _chunks(patients, chunk_size)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for item in await finished:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    # ---------------- JOBS ----------------
+    async def submit_job(self, patients: List[Dict]) -> Dict:
+        return (await self.request("POST", "/jobs", idempotent=False, json=patients)).json()
+
+    async def job_status(self, job_id: str) -> Dict:
+        return (await self.request("GET", f"/jobs/{job_id}")).json()
+
+    async def iter_job_results(self, job_id: str, after: int = 0) -> AsyncIterator[Dict]:
+        drops = 0
+        while True:
+            try:
+                async with self.client.stream("GET", f"/jobs/{job_id}/results", params={"after": after},
+                                              timeout=self._httpx.Timeout(self.client.timeout.connect, read=None)) as r:
+                    if r.status_code >= 400:
+                        await r.aread()
+                        raise APIError(r.status_code, _error_detail(r))
+                    async for line in r.aiter_lines():
+                        if line:
+                            item = json.loads(line)
+                            after = item["seq"]
+                            yield item
+            except (self._httpx.ConnectError, self._httpx.RemoteProtocolError, self._httpx.ReadError):
+                drops += 1
+                if drops > self.max_retries:
+                    raise
+                await asyncio.sleep(retry_delay(drops, None, self.backoff, self.max_backoff))
+                continue
+            if (await self.job_status(job_id))["status"] not in ("queued", "running"):
+                return
+
+    # ---------------- RECORDS ----------------
+    async def get_records(self, limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None,
+                          **filters) -> Dict:
+        params = {"limit": limit, "cursor": cursor, "fields": fields, **filters}
+        return (await self.request("GET", "/records", params=_present(params))).json()
+
+    async def iter_records(self, page_size: int = 500, fields: Optional[str] = None,
+                           **filters) -> AsyncIterator[Dict]:
+        cursor = None
+        while True:
+            page = await self.get_records(page_size, cursor, fields, **filters)
+            for record in page["records"]:
+                yield record
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    async def health(self) -> Dict:
+        return (await self.request("GET", "/health")).json()
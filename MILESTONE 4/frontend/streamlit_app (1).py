@@ -2,9 +2,17 @@ import streamlit as st
 from datetime import datetime
 import requests
 
+from clinical_client import APIError, ClinicalClient
+
 # 🔗 Backend API URL (Render)
 BACKEND_URL = "https://backend-a1v7.onrender.com"  # change if your URL is different
 
+
+@st.cache_resource
+def get_client():
+    # One pooled client per server process: keeps connections warm and retries 429/5xx with backoff
+    return ClinicalClient(BACKEND_URL, timeout=80)
+
 # ---------- Page config ----------
 st.set_page_config(
     page_title="Clinical Note Generator",
@@ -76,13 +84,7 @@ def call_backend():
         "medical_history": medical_history if medical_history.strip() else "None"
     }
 
-    resp = requests.post(
-        f"{BACKEND_URL}/process_patient",
-        json=payload,
-        timeout=80
-    )
-    resp.raise_for_status()
-    return resp.json()
+    return get_client().process_patient(payload)
 
 # ---------- Button + validation + output ----------
 if st.button("Generate Clinical Note", type="primary", use_container_width=True):
@@ -134,24 +136,49 @@ if st.button("Generate Clinical Note", type="primary", use_container_width=True)
                 with st.expander("View raw backend response (JSON)"):
                     st.json(result)
 
-            except requests.exceptions.RequestException as e:
+            except (APIError, requests.exceptions.RequestException) as e:
                 st.error(f"Backend error: {e}")
 
 st.divider()
 st.caption("Backend: " + BACKEND_URL)
 
 # --- Sidebar: Saved Records ---
+RECORDS_PAGE_SIZE = 50
+RECORD_LIST_FIELDS = "record_id,id,timestamp,icd_code,confidence"
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_records_page(cursor=None, icd_code=""):
+    filters = {"icd_code": icd_code.strip()} if icd_code.strip() else {}
+    return get_client().get_records(RECORDS_PAGE_SIZE, cursor, RECORD_LIST_FIELDS, **filters)
+
+
 with st.sidebar:
     st.header("🔍 View Saved Records")
 
+    icd_filter = st.text_input("Filter by ICD-10 code (optional)", value="", placeholder="e.g., J18.9")
+
     if st.button("Load Saved records"):
         try:
-            resp = requests.get(f"{BACKEND_URL}/records", timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-
-            st.success(f"Loaded {data['count']} records.")
-            # show as table in sidebar (compact)
-            st.dataframe(data["records"])
+            data = fetch_records_page(icd_code=icd_filter)
+            st.session_state["records"] = data["records"]
+            st.session_state["records_cursor"] = data["next_cursor"]
+            st.session_state["records_filter"] = icd_filter
         except Exception as e:
             st.error(f"Error loading records: {e}")
+
+    if "records" in st.session_state:
+        if st.session_state.get("records_cursor") and st.button("Load more"):
+            try:
+                data = fetch_records_page(st.session_state["records_cursor"],
+                                          st.session_state.get("records_filter", ""))
+                st.session_state["records"].extend(data["records"])
+                st.session_state["records_cursor"] = data["next_cursor"]
+            except Exception as e:
+                st.error(f"Error loading records: {e}")
+
+        records = st.session_state["records"]
+        more = " (more available)" if st.session_state.get("records_cursor") else ""
+        st.success(f"Loaded {len(records)} records{more}.")
+        # show as table in sidebar (compact)
+        st.dataframe(records)